@@ -0,0 +1,98 @@
+"""
+CPU cost of turning one Gemini itinerary reply into an HTTP response body.
+
+    python -m benchmarks.itinerary_json [--days 7] [--runs 300]
+
+"before" is the old path: json.loads, deepcopy per caller, then FastAPI's
+response_model validation/serialization and JSONResponse. "after" is the
+current path: model_validate_json at parse time, an orjson copy per caller
+and ORJSONResponse without a second validation.
+"""
+import argparse
+import copy
+import json
+import time
+
+import orjson
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from schemas.models import ItineraryResponse
+
+
+def sample_reply(days: int) -> str:
+    return json.dumps({
+        "home_city": "Mumbai",
+        "destination_city": "Kyoto",
+        "num_days": days,
+        "days": [
+            {
+                "day": d + 1,
+                "summary": f"Day {d + 1}: temples, gardens and a long walk along the Kamo river. " * 3,
+                "route_info": "Start at Kyoto Station, take the Karasuma line north, then bus 205.",
+                "entities": [
+                    {
+                        "name": f"District {d}-{e}",
+                        "speciality": "Traditional wooden machiya houses and tea rooms. " * 2,
+                        "places_to_visit": [
+                            {"name": f"Place {d}-{e}-{p}", "description": "A quiet shrine with moss gardens. " * 4}
+                            for p in range(4)
+                        ],
+                        "photo_prompts": ["Golden hour over tiled roofs, soft mist, 35mm film look"] * 2,
+                    }
+                    for e in range(4)
+                ],
+            }
+            for d in range(days)
+        ],
+        "overall_tips": ["Buy an ICOCA card for buses and trains."] * 8,
+    }, ensure_ascii=False)
+
+
+async def _before(text: str, field) -> bytes:
+    data = json.loads(text)
+    data = copy.deepcopy(data)
+    content = await serialize_response(field=field, response_content=data)
+    return JSONResponse(content).body
+
+
+async def _after(text: str) -> bytes:
+    data = ItineraryResponse.model_validate_json(text).model_dump()
+    data = orjson.loads(orjson.dumps(data))
+    return ORJSONResponse(data).body
+
+
+def _time(fn, runs: int) -> float:
+    import asyncio
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(fn())  # warm up
+        start = time.process_time()
+        for _ in range(runs):
+            loop.run_until_complete(fn())
+        return (time.process_time() - start) / runs
+    finally:
+        loop.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--runs", type=int, default=300)
+    args = parser.parse_args()
+
+    text = sample_reply(args.days)
+    field = create_model_field(name="Response_itinerary", type_=ItineraryResponse, mode="serialization")
+
+    before = _time(lambda: _before(text, field), args.runs)
+    after = _time(lambda: _after(text), args.runs)
+    print(f"reply size: {len(text.encode('utf-8')) / 1024:.1f} KiB ({args.days} days)")
+    print(f"before: {before * 1000:.3f} ms CPU per itinerary")
+    print(f"after:  {after * 1000:.3f} ms CPU per itinerary")
+    print(f"saved:  {(before - after) * 1000:.3f} ms ({(1 - after / before) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
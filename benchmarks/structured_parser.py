@@ -0,0 +1,70 @@
+"""
+Parsing a long list reply: the removed regex scraper vs parse_structured.
+
+    python -m benchmarks.structured_parser [--items 400] [--runs 200]
+
+Besides timing, checks that items containing escaped quotes come back
+intact; the regex scraper split them (and stopped at the first "]" inside an
+item).
+"""
+import argparse
+import json
+import re
+import time
+
+from lib.structured_output import parse_structured
+from schemas.models import DestinationActivities
+
+
+def regex_scrape(response_text: str) -> list:
+    """The old endpoints/places.py parse_simple_response, for "activities"."""
+    array_match = re.search(r'"activities"\s*:\s*\[(.*?)\]', response_text.strip(), re.DOTALL)
+    if not array_match:
+        return []
+    return [m.group(1) for m in re.finditer(r'"(.*?)"', array_match.group(1))]
+
+
+def sample_items(count: int) -> list:
+    items = []
+    for i in range(count):
+        if i % 10 == 0:
+            items.append(f'See the "Golden Hour" light show at stage {i}, a local favourite')
+        else:
+            items.append(f"Visit landmark number {i} and explore its courtyards, markets and viewpoints")
+    return items
+
+
+def _time(fn, runs: int) -> float:
+    fn()
+    start = time.process_time()
+    for _ in range(runs):
+        fn()
+    return (time.process_time() - start) / runs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=400)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    items = sample_items(args.items)
+    clean = json.dumps({"activities": items}, ensure_ascii=False, indent=2)
+    messy = "Here you go:\n```json\n" + clean[:-2] + ",\n]}\n```"  # fences + trailing comma
+    truncated = clean[: int(len(clean) * 0.8)]
+
+    cases = [
+        ("regex scraper", lambda: regex_scrape(clean)),
+        ("parse_structured, well-formed", lambda: parse_structured(clean, DestinationActivities).value["activities"]),
+        ("parse_structured, fenced/trailing comma", lambda: parse_structured(messy, DestinationActivities, recover=True).value["activities"]),
+        ("parse_structured, truncated", lambda: parse_structured(truncated, DestinationActivities, recover=True, max_depth=2).value["activities"]),
+    ]
+    print(f"reply size: {len(clean.encode('utf-8')) / 1024:.1f} KiB ({args.items} items)")
+    for name, fn in cases:
+        result = fn()
+        intact = sum(1 for got, want in zip(result, items) if got == want)
+        print(f"{name:42s} {_time(fn, args.runs) * 1000:8.3f} ms   {len(result):4d} items, {intact} intact")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 """
 Simple and detailed prompts for travel planning AI generation using Google Gemini
+
+Replies are schema-enforced (schemas/gemini.py DESTINATION_LIST_SCHEMAS), so
+each prompt's RESPONSE FORMAT is guidance for content, not for parsing.
 """
 
 # Prompt for generating specific activities and places to visit
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from schemas.models import ImageJobStatus
+from engine.services.image_jobs import image_jobs
+from lib.sse import SSE_HEADERS, format_sse
+
+router = APIRouter(
+    prefix="",
+    tags=["images"],
+    responses={404: {"description": "Not found"}},
+)
+
+
+@router.get("/{job_id}", response_model=ImageJobStatus)
+async def get_image_job(job_id: str) -> ImageJobStatus:
+    """Get the status and filled image slots of a background image job"""
+    job = image_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Image job not found")
+    return ImageJobStatus(**job.to_dict())
+
+
+@router.get("/{job_id}/events")
+async def stream_image_job(job_id: str) -> StreamingResponse:
+    """Subscribe to an image job as Server-Sent Events: one "image" per slot, then "done" """
+    if image_jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Image job not found")
+
+    async def event_source():
+        async for event, data in image_jobs.subscribe(job_id):
+            yield format_sse(event, data)
+
+    return StreamingResponse(event_source(), media_type="text/event-stream", headers=SSE_HEADERS)
@@ -1,16 +1,20 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Query
+from fastapi.responses import Response, StreamingResponse
+from typing import List, Dict, Any, Optional, Tuple
 from pydantic import BaseModel
-from dotenv import load_dotenv
+from cachetools import LRUCache
 import asyncio
-import json
 import os
 import uuid
-import time
-import google.generativeai as genai
+from google.genai import types as genai_types
 from defs.prompts import ACTIVITIES_PROMPT, RESTAURANTS_PROMPT, ACCOMMODATION_PROMPT
-
-load_dotenv()
+from engine.ai_core import async_gemini_generate_content
+from engine.metrics import watch_executor
+from lib.file_ops import project_root
+from lib.sse import SSE_HEADERS, format_sse
+from lib.task_store import SQLiteTaskStore
+from schemas.gemini import DESTINATION_LIST_SCHEMAS
+from settings import MODELS, PLACES_BATCH, TASK_STORE
 
 router = APIRouter(
     prefix="",
@@ -36,161 +40,152 @@ class DestinationResponse(BaseModel):
     processing_status: str = "processing"
     error: Optional[str] = None
 
+class StreamedDestinationResponse(DestinationResponse):
+    index: int  # position in the request, since lines arrive in completion order
+
 class TaskResponse(BaseModel):
     task_id: str
     status: str
     message: str
     created_at: float
     destinations: List[DestinationResponse]
+    version: int = 0  # bumped on every change; pass back as ?since= to long-poll
 
 # Mock data for demonstration
 travel_plans = []
 
-# Google Gemini AI Configuration
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY","your-api-key-here")
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.5-pro')
+# Caps how many destinations are in flight across all batches
+_destination_slots = asyncio.Semaphore(PLACES_BATCH["max_concurrent_destinations"])
 
-# Task storage for background processing
-tasks_storage = {}
+# Task storage for background processing, shared across worker processes
+task_store = SQLiteTaskStore(
+    path=os.path.join(project_root(), TASK_STORE["path"]),
+    finished_ttl=TASK_STORE["finished_ttl_seconds"],
+    unfinished_ttl=TASK_STORE["unfinished_ttl_seconds"],
+    poll_interval=TASK_STORE["poll_interval_seconds"],
+)
+watch_executor("task_store", lambda: task_store.executor)
+
+# task_id -> (version, response, encoded body); rebuilt only when the version moves
+_status_cache: LRUCache = LRUCache(maxsize=256)
+
+# In {"<list>": [...]} replies an item is complete once closed at depth 2
+LIST_RECOVER_DEPTH = 2
+
+
+async def _generate_list(prompt: str, response_type: str) -> Optional[List[str]]:
+    """One legacy prompt -> its schema-enforced list, or None when the model gave no answer."""
+    print(f"DEBUG: Making AI call for {response_type}...")
+    schema = DESTINATION_LIST_SCHEMAS[response_type]
+    data = await async_gemini_generate_content(
+        model=MODELS["gemini"]["pro"],
+        contents=[
+            genai_types.Content(role="user", parts=[genai_types.Part.from_text(text=prompt)])
+        ],
+        response_schema=schema.schema,
+        response_model=schema.model,
+        recover_depth=LIST_RECOVER_DEPTH,
+        default_response=None,
+        endpoint="destinations",
+    )
+    if not data:
+        return None
+    items = data[response_type]
+    print(f"DEBUG: {response_type.capitalize()} parsed: {len(items)} items")
+    return items
+
+
+async def process_destination(destination_request: DestinationRequest) -> Dict[str, Any]:
+    """Run the activities, food and accommodation calls for one destination concurrently"""
+    place = destination_request.place
+    days = destination_request.days
+    budget = destination_request.budget
+    custom_ins = destination_request.custom_ins
+
+    result = {
+        "place": place,
+        "days": days,
+        "budget": budget,
+        "activities": [],
+        "food": [],
+        "accommodations": [],
+        "processing_status": "completed",
+    }
 
-def parse_simple_response(response_text: str, response_type: str) -> List[str]:
-    """Parse simple AI response to extract arrays"""
-    try:
-        # Clean the response text
-        cleaned_text = response_text.strip()
-
-        # Try to find JSON-like structure in the response
-        import re
-
-        # Look for the specific array based on response type
-        if response_type == "activities":
-            array_match = re.search(r'"activities"\s*:\s*\[(.*?)\]', cleaned_text, re.DOTALL)
-        elif response_type == "food":
-            array_match = re.search(r'"food"\s*:\s*\[(.*?)\]', cleaned_text, re.DOTALL)
-        elif response_type == "accommodations":
-            array_match = re.search(r'"accommodations"\s*:\s*\[(.*?)\]', cleaned_text, re.DOTALL)
-        else:
-            return []
-
-        if array_match:
-            array_content = array_match.group(1)
-            # Extract individual items from the array
-            items = []
-            for match in re.finditer(r'"(.*?)"', array_content):
-                items.append(match.group(1))
-            return items
-
-        # If no array found, try to split by lines
-        lines = [line.strip().strip('"').strip("'") for line in cleaned_text.split('\n') if line.strip()]
-        return [line for line in lines if len(line) > 10]  # Filter out very short lines
+    async with _destination_slots:
+        print(f"DEBUG: Starting AI calls for {place} with custom preferences: {custom_ins}")
+        try:
+            activities_list, food_list, accommodation_list = await asyncio.gather(
+                _generate_list(
+                    ACTIVITIES_PROMPT.format(destination=place, days=days, budget=budget, custom_ins=custom_ins),
+                    "activities",
+                ),
+                _generate_list(
+                    RESTAURANTS_PROMPT.format(destination=place, budget=budget, custom_ins=custom_ins),
+                    "food",
+                ),
+                _generate_list(
+                    ACCOMMODATION_PROMPT.format(destination=place, days=days, budget=budget, custom_ins=custom_ins),
+                    "accommodations",
+                ),
+            )
+        except Exception as e:
+            print(f"DEBUG: Exception occurred: {str(e)}")
+            result.update(processing_status="error", error=str(e))
+            return result
+
+    print(f"DEBUG: All AI calls completed for {place}")
+    failed = [
+        name
+        for name, items in (("activities", activities_list), ("food", food_list), ("accommodations", accommodation_list))
+        if items is None
+    ]
+    result.update(
+        activities=activities_list or [],
+        food=food_list or [],
+        accommodations=accommodation_list or [],
+    )
+    if len(failed) == 3:
+        result.update(processing_status="error", error="No response from the model")
+    elif failed:
+        result["error"] = f"No response for {', '.join(failed)}"
+    return result
 
-    except Exception as e:
-        return [f"Error parsing {response_type}: {str(e)}"]
 
-def process_destination_background(task_id: str, destination_request: DestinationRequest):
-    """Background task to process a single destination"""
+async def _process_destination_safely(destination_request: DestinationRequest) -> Dict[str, Any]:
+    """process_destination, with unexpected failures reported as an error result"""
     try:
-        place = destination_request.place
-        days = destination_request.days
-        budget = destination_request.budget
-        custom_ins = destination_request.custom_ins
-
-        print(f"DEBUG: Starting background processing for {place} with custom preferences: {custom_ins}")
-
-        # Initialize task
-        tasks_storage[task_id] = {
-            "task_id": task_id,
-            "status": "processing",
-            "message": f"Processing {place}",
-            "created_at": time.time(),
-            "destinations": [
-                {
-                    "place": place,
-                    "days": days,
-                    "budget": budget,
-                    "custom_ins": custom_ins,
-                    "processing_status": "processing"
-                }
-            ]
+        return await process_destination(destination_request)
+    except Exception as e:
+        return {
+            "place": destination_request.place,
+            "days": destination_request.days,
+            "budget": destination_request.budget,
+            "processing_status": "error",
+            "error": str(e),
         }
 
-        print(f"DEBUG: Task initialized for {place}")
 
+async def process_destinations_background(task_id: str, destinations: List[DestinationRequest]):
+    """Background task that processes every destination of a batch concurrently"""
 
-        try:
-            print(f"DEBUG: Starting AI calls for {place}")
-
-            # Generate activities
-            activities_prompt = ACTIVITIES_PROMPT.format(destination=place, days=days, budget=budget, custom_ins=destination_request.custom_ins)
-            print(f"DEBUG: Making AI call for activities...")
-            activities_response = model.generate_content(activities_prompt)
-            print(f"DEBUG: Activities response received, length: {len(activities_response.text)}")
-            activities_list = parse_simple_response(activities_response.text, "activities")
-            print(f"DEBUG: Activities parsed: {len(activities_list)} items")
-
-            # Generate food recommendations
-            food_prompt = RESTAURANTS_PROMPT.format(destination=place, budget=budget, custom_ins=destination_request.custom_ins)
-            print(f"DEBUG: Making AI call for food...")
-            food_response = model.generate_content(food_prompt)
-            print(f"DEBUG: Food response received, length: {len(food_response.text)}")
-            food_list = parse_simple_response(food_response.text, "food")
-            print(f"DEBUG: Food parsed: {len(food_list)} items")
-
-            # Generate accommodation recommendations
-            accommodation_prompt = ACCOMMODATION_PROMPT.format(destination=place, days=days, budget=budget, custom_ins=destination_request.custom_ins)
-            print(f"DEBUG: Making AI call for accommodations...")
-            accommodation_response = model.generate_content(accommodation_prompt)
-            print(f"DEBUG: Accommodations response received, length: {len(accommodation_response.text)}")
-            accommodation_list = parse_simple_response(accommodation_response.text, "accommodations")
-            print(f"DEBUG: Accommodations parsed: {len(accommodation_list)} items")
-
-            print(f"DEBUG: All AI calls completed for {place}")
+    async def _run(index: int, destination_request: DestinationRequest):
+        await task_store.update_destination(task_id, index, {"processing_status": "processing"})
+        result = await _process_destination_safely(destination_request)
+        await task_store.update_destination(task_id, index, result)
+        print(f"DEBUG: Destination {destination_request.place} finished with status {result['processing_status']}")
 
-        except Exception as e:
-            print(f"DEBUG: Exception occurred: {str(e)}")
-            activities_list = [f"Error getting activities: {str(e)}"]
-            food_list = [f"Error getting food: {str(e)}"]
-            accommodation_list = [f"Error getting accommodations: {str(e)}"]
-
-        # Update task with results
-        print(f"DEBUG: Updating task status to completed for {place}")
-        tasks_storage[task_id] = {
-            "task_id": task_id,
-            "status": "completed",
-            "message": f"Successfully processed {place}",
-            "created_at": time.time(),
-            "destinations": [
-                {
-                    "place": place,
-                    "days": days,
-                    "budget": budget,
-                    "activities": activities_list,
-                    "food": food_list,
-                    "accommodations": accommodation_list,
-                    "processing_status": "completed"
-                }
-            ]
-        }
-        print(f"DEBUG: Task status updated for {place}. Current tasks in storage: {len(tasks_storage)}")
+    await asyncio.gather(*[_run(i, dest) for i, dest in enumerate(destinations)])
 
-    except Exception as e:
-        # Handle any unexpected errors
-        tasks_storage[task_id] = {
-            "task_id": task_id,
-            "status": "error",
-            "message": f"Failed to process {place}: {str(e)}",
-            "created_at": time.time(),
-            "destinations": [
-                {
-                    "place": destination_request.place,
-                    "days": destination_request.days,
-                    "budget": destination_request.budget,
-                    "processing_status": "error",
-                    "error": str(e)
-                }
-            ]
-        }
+    task = await task_store.get(task_id)
+    if task is None:
+        return
+    failed = sum(1 for dest in task["destinations"] if dest["processing_status"] == "error")
+    await task_store.finish(
+        task_id,
+        status="error" if failed == len(destinations) else "completed",
+        message=f"Processed {len(destinations) - failed}/{len(destinations)} destinations",
+    )
 
 # Old synchronous functions removed - now using background processing
 
@@ -207,12 +202,11 @@ async def process_destinations(
     task_id = str(uuid.uuid4())
 
     # Initialize task storage
-    tasks_storage[task_id] = {
-        "task_id": task_id,
-        "status": "processing",
-        "message": f"Starting background processing for {len(destinations)} destinations",
-        "created_at": time.time(),
-        "destinations": [
+    await task_store.create(
+        task_id,
+        status="processing",
+        message=f"Starting background processing for {len(destinations)} destinations",
+        destinations=[
             {
                 "place": dest.place,
                 "days": dest.days,
@@ -220,19 +214,19 @@ async def process_destinations(
                 "processing_status": "pending"
             }
             for dest in destinations
-        ]
-    }
+        ],
+    )
+    task_data = await task_store.get(task_id)
 
-    # Start background processing for each destination
-    for destination in destinations:
-        background_tasks.add_task(process_destination_background, task_id, destination)
+    # Start background processing for the whole batch
+    background_tasks.add_task(process_destinations_background, task_id, destinations)
 
     # Return task information immediately
     return TaskResponse(
         task_id=task_id,
         status="processing",
         message=f"Started processing {len(destinations)} destinations in background",
-        created_at=time.time(),
+        created_at=task_data["created_at"],
         destinations=[
             {
                 "place": dest.place,
@@ -241,29 +235,130 @@ async def process_destinations(
                 "processing_status": "processing"
             }
             for dest in destinations
-        ]
+        ],
+        version=task_data["version"],
     )
 
-@router.get("/task-status/{task_id}", response_model=TaskResponse)
-async def get_task_status(task_id: str) -> TaskResponse:
-    """Get the status of a background processing task"""
-    if task_id not in tasks_storage:
-        raise HTTPException(status_code=404, detail="Task not found")
 
-    task_data = tasks_storage[task_id]
+@router.post("/process/stream")
+async def process_destinations_stream(destinations: List[DestinationRequest]) -> StreamingResponse:
+    """
+    Process destinations concurrently and stream the results as NDJSON: one
+    StreamedDestinationResponse line per destination, in completion order.
+    """
+    if not destinations:
+        raise HTTPException(status_code=400, detail="No destinations provided")
 
-    # Convert destinations to proper format
-    destinations = []
-    for dest in task_data["destinations"]:
-        destinations.append(DestinationResponse(**dest))
+    async def _run(index: int, destination_request: DestinationRequest):
+        return index, await _process_destination_safely(destination_request)
 
-    return TaskResponse(
+    async def line_source():
+        tasks = [asyncio.ensure_future(_run(i, dest)) for i, dest in enumerate(destinations)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, result = await next_done
+                line = StreamedDestinationResponse(index=index, **result)
+                yield line.model_dump_json() + "\n"
+        finally:
+            # Client went away: stop spending model calls on the rest. A call
+            # merged with another request's (SingleFlight) keeps running for it.
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(line_source(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
+
+async def _task_status(task_id: str) -> Optional[Tuple[TaskResponse, bytes]]:
+    """The task's TaskResponse and its JSON body, built once per task version."""
+    version = await task_store.version(task_id)
+    if version is None:
+        return None
+    cached = _status_cache.get(task_id)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+
+    task_data = await task_store.get(task_id)
+    if task_data is None:
+        return None
+    response = TaskResponse(
         task_id=task_data["task_id"],
         status=task_data["status"],
         message=task_data["message"],
         created_at=task_data["created_at"],
-        destinations=destinations
+        destinations=[DestinationResponse(**dest) for dest in task_data["destinations"]],
+        version=task_data["version"],
     )
+    body = response.model_dump_json().encode("utf-8")
+    _status_cache[task_id] = (response.version, response, body)
+    return response, body
+
+
+@router.get("/task-status/{task_id}", response_model=TaskResponse)
+async def get_task_status(
+    task_id: str,
+    wait: float = Query(0, ge=0, description="Seconds to hold the request until the task changes"),
+    since: Optional[int] = Query(None, description="Version the client already has; defaults to the current one"),
+) -> Response:
+    """Get the status of a background processing task, optionally long-polling for the next change"""
+    status = await _task_status(task_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    response, body = status
+    if wait and response.status == "processing" and (since is None or since == response.version):
+        version = await task_store.wait_for_change(
+            task_id, response.version, min(wait, TASK_STORE["max_wait_seconds"])
+        )
+        if version != response.version:
+            status = await _task_status(task_id)
+            if status is None:
+                raise HTTPException(status_code=404, detail="Task not found")
+            response, body = status
+
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/task-status/{task_id}/events")
+async def stream_task_status(task_id: str) -> StreamingResponse:
+    """
+    Subscribe to a task as Server-Sent Events: a "snapshot" of the whole task,
+    one "destination" event per destination whose state changed, then "done".
+    """
+    status = await _task_status(task_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def event_source():
+        current = status[0]
+        yield format_sse("snapshot", current.model_dump(mode="json"), event_id=str(current.version))
+        while current.status == "processing":
+            version = await task_store.wait_for_change(
+                task_id, current.version, TASK_STORE["max_wait_seconds"]
+            )
+            if version is None:
+                break
+            if version == current.version:
+                yield ": keep-alive\n\n"
+                continue
+            latest = await _task_status(task_id)
+            if latest is None:
+                break
+            latest = latest[0]
+            for index, (before, after) in enumerate(zip(current.destinations, latest.destinations)):
+                if before != after:
+                    yield format_sse(
+                        "destination",
+                        {"index": index, "destination": after.model_dump(mode="json")},
+                        event_id=str(latest.version),
+                    )
+            current = latest
+        yield format_sse(
+            "done",
+            {"task_id": task_id, "status": current.status, "message": current.message, "version": current.version},
+            event_id=str(current.version),
+        )
+
+    return StreamingResponse(event_source(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @router.get("/")
 async def get_travel_info():
@@ -272,7 +367,9 @@ async def get_travel_info():
         "message": "Itinera AI Places Processing",
         "endpoints": {
             "process_destinations": "/api/v1/itinera/places/process-destinations",
-            "task_status": "/api/v1/itinera/places/task-status/{task_id}",
+            "task_status": "/api/v1/itinera/places/task-status/{task_id}?wait=&since=",
+            "process_stream": "/api/v1/itinera/places/process/stream",
+            "task_events": "/api/v1/itinera/places/task-status/{task_id}/events",
             "test_gemini": "/api/v1/itinera/places/test-gemini"
         }
     }
\ No newline at end of file
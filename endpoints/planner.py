@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import Any, List
 from pydantic import BaseModel
 
@@ -16,8 +17,9 @@ from schemas.models import (
 from engine.services.planner_service import PlannerService
 from engine.services.travel_service import TravelService
 from engine.services.places_service import PlacesService
-# Note: Food Logic acts differently, keeping it simple for now or moving later if needed.
-# Since user asked for "whole project refactor", we should probably verify Food too, but start with the big 3.
+from engine.services.food_service import FoodService
+from lib.sse import SSE_HEADERS, format_sse
+from lib.token_usage import TokenBudgetExceeded
 
 router = APIRouter(
     prefix="",
@@ -35,7 +37,12 @@ def get_travel_service():
 def get_places_service():
     return PlacesService()
 
+def get_food_service():
+    return FoodService()
+
 # --- Endpoint Definitions ---
+# Service results are validated when the model reply is parsed, so handlers
+# return ORJSONResponse directly; response_model only documents the shape.
 
 @router.get("/")
 async def get_travel_info():
@@ -46,6 +53,7 @@ async def get_travel_info():
             "plans": "/api/v1/itinera/planner/plans",
             "destinations": "/api/v1/itinera/planner/destinations",
             "itinerary": "/api/v1/itinera/planner/itinerary",
+            "itinerary_stream": "/api/v1/itinera/planner/itinerary/stream",
             "itinerary_places": "/api/v1/itinera/planner/itinerary/places",
             "options": "/api/v1/itinera/planner/options",
             "food": "/api/v1/itinera/planner/food"
@@ -58,88 +66,67 @@ async def generate_itinerary(
     service: PlannerService = Depends(get_planner_service)
 ) -> Any:
     try: 
-        return await service.generate_itinerary(payload)
+        return ORJSONResponse(await service.generate_itinerary(payload))
+    except TokenBudgetExceeded:
+        raise
     except Exception as e:
         # In production, log error here
         print(f"Endpoint Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/itinerary/stream")
+async def stream_itinerary(
+    payload: ItineraryRequest,
+    service: PlannerService = Depends(get_planner_service)
+) -> StreamingResponse:
+    """Stream the itinerary as Server-Sent Events: meta, day..., tips, image..., done"""
+    async def event_source():
+        try:
+            async for event, data in service.stream_itinerary(payload):
+                yield format_sse(event, data)
+        except Exception as e:
+            print(f"Endpoint Error: {e}")
+            yield format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(event_source(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @router.post("/options", response_model=TravelOptionsResponse)
 async def travel_options(
     payload: TravelOptionsRequest,
     service: TravelService = Depends(get_travel_service)
 ) -> Any:
     try:
-        return await service.get_travel_options(payload)
+        return ORJSONResponse(await service.get_travel_options(payload))
+    except TokenBudgetExceeded:
+        raise
     except Exception as e:
         print(f"Endpoint Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/itinerary/places")
+@router.post("/itinerary/places", response_model=ItineraryPlacesResponse)
 async def itinerary_places(
     req: ItineraryPlacesRequest,
     service: PlacesService = Depends(get_places_service)
 ) -> Any:
     try:
-        return await service.get_places(req)
+        return ORJSONResponse(await service.get_places(req))
+    except TokenBudgetExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Keeping Food endpoint minimal/legacy or moving logic if requested later, 
-# but for now we'll import logic inline or similar to keep this file clean.
-# Ideally we should make a FoodService. Let's do a quick inline specific for Food to complete the pattern.
-
-@router.post("/food")
-async def food_outlets(payload: dict) -> Any:
+@router.post("/food", response_model=FoodOptionsResponse)
+async def food_outlets(
+    payload: FoodOptionsRequest,
+    service: FoodService = Depends(get_food_service)
+) -> Any:
     try:
-        # For now, let's keep the logic inline or move to a service if we want perfection.
-        # To strictly follow "easy to understand", let's move it to a simple service method or keep it here if short.
-        # It uses Perplexity similar to TravelService.
-        # For expediency in this step, I will leave it here but cleaner.
-        from schemas.models import FoodOptionsRequest, FoodOptionsResponse
-        from engine.search_core import PerplexityService
-        from instructions.cuisine import SYSTEM_PROMPT_FOOD_OPTIONS
-        from settings import MODELS, PERPLEXITY_SETTINGS
-        
-        req = FoodOptionsRequest(**payload)
-        system_prompt = SYSTEM_PROMPT_FOOD_OPTIONS
-
-        user_prompt = (
-            f"City: {req.city}\n"
-            f"Cuisines: {', '.join(req.cuisine_preferences) if req.cuisine_preferences else 'any'}\n"
-            f"Price level: {req.price_level or 'any'}\n"
-            "Return JSON as per schema only."
-        )
-
-        svc = PerplexityService()
-        result = await svc.chat_completion(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            model=MODELS["perplexity"]["text"],
-            temperature=PERPLEXITY_SETTINGS["temperature"],
-            top_p=PERPLEXITY_SETTINGS["top_p"],
-            max_tokens=1200,
-            web_search_options=PERPLEXITY_SETTINGS["web_search_options"],
-            recency_filter=req.recency_filter,
-        )
-
-        # JSON parsing logic (simplified)
-        import json
-        text = ""
-        choices = result.get("choices", [])
-        if choices:
-            text = choices[0].get("message", {}).get("content", "")
-        
-        try:
-            data = json.loads(text)
-        except:
-             data = {"city": req.city, "outlets": []}
-
-        data.setdefault("city", req.city)
-        data.setdefault("outlets", [])
-        return FoodOptionsResponse(**data)
-        
+        return ORJSONResponse(await service.get_food_options(payload))
+    except TokenBudgetExceeded:
+        raise
     except Exception as e:
+        print(f"Endpoint Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
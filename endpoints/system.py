@@ -1,4 +1,11 @@
-from fastapi import APIRouter
+from typing import Optional
+from fastapi import APIRouter, Query
+from fastapi.responses import Response
+from engine.ai_core import context_cache
+from engine.search_core import perplexity_http
+from engine.usage import output_budgets, token_usage
+from lib.metrics import registry
+from settings import TOKEN_USAGE
 
 router = APIRouter(
     prefix="",
@@ -20,6 +27,31 @@ async def detailed_health_check():
         "version": "1.0.0",
         "endpoints": {
             "health": "/api/v1/itinera/system/",
-            "detailed_health": "/api/v1/itinera/system/detailed"
+            "detailed_health": "/api/v1/itinera/system/detailed",
+            "upstreams": "/api/v1/itinera/system/upstreams",
+            "metrics": "/api/v1/itinera/system/metrics",
+            "token_usage": "/api/v1/itinera/system/token-usage"
         }
     }
+
+@router.get("/upstreams")
+async def upstream_health():
+    """Retry counts and circuit breaker state per outbound host"""
+    return perplexity_http.stats()
+
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus metrics: upstream latency/in-flight/outcomes, fallbacks, cache and pool depth"""
+    return Response(content=registry.render(), media_type=registry.CONTENT_TYPE)
+
+
+@router.get("/token-usage")
+async def get_token_usage(
+    window: Optional[int] = Query(None, gt=0, description="Window in seconds (default: one hour)")
+):
+    """Prompt, output and thinking tokens per endpoint and model over a recent window, plus cached contexts"""
+    summary = token_usage.summary(window or TOKEN_USAGE["default_window_seconds"])
+    summary["output_budgets"] = output_budgets.snapshot()
+    summary["context_cache"] = context_cache.snapshot()
+    return summary
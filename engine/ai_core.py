@@ -1,16 +1,36 @@
 import os
-import json
 import time
 import asyncio
-from typing import Any, List, Optional
+import hashlib
+import mimetypes
+import multiprocessing
+import concurrent.futures
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Type
 from dotenv import load_dotenv
+from pydantic import BaseModel
 
 # Load environment variables before accessing them
 load_dotenv()
 
 from google import genai
+from google.genai import errors as genai_errors
 from google.genai import types
-from settings import MODELS, GEMINI_SETTINGS
+from settings import CONTEXT_CACHE, MODELS, GEMINI_SETTINGS, GEMINI_RATE_LIMITS, IMAGE_STORE, IMAGE_VARIANTS
+from lib.async_ops import SingleFlight
+from lib.context_cache import ContextCache
+from lib.file_ops import static_dir
+from lib.image_store import ContentAddressedImageStore
+from lib.storage import StorageBackend, LocalStorageBackend, LocalS3Backend
+from lib.image_variants import render_variants, supported_formats
+from lib.rate_limit import ModelRateLimiter
+from lib.cache import request_fingerprint
+from lib.fast_json import clone_json, dumps_str
+from lib.structured_output import ParsedOutput, parse_structured
+from lib.token_usage import budget_scope
+from schemas.gemini import schema_registry
+from engine.cache import llm_cache, cache_ttl, cache_enabled
+from engine.metrics import fallbacks, upstream_calls, upstream_in_flight, upstream_latency, watch_executor
+from engine.usage import apply_token_budget, record_gemini_usage
 
 
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
@@ -29,6 +49,123 @@ class GeminiService:
 
 async_client = genai.Client(api_key=GEMINI_API_KEY)
 
+# Identical generate calls that overlap in time share one provider request
+_generate_flight = SingleFlight()
+
+# Large static system prompts are uploaded once and referenced by name
+context_cache = ContextCache(async_client.aio.caches, CONTEXT_CACHE)
+
+def image_storage_backend() -> StorageBackend:
+    root = os.path.join(static_dir(), IMAGE_STORE["dir"])
+    base_url = f"/static/{IMAGE_STORE['dir']}"
+    if IMAGE_STORE["backend"] == "local_s3":
+        return LocalS3Backend(root, IMAGE_STORE["bucket"], base_url)
+    return LocalStorageBackend(root, base_url)
+
+
+# Generated images are stored by hash of (model, prompt) and reused across requests
+image_store = ContentAddressedImageStore(image_storage_backend())
+_image_flight = SingleFlight()
+# Created on first use; image encoding is CPU-bound and must stay off the event loop
+_variant_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+# Every Gemini call below waits for its model's request/token/concurrency budget
+rate_limiter = ModelRateLimiter(GEMINI_RATE_LIMITS)
+
+watch_executor("image_variants", lambda: _variant_pool)
+
+
+def _record_call(model: str, stage: str, outcome: str, elapsed: float) -> None:
+    upstream_latency.observe(elapsed, provider="gemini", model=model, stage=stage)
+    upstream_calls.inc(provider="gemini", model=model, stage=stage, outcome=outcome)
+
+
+def estimate_prompt_tokens(system_prompt: str, contents: Optional[List[types.Content]]) -> int:
+    """Rough pre-call token estimate (~4 chars/token); settled against usage_metadata afterwards."""
+    chars = len(system_prompt or "")
+    for content in contents or []:
+        for part in content.parts or []:
+            chars += len(part.text or "")
+    return chars // 4 + 1
+
+
+def _total_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) if usage else None
+
+
+def _cache_key(
+    model: str,
+    contents: Optional[List[types.Content]],
+    system_prompt: str,
+    response_schema: Optional[types.Schema],
+    temperature: float,
+    top_p: float,
+    top_k: int,
+) -> str:
+    # Output/thinking limits only decide whether an answer is cut short, and
+    # only complete answers are cached, so they are not part of the key; this
+    # keeps adaptive per-request limits from fragmenting the cache.
+    return request_fingerprint(
+        provider="gemini",
+        model=model,
+        system_prompt=hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+        contents=contents or [],
+        response_schema=schema_registry.hash_of(response_schema),
+        temperature=temperature,
+        top_p=top_p,
+        top_k=top_k,
+    )
+
+
+def _build_config(
+    system_prompt: str,
+    response_schema: Optional[types.Schema],
+    temperature: float,
+    top_p: float,
+    top_k: int,
+    max_output_tokens: int,
+    thinking_budget: Optional[int] = None,
+    cached_content: Optional[str] = None,
+) -> types.GenerateContentConfig:
+    # A cached context already carries the system prompt; it may not be sent again
+    return types.GenerateContentConfig(
+        temperature=temperature,
+        top_p=top_p,
+        top_k=top_k,
+        max_output_tokens=max_output_tokens,
+        response_mime_type="application/json" if response_schema else None,
+        response_schema=response_schema,
+        system_instruction=[types.Part.from_text(text=system_prompt)]
+        if system_prompt and not cached_content
+        else None,
+        cached_content=cached_content,
+        thinking_config=types.ThinkingConfig(thinking_budget=thinking_budget)
+        if thinking_budget is not None
+        else None,
+    )
+
+
+async def _with_cached_context(
+    model: str, system_prompt: str, call: Callable[[Optional[str]], Awaitable[Any]]
+) -> Any:
+    """
+    Run `call` with the system prompt's cached context name, or None to send it inline.
+
+    A call rejected with a client error other than rate limiting (e.g. the
+    context expired or was deleted on the provider side) is retried once inline.
+    """
+    cached_content = await context_cache.name_for(model, system_prompt)
+    if cached_content is not None:
+        try:
+            return await call(cached_content)
+        except genai_errors.ClientError as e:
+            if e.code == 429:
+                raise
+            context_cache.invalidate(model, system_prompt)
+            print(f"SERVER_LOG: Cached context {cached_content} rejected ({e.code}), sending the prompt inline")
+    return await call(None)
+
 
 async def async_gemini_generate_content(
     model: str = None,
@@ -41,7 +178,22 @@ async def async_gemini_generate_content(
     max_output_tokens: int = None,
     timeout: int = None,
     default_response: Any = None,
+    endpoint: str = "default",
+    use_cache: bool = True,
+    thinking_budget: Optional[int] = None,
+    on_usage: Optional[Callable[[Any], None]] = None,
+    response_model: Optional[Type[BaseModel]] = None,
+    recover_depth: Optional[int] = None,
+    on_partial: Optional[Callable[[], None]] = None,
 ) -> Any:
+    """
+    Generate (or serve from cache) one Gemini reply, parsed when a schema is given.
+
+    With `recover_depth`, a structured reply that is cut off or malformed is
+    repaired via lib.structured_output instead of being discarded. A truncated
+    reply keeps only complete elements, is never cached, and triggers
+    `on_partial` so the caller can ask for just the missing part.
+    """
     # Use config defaults if not provided
     if model is None:
         model = MODELS["gemini"]["text"]
@@ -53,120 +205,398 @@ async def async_gemini_generate_content(
         max_output_tokens = GEMINI_SETTINGS["max_output_tokens"]["text"]
     if timeout is None:
         timeout = GEMINI_SETTINGS["timeout"]["text"]
-    start_time = time.time()
-    try:
-        generate_content_config = types.GenerateContentConfig(
+
+    key = _cache_key(model, contents, system_prompt, response_schema, temperature, top_p, top_k)
+    use_cache = use_cache and cache_enabled()
+
+    if use_cache:
+        cached = await llm_cache.get(key, namespace=endpoint)
+        if cached is not None:
+            return cached
+
+    # Raises TokenBudgetExceeded, or swaps in a cheaper model, when the request is over budget
+    budgeted = apply_token_budget(model, estimate_prompt_tokens(system_prompt, contents), max_output_tokens)
+    if budgeted != (model, max_output_tokens):
+        model, max_output_tokens = budgeted
+        if thinking_budget is not None:
+            # Thoughts share max_output_tokens; leave room for the answer itself
+            thinking_budget = min(thinking_budget, max_output_tokens // 2)
+        key = _cache_key(model, contents, system_prompt, response_schema, temperature, top_p, top_k)
+        # One request's budget must not decide what everyone else is served
+        use_cache = False
+
+    async def _generate_and_store() -> Any:
+        result = await _generate_content(
+            endpoint=endpoint,
+            model=model,
+            contents=contents,
+            system_prompt=system_prompt,
+            response_schema=response_schema,
             temperature=temperature,
             top_p=top_p,
             top_k=top_k,
             max_output_tokens=max_output_tokens,
-            response_mime_type="application/json" if response_schema else None,
-            response_schema=response_schema,
-            system_instruction=[types.Part.from_text(text=system_prompt)]
-            if system_prompt
-            else None,
-            # thinking_config=types.ThinkingConfig(thinking_budget=0),
+            thinking_budget=thinking_budget,
+            on_usage=on_usage,
+            response_model=response_model,
+            recover_depth=recover_depth,
+            timeout=timeout,
         )
+        if result is not None and use_cache and not isinstance(result, ParsedOutput):
+            await llm_cache.set(key, result, ttl=cache_ttl(endpoint), namespace=endpoint)
+        return result
+
+    result = await _generate_flight.do((key, budget_scope()), _generate_and_store)
+    if isinstance(result, ParsedOutput):
+        if on_partial is not None:
+            on_partial()
+        result = result.value
+    if result is None:
+        fallbacks.inc(endpoint=endpoint)
+        return default_response
+
+    # Every caller gets its own copy because services mutate the parsed payload
+    return clone_json(result)
 
-        response_task = asyncio.create_task(
-            async_client.aio.models.generate_content(
-                model=model, contents=contents or [], config=generate_content_config
+
+async def _generate_content(
+    endpoint: str,
+    model: str,
+    contents: Optional[List[types.Content]],
+    system_prompt: str,
+    response_schema: Optional[types.Schema],
+    temperature: float,
+    top_p: float,
+    top_k: int,
+    max_output_tokens: int,
+    thinking_budget: Optional[int],
+    on_usage: Optional[Callable[[Any], None]],
+    response_model: Optional[Type[BaseModel]],
+    recover_depth: Optional[int],
+    timeout: int,
+) -> Any:
+    """
+    Call Gemini once; returns the parsed payload, or None on any failure.
+
+    A reply salvaged from truncated output comes back as ParsedOutput.
+    """
+    start_time = time.time()
+    outcome = "error"
+    try:
+        def generate(cached_content: Optional[str]) -> Awaitable[Any]:
+            config = _build_config(
+                system_prompt, response_schema, temperature, top_p, top_k, max_output_tokens, thinking_budget,
+                cached_content,
             )
-        )
+            return async_client.aio.models.generate_content(model=model, contents=contents or [], config=config)
 
-        try:
-            response = await asyncio.wait_for(response_task, timeout=timeout)
-        except asyncio.TimeoutError as e:
-            response_task.cancel()
-            print(f"Timeout error generating content: {e}")
-            return default_response
+        async with rate_limiter.limit(
+            model, tokens=estimate_prompt_tokens(system_prompt, contents)
+        ) as permit:
+            upstream_latency.observe(permit.waited, provider="gemini", model=model, stage="rate_limit_wait")
+            start_time = time.time()
+            response_task = asyncio.create_task(_with_cached_context(model, system_prompt, generate))
+
+            try:
+                with upstream_in_flight.track_inprogress(provider="gemini", model=model, stage="generate"):
+                    response = await asyncio.wait_for(response_task, timeout=timeout)
+            except asyncio.TimeoutError as e:
+                response_task.cancel()
+                outcome = "timeout"
+                print(f"Timeout error generating content: {e}")
+                return None
+            permit.settle(_total_tokens(response))
+            record_gemini_usage(endpoint, model, getattr(response, "usage_metadata", None))
+            if on_usage is not None:
+                on_usage(getattr(response, "usage_metadata", None))
 
         if response:
             if response_schema:
-                try:
-                    if response.text:
-                        return json.loads(response.text)
-                    else:
-                        return default_response
-                except json.JSONDecodeError as e:
-                    print(f"JSON decode error generating content: {e} for response: {response.text}")
-                    return default_response
+                if not response.text:
+                    outcome = "empty"
+                    return None
+                parsed = parse_structured(
+                    response.text,
+                    response_model,
+                    recover=recover_depth is not None,
+                    max_depth=recover_depth,
+                )
+                if parsed is None:
+                    outcome = "invalid_json"
+                    print(f"JSON decode error generating content for response: {response.text}")
+                    return None
+                if parsed.truncated:
+                    outcome = "truncated"
+                    print(f"SERVER_LOG: Recovered complete items from truncated {endpoint} reply")
+                    return parsed
+                outcome = "repaired" if parsed.repaired else "ok"
+                return parsed.value
             else:
                 if response.text:
+                    outcome = "ok"
                     return response.text
                 else:
-                    return default_response
+                    outcome = "empty"
+                    return None
         else:
+            outcome = "empty"
             print(f"No response generating content: {response}")
-            return default_response
+            return None
 
     except Exception as e:
         print(f"Error generating content: {e}")
-        return default_response
+        return None
     finally:
-        _ = time.time() - start_time
+        _record_call(model, "generate", outcome, time.time() - start_time)
+
+
+async def async_gemini_generate_content_stream(
+    model: str = None,
+    contents: Optional[List[types.Content]] = None,
+    system_prompt: str = "",
+    response_schema: Optional[types.Schema] = None,
+    temperature: float = None,
+    top_p: float = None,
+    top_k: int = 40,
+    max_output_tokens: int = None,
+    timeout: int = None,
+    endpoint: str = "default",
+    use_cache: bool = True,
+    thinking_budget: Optional[int] = None,
+    on_usage: Optional[Callable[[Any], None]] = None,
+) -> AsyncIterator[str]:
+    """
+    Stream response text chunks as Gemini produces them.
 
+    A cached answer for the same request is replayed as a single chunk, and a
+    completed structured stream is written back to the cache under the same key
+    that async_gemini_generate_content uses.
+    """
+    if model is None:
+        model = MODELS["gemini"]["text"]
+    if temperature is None:
+        temperature = GEMINI_SETTINGS["temperature"]["text"]
+    if top_p is None:
+        top_p = GEMINI_SETTINGS["top_p"]["text"]
+    if max_output_tokens is None:
+        max_output_tokens = GEMINI_SETTINGS["max_output_tokens"]["text"]
+    if timeout is None:
+        timeout = GEMINI_SETTINGS["timeout"]["text"]
 
-async def async_generate_image_files(
-    prompts: List[str], output_dir: str, base_file_name: str
-) -> List[str]:
-    os.makedirs(output_dir, exist_ok=True)
+    key = _cache_key(model, contents, system_prompt, response_schema, temperature, top_p, top_k)
+    use_cache = use_cache and cache_enabled()
 
-    model = MODELS["gemini"]["image"]
+    if use_cache:
+        cached = await llm_cache.get(key, namespace=endpoint)
+        if cached is not None:
+            yield cached if isinstance(cached, str) else dumps_str(cached)
+            return
 
-    contents_list: List[List[types.Content]] = []
-    for prompt in prompts:
-        contents_list.append(
-            [
-                types.Content(
-                    role="user",
-                    parts=[types.Part.from_text(text=prompt)],
-                )
-            ]
-        )
+    budgeted = apply_token_budget(model, estimate_prompt_tokens(system_prompt, contents), max_output_tokens)
+    if budgeted != (model, max_output_tokens):
+        model, max_output_tokens = budgeted
+        if thinking_budget is not None:
+            # Thoughts share max_output_tokens; leave room for the answer itself
+            thinking_budget = min(thinking_budget, max_output_tokens // 2)
+        key = _cache_key(model, contents, system_prompt, response_schema, temperature, top_p, top_k)
+        # One request's budget must not decide what everyone else is served
+        use_cache = False
 
-    async def _gen_for_index(index: int, contents: List[types.Content]) -> Optional[str]:
-        generate_content_config = types.GenerateContentConfig(
-            response_modalities=["IMAGE", "TEXT"],
+    def open_stream(cached_content: Optional[str]) -> Awaitable[Any]:
+        config = _build_config(
+            system_prompt, response_schema, temperature, top_p, top_k, max_output_tokens, thinking_budget,
+            cached_content,
         )
+        return async_client.aio.models.generate_content_stream(model=model, contents=contents or [], config=config)
 
-        file_name_prefix = f"{base_file_name}_{index}"
-        file_path_result: Optional[str] = None
+    chunks: List[str] = []
+    # The permit is held by `pump` for the upstream call only; chunks are
+    # buffered for the reader, so a slow client never holds limiter capacity
+    buffered: asyncio.Queue = asyncio.Queue()
+    outcome = "error"
 
+    async def pump() -> None:
+        nonlocal outcome
+        start_time = time.time()
         try:
-            response = await async_client.aio.models.generate_content(
-                model=model, contents=contents, config=generate_content_config
-            )
-
-            if response and response.candidates:
-                candidate = response.candidates[0]
-                if candidate.content and candidate.content.parts:
-                    for part_index, part in enumerate(candidate.content.parts):
-                        if getattr(part, "inline_data", None) and getattr(part.inline_data, "data", None):
-                            data_buffer = part.inline_data.data
-                            mime_type = part.inline_data.mime_type
-                            import mimetypes
-
-                            file_extension = mimetypes.guess_extension(mime_type) or ".bin"
-                            file_path = os.path.join(
-                                output_dir, f"{file_name_prefix}_{part_index}{file_extension}"
+            async with rate_limiter.limit(
+                model, tokens=estimate_prompt_tokens(system_prompt, contents)
+            ) as permit:
+                upstream_latency.observe(permit.waited, provider="gemini", model=model, stage="rate_limit_wait")
+                start_time = time.time()
+                with upstream_in_flight.track_inprogress(provider="gemini", model=model, stage="stream"):
+                    deadline = time.time() + timeout
+                    stream = await asyncio.wait_for(
+                        _with_cached_context(model, system_prompt, open_stream), timeout=timeout
+                    )
+                    iterator = stream.__aiter__()
+                    usage_tokens = None
+                    usage_metadata = None
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(
+                                iterator.__anext__(), timeout=max(deadline - time.time(), 0)
                             )
-                            with open(file_path, "wb") as f:
-                                f.write(data_buffer)
-                            file_path_result = file_path
-                            break  # Take only the first image
-                else:
-                    print(f"SERVER_LOG: No candidate/content in response for {file_name_prefix}")
+                        except StopAsyncIteration:
+                            break
+                        usage_tokens = _total_tokens(chunk) or usage_tokens
+                        usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+                        if chunk.text:
+                            if not chunks:
+                                upstream_latency.observe(
+                                    time.time() - start_time, provider="gemini", model=model, stage="stream_first_chunk"
+                                )
+                            chunks.append(chunk.text)
+                            buffered.put_nowait(chunk.text)
+                    permit.settle(usage_tokens)
+                    record_gemini_usage(endpoint, model, usage_metadata)
+                    if on_usage is not None:
+                        on_usage(usage_metadata)
+                    outcome = "ok" if chunks else "empty"
+        except asyncio.TimeoutError as e:
+            outcome = "timeout"
+            print(f"Timeout error streaming content: {e}")
         except Exception as e:
-            print(f"SERVER_LOG: Image generation failed for {file_name_prefix}. Error: {e}")
+            print(f"Error streaming content: {e}")
+        finally:
+            _record_call(model, "stream", outcome, time.time() - start_time)
+            buffered.put_nowait(None)
+
+    producer = asyncio.ensure_future(pump())
+    try:
+        while True:
+            text = await buffered.get()
+            if text is None:
+                break
+            yield text
+    finally:
+        # The reader went away: stop the upstream call instead of finishing it unread
+        if not producer.done():
+            producer.cancel()
+
+    if outcome != "ok":
+        return
+    if use_cache and chunks:
+        text = "".join(chunks)
+        result = text
+        if response_schema:
+            parsed = parse_structured(text)
+            if parsed is None:  # cut off or malformed; never cached
+                return
+            result = parsed.value
+        await llm_cache.set(key, result, ttl=cache_ttl(endpoint), namespace=endpoint)
+
+
+def cached_image_files(prompts: List[str]) -> Optional[List[dict]]:
+    """Stored images for every prompt, or None if any prompt still needs generating."""
+    model = MODELS["gemini"]["image"]
+    images = []
+    for prompt in prompts:
+        image = image_store.lookup(image_store.key_for(model, prompt))
+        if image is None:
             return None
-        return file_path_result
+        images.append(image)
+    return images
 
-    tasks = [
-        _gen_for_index(i, contents) for i, contents in enumerate(contents_list)
-    ]
-    results = await asyncio.gather(*tasks, return_exceptions=False)
+
+async def async_generate_image_files(prompts: List[str]) -> List[dict]:
+    """
+    Return one stored image per prompt that produced an image, as
+    {"url": original, "variants": [{"url", "format", "width", "height"}]}.
+
+    Prompts already rendered by the same model are served from the
+    content-addressed store; concurrent requests for the same prompt share one
+    generation.
+    """
+    model = MODELS["gemini"]["image"]
+
+    async def _gen_for_prompt(prompt: str) -> Optional[dict]:
+        key = image_store.key_for(model, prompt)
+        image = await image_store.resolve(key)
+        if image is not None:
+            return image
+        return await _image_flight.do(key, lambda: _generate_image(model, key, prompt))
+
+    results = await asyncio.gather(*[_gen_for_prompt(p) for p in prompts], return_exceptions=False)
     # Filter out Nones
     return [r for r in results if r]
 
 
+async def _generate_image(model: str, key: str, prompt: str) -> Optional[dict]:
+    contents = [
+        types.Content(
+            role="user",
+            parts=[types.Part.from_text(text=prompt)],
+        )
+    ]
+    generate_content_config = types.GenerateContentConfig(
+        response_modalities=["IMAGE", "TEXT"],
+    )
+
+    try:
+        async with rate_limiter.limit(model) as permit:
+            upstream_latency.observe(permit.waited, provider="gemini", model=model, stage="rate_limit_wait")
+            start_time = time.time()
+            try:
+                with upstream_in_flight.track_inprogress(provider="gemini", model=model, stage="image"):
+                    response = await async_client.aio.models.generate_content(
+                        model=model, contents=contents, config=generate_content_config
+                    )
+            except Exception:
+                _record_call(model, "image", "error", time.time() - start_time)
+                raise
+            _record_call(
+                model, "image", "ok" if response and response.candidates else "empty", time.time() - start_time
+            )
+            record_gemini_usage("images", model, getattr(response, "usage_metadata", None))
+
+        if response and response.candidates:
+            candidate = response.candidates[0]
+            if candidate.content and candidate.content.parts:
+                for part in candidate.content.parts:
+                    if getattr(part, "inline_data", None) and getattr(part.inline_data, "data", None):
+                        data_buffer = part.inline_data.data
+                        mime_type = part.inline_data.mime_type
+                        file_extension = mimetypes.guess_extension(mime_type) or ".bin"
+                        # Take only the first image
+                        image = await image_store.save(
+                            key, data_buffer, file_extension, mime_type, model, prompt
+                        )
+                        return await _create_variants(key, data_buffer) or image
+            else:
+                print(f"SERVER_LOG: No candidate/content in response for image {key[:12]}")
+    except Exception as e:
+        print(f"SERVER_LOG: Image generation failed for image {key[:12]}. Error: {e}")
+    return None
+
+
+def _variant_executor() -> concurrent.futures.ProcessPoolExecutor:
+    global _variant_pool
+    if _variant_pool is None:
+        _variant_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=IMAGE_VARIANTS["workers"],
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _variant_pool
+
+
+async def _create_variants(key: str, data: bytes) -> Optional[dict]:
+    """Encode compressed/resized variants in the process pool and add them to the store."""
+    if not IMAGE_VARIANTS["enabled"]:
+        return None
+    loop = asyncio.get_running_loop()
+    start_time = time.time()
+    try:
+        variants = await loop.run_in_executor(
+            _variant_executor(),
+            render_variants,
+            data,
+            IMAGE_VARIANTS["widths"],
+            supported_formats(IMAGE_VARIANTS["formats"]),
+            IMAGE_VARIANTS["quality"],
+        )
+        upstream_latency.observe(time.time() - start_time, provider="local", model="pillow", stage="variants")
+        return await image_store.save_variants(key, variants)
+    except Exception as e:
+        print(f"SERVER_LOG: Image post-processing failed for image {key[:12]}. Error: {e}")
+        return None
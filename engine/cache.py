@@ -0,0 +1,29 @@
+import os
+from typing import Optional
+from lib.cache import StaleWhileRevalidateCache, TwoTierCache
+from lib.file_ops import project_root
+from settings import LLM_CACHE, SEARCH_RESULT_CACHE
+
+
+llm_cache = TwoTierCache(
+    path=os.path.join(project_root(), LLM_CACHE["path"]) if LLM_CACHE["path"] else None,
+    memory_max_bytes=LLM_CACHE["memory_max_bytes"],
+    disk_max_bytes=LLM_CACHE["disk_max_bytes"],
+)
+
+search_result_cache = StaleWhileRevalidateCache(llm_cache)
+
+
+def cache_ttl(endpoint: str) -> int:
+    ttls = LLM_CACHE["ttl_seconds"]
+    return ttls.get(endpoint, ttls["default"])
+
+
+def cache_enabled() -> bool:
+    return LLM_CACHE["enabled"]
+
+
+def search_result_ttl(recency_filter: Optional[str]) -> int:
+    """Freshness window for a search result, from the request's recency filter."""
+    ttls = SEARCH_RESULT_CACHE["fresh_ttl_seconds"]
+    return ttls.get((recency_filter or "none").lower(), ttls["none"])
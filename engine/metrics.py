@@ -0,0 +1,103 @@
+from typing import Callable, Dict, Optional
+import concurrent.futures
+
+from lib.async_ops import default_threadpool
+from lib.metrics import executor_queue_depth, registry
+from lib.storage import storage_threadpool
+from engine.cache import llm_cache
+
+
+# Time spent per upstream call, by provider ("gemini", "perplexity", "local"),
+# model and stage ("generate", "stream", "stream_first_chunk", "image",
+# "variants", "search", "rate_limit_wait")
+upstream_latency = registry.histogram(
+    "itinera_upstream_latency_seconds",
+    "Latency of upstream model/search calls and local post-processing",
+    ["provider", "model", "stage"],
+)
+upstream_in_flight = registry.gauge(
+    "itinera_upstream_in_flight",
+    "Upstream calls currently running",
+    ["provider", "model", "stage"],
+)
+# outcome: ok, repaired, truncated, empty, invalid_json, timeout, error, circuit_open
+upstream_calls = registry.counter(
+    "itinera_upstream_calls_total",
+    "Upstream calls by outcome",
+    ["provider", "model", "stage", "outcome"],
+)
+# kind: prompt, output, thinking, cached (the part of prompt served from a cached context)
+tokens_used = registry.counter(
+    "itinera_tokens_total",
+    "Tokens reported by upstream usage metadata",
+    ["provider", "model", "endpoint", "kind"],
+)
+fallbacks = registry.counter(
+    "itinera_fallback_responses_total",
+    "Requests answered with a default/fallback payload because the model gave none",
+    ["endpoint"],
+)
+
+_executors: Dict[str, Callable[[], Optional[concurrent.futures.Executor]]] = {}
+
+
+def watch_executor(name: str, get_executor: Callable[[], Optional[concurrent.futures.Executor]]) -> None:
+    """Report the executor's queue depth under `name`; `get_executor` may return None until it exists."""
+    _executors[name] = get_executor
+
+
+def _executor_depths():
+    for name, get_executor in sorted(_executors.items()):
+        yield (name,), executor_queue_depth(get_executor())
+
+
+def _cache_requests():
+    for namespace, counts in llm_cache.stats()["by_namespace"].items():
+        for outcome in ("memory_hit", "disk_hit", "miss"):
+            yield (namespace, outcome), counts.get(outcome, 0)
+
+
+def _cache_hit_ratio():
+    for namespace, counts in llm_cache.stats()["by_namespace"].items():
+        hits = counts.get("memory_hit", 0) + counts.get("disk_hit", 0)
+        lookups = hits + counts.get("miss", 0)
+        if lookups:
+            yield (namespace,), hits / lookups
+
+
+registry.callback(
+    "itinera_executor_queue_depth",
+    "Work items waiting for a free worker",
+    ["executor"],
+    _executor_depths,
+)
+registry.callback(
+    "itinera_cache_requests_total",
+    "LLM/search cache lookups by namespace and outcome",
+    ["namespace", "outcome"],
+    _cache_requests,
+    kind="counter",
+)
+registry.callback(
+    "itinera_cache_hit_ratio",
+    "Share of cache lookups served from memory or disk since startup",
+    ["namespace"],
+    _cache_hit_ratio,
+)
+registry.callback(
+    "itinera_cache_memory_bytes",
+    "Bytes held by the in-memory cache tier",
+    [],
+    lambda: [((), llm_cache.stats()["memory_bytes"])],
+)
+registry.callback(
+    "itinera_cache_disk_evictions_total",
+    "Entries evicted from the SQLite cache tier to stay under its size limit",
+    [],
+    lambda: [((), llm_cache.stats()["disk_evictions"])],
+    kind="counter",
+)
+
+watch_executor("default", lambda: default_threadpool)
+watch_executor("storage", lambda: storage_threadpool)
+watch_executor("cache_disk", lambda: llm_cache.executor)
@@ -1,16 +1,33 @@
 import os
+import time
 from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-from lib.async_ops import AsyncRequests
+import httpx
+from lib.cache import request_fingerprint
+from lib.resilience import CircuitOpenError, ResilientHTTP
+from engine.cache import llm_cache, cache_ttl, cache_enabled
+from engine.metrics import upstream_calls, upstream_in_flight, upstream_latency
+from engine.usage import apply_token_budget, record_perplexity_usage
+from settings import HTTP_RESILIENCE
 
 
 PERPLEXITY_API_KEY = os.environ.get("PERPLEXITY_API_KEY", "")
 PERPLEXITY_BASE_URL = "https://api.perplexity.ai"
 
+perplexity_http = ResilientHTTP(
+    max_attempts=HTTP_RESILIENCE["max_attempts"],
+    backoff_base=HTTP_RESILIENCE["backoff_base_seconds"],
+    backoff_max=HTTP_RESILIENCE["backoff_max_seconds"],
+    retry_statuses=HTTP_RESILIENCE["retry_statuses"],
+    failure_threshold=HTTP_RESILIENCE["breaker_failure_threshold"],
+    reset_timeout=HTTP_RESILIENCE["breaker_reset_seconds"],
+    max_retry_after=HTTP_RESILIENCE["max_retry_after_seconds"],
+)
+
 
 class PerplexityService:
     def __init__(self, api_key: Optional[str] = None) -> None:
@@ -36,6 +53,8 @@ class PerplexityService:
         web_search_options: Optional[Dict[str, Any]] = None,
         search_domain_filter: Optional[List[str]] = None,
         recency_filter: Optional[str] = None,
+        endpoint: str = "default",
+        use_cache: bool = True,
     ) -> Dict[str, Any]:
         try:
             request_body: Dict[str, Any] = {
@@ -62,13 +81,54 @@ class PerplexityService:
             if recency_filter:
                 request_body["search_recency_filter"] = recency_filter
 
+            use_cache = use_cache and cache_enabled()
+            key = request_fingerprint(provider="perplexity", body=request_body)
+            if use_cache:
+                cached = await llm_cache.get(key, namespace=endpoint)
+                if cached is not None:
+                    return cached
+
+            # Raises TokenBudgetExceeded, or swaps in a cheaper model, when the request is over budget
+            budgeted = apply_token_budget(model, (len(system_prompt) + len(user_prompt)) // 4 + 1, max_tokens)
+            downgraded = budgeted != (model, max_tokens)
+            if downgraded:
+                model, max_tokens = budgeted
+                request_body["model"] = model
+                request_body["max_tokens"] = max_tokens
+                key = request_fingerprint(provider="perplexity", body=request_body)
+                # One request's budget must not decide what everyone else is served
+                use_cache = False
+
             url = f"{PERPLEXITY_BASE_URL}/chat/completions"
-            response = await AsyncRequests.post(url, headers=self._headers(), json=request_body)
-            print(f"Response: {response.json()}")
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            print(f"Error generating content: {e}")
+            start_time = time.time()
+            outcome = "error"
+            try:
+                with upstream_in_flight.track_inprogress(provider="perplexity", model=model, stage="search"):
+                    response = await perplexity_http.request("POST", url, headers=self._headers(), json=request_body)
+                response.raise_for_status()
+                result = response.json()
+                outcome = "ok" if result.get("choices") else "empty"
+                record_perplexity_usage(endpoint, model, result.get("usage"))
+            except CircuitOpenError:
+                outcome = "circuit_open"
+                raise
+            except httpx.TimeoutException:
+                outcome = "timeout"
+                raise
+            finally:
+                upstream_latency.observe(time.time() - start_time, provider="perplexity", model=model, stage="search")
+                upstream_calls.inc(provider="perplexity", model=model, stage="search", outcome=outcome)
+            if use_cache and result.get("choices"):
+                await llm_cache.set(key, result, ttl=cache_ttl(endpoint), namespace=endpoint)
+            if downgraded:
+                # Lets callers keep the degraded answer out of their own caches
+                result["budget_downgraded"] = True
+            return result
+        except CircuitOpenError as e:
+            print(f"SERVER_LOG: Skipping Perplexity call: {e}")
+            return {}
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Error generating content: {e!r}")
             return {}
 
 
@@ -0,0 +1,82 @@
+from typing import Any, Union
+from schemas.models import FoodOptionsRequest, FoodOptionsResponse
+from engine.cache import search_result_cache, search_result_ttl
+from engine.search_core import PerplexityService
+from instructions.cuisine import SYSTEM_PROMPT_FOOD_OPTIONS
+from lib.cache import Uncached, request_fingerprint
+from lib.structured_output import parse_structured
+from settings import MODELS, PERPLEXITY_SETTINGS, SEARCH_RESULT_CACHE
+
+class FoodService:
+    async def get_food_options(self, req: FoodOptionsRequest) -> Any:
+        if SEARCH_RESULT_CACHE["enabled"]:
+            key = request_fingerprint(
+                kind="food",
+                model=MODELS["perplexity"]["text"],
+                system_prompt=SYSTEM_PROMPT_FOOD_OPTIONS,
+                city=req.city.strip().lower(),
+                cuisines=sorted({c.strip().lower() for c in req.cuisine_preferences}),
+                price_level=req.price_level,
+                recency_filter=req.recency_filter,
+            )
+            data = await search_result_cache.get_or_compute(
+                key,
+                lambda: self._fetch_food_options(req),
+                fresh_ttl=search_result_ttl(req.recency_filter),
+                max_stale=SEARCH_RESULT_CACHE["max_stale_seconds"],
+                namespace="food",
+            )
+        else:
+            data = await self._fetch_food_options(req)
+            if isinstance(data, Uncached):
+                data = data.value
+
+        if data is None:
+            data = {"city": req.city, "outlets": []}
+        # Fetched results are normalized through the model; the fallback is valid as built
+        return data
+
+    async def _fetch_food_options(self, req: FoodOptionsRequest) -> Union[dict, Uncached, None]:
+        """
+        Search for food outlets; None when Perplexity gave no usable answer,
+        Uncached when the answer was cut off or came from a budget-downgraded
+        call.
+        """
+        user_prompt = (
+            f"City: {req.city}\n"
+            f"Cuisines: {', '.join(req.cuisine_preferences) if req.cuisine_preferences else 'any'}\n"
+            f"Price level: {req.price_level or 'any'}\n"
+            "Return JSON as per schema only."
+        )
+
+        svc = PerplexityService()
+        result = await svc.chat_completion(
+            system_prompt=SYSTEM_PROMPT_FOOD_OPTIONS,
+            user_prompt=user_prompt,
+            model=MODELS["perplexity"]["text"],
+            temperature=PERPLEXITY_SETTINGS["temperature"],
+            top_p=PERPLEXITY_SETTINGS["top_p"],
+            max_tokens=1200,
+            web_search_options=PERPLEXITY_SETTINGS["web_search_options"],
+            recency_filter=req.recency_filter,
+            endpoint="food",
+            use_cache=False,  # cached above as a parsed result
+        )
+
+        text = ""
+        choices = result.get("choices", [])
+        if choices:
+            text = choices[0].get("message", {}).get("content", "")
+
+        # Tolerates fences, prose and cut-off replies; keeps complete outlets only
+        parsed = parse_structured(text, recover=True, max_depth=2)
+        data = parsed.value if parsed else None
+        if not isinstance(data, dict):
+            return None
+
+        data.setdefault("city", req.city)
+        data.setdefault("outlets", [])
+        data = FoodOptionsResponse(**data).model_dump(mode="json")
+        if parsed.truncated or result.get("budget_downgraded"):
+            return Uncached(data)
+        return data
@@ -0,0 +1,163 @@
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import time
+import uuid
+import asyncio
+import contextvars
+from dataclasses import dataclass, field
+from cachetools import TTLCache
+from engine.ai_core import async_generate_image_files, cached_image_files
+from settings import IMAGE_JOBS
+
+
+@dataclass
+class ImageRequest:
+    slot: str
+    prompts: List[str]
+
+
+@dataclass
+class ImageJob:
+    job_id: str
+    requests: List[ImageRequest]
+    status: str = "pending"
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    images: Dict[str, List[dict]] = field(default_factory=dict)  # slot -> GeneratedImage dicts
+    _subscribers: List[asyncio.Queue] = field(default_factory=list, repr=False)
+
+    @property
+    def total(self) -> int:
+        return len(self.requests)
+
+    @property
+    def completed(self) -> int:
+        return len(self.images)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def urls(self, slot: str) -> List[str]:
+        return [image["url"] for image in self.images.get(slot, [])]
+
+    def slot_event(self, slot: str) -> dict:
+        return {"slot": slot, "image_urls": self.urls(slot), "images": self.images.get(slot, [])}
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "total": self.total,
+            "completed": self.completed,
+            "images": {slot: self.urls(slot) for slot in self.images},
+            "slot_images": dict(self.images),
+        }
+
+
+class ImageJobManager:
+    """
+    Runs image generation for itineraries and place cards off the request path.
+
+    Services submit a job holding one ImageRequest per image slot and return
+    straight away; a background worker fills each slot with static URLs. Clients
+    read the job through the images router, either by polling or by subscribing
+    to per-slot events.
+    """
+
+    def __init__(self) -> None:
+        self._jobs: TTLCache = TTLCache(
+            maxsize=IMAGE_JOBS["max_jobs"], ttl=IMAGE_JOBS["job_ttl_seconds"]
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    def submit(self, requests: List[ImageRequest]) -> ImageJob:
+        job = ImageJob(job_id=str(uuid.uuid4()), requests=requests)
+        self._jobs[job.job_id] = job
+        if not requests:
+            job.status = "completed"
+            return job
+
+        # Prompts rendered before are resolved now, so they ship with the response
+        pending = []
+        for request in requests:
+            files = cached_image_files(request.prompts)
+            if files is None:
+                pending.append(request)
+            else:
+                self._complete_slot(job, request.slot, files)
+        if not pending:
+            return job
+
+        self._ensure_workers()
+        for request in pending:
+            self._queue.put_nowait((job, request))
+        print(f"SERVER_LOG: Queued image job {job.job_id} with {len(pending)}/{job.total} images to generate")
+        return job
+
+    def get(self, job_id: str) -> Optional[ImageJob]:
+        return self._jobs.get(job_id)
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[Tuple[str, dict]]:
+        """Yield ("image", {...}) per filled slot, replaying finished ones, then ("done", status)."""
+        job = self.get(job_id)
+        if job is None:
+            return
+        queue: asyncio.Queue = asyncio.Queue()
+        job._subscribers.append(queue)
+        try:
+            for slot in list(job.images):
+                yield "image", job.slot_event(slot)
+            seen = set(job.images)
+            while not job.finished:
+                slot = await queue.get()
+                if slot in seen:
+                    continue
+                seen.add(slot)
+                yield "image", job.slot_event(slot)
+            for slot in list(job.images):
+                if slot not in seen:
+                    yield "image", job.slot_event(slot)
+            yield "done", job.to_dict()
+        finally:
+            job._subscribers.remove(queue)
+
+    # --- worker ---
+
+    def _ensure_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < IMAGE_JOBS["workers"]:
+            # Fresh context: workers outlive the request that starts them and must
+            # not inherit its per-request state (e.g. its token budget)
+            self._workers.append(asyncio.create_task(self._worker(), context=contextvars.Context()))
+
+    async def _worker(self) -> None:
+        while True:
+            job, request = await self._queue.get()
+            try:
+                job.status = "running"
+                images = await self._generate(request)
+                self._complete_slot(job, request.slot, images)
+            except Exception as e:
+                print(f"SERVER_LOG: Image job {job.job_id} slot {request.slot} failed: {e}")
+                self._complete_slot(job, request.slot, [])
+            finally:
+                self._queue.task_done()
+
+    async def _generate(self, request: ImageRequest) -> List[dict]:
+        return await async_generate_image_files(prompts=request.prompts)
+
+    def _complete_slot(self, job: ImageJob, slot: str, images: List[dict]) -> None:
+        job.images[slot] = images
+        job.updated_at = time.time()
+        if job.completed >= job.total:
+            job.status = "completed" if any(job.images.values()) else "failed"
+        for queue in job._subscribers:
+            queue.put_nowait(slot)
+
+
+image_jobs = ImageJobManager()
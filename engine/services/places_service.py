@@ -1,21 +1,57 @@
-from typing import Any
-import os
-import asyncio
+from typing import Any, List, Tuple
 from google.genai import types as genai_types
-from engine.ai_core import async_gemini_generate_content, async_generate_image_files
+from engine.ai_core import async_gemini_generate_content
+from engine.services.image_jobs import ImageJob, ImageRequest, image_jobs
+from engine.usage import output_budgets
+from schemas.gemini import PLACES_SCHEMA
 from schemas.models import ItineraryPlacesRequest, ItineraryPlacesResponse
 from instructions.attractions import SYSTEM_PROMPT_ITINERARY_PLACES
-from lib.file_ops import static_dir, ensure_dir
 from settings import MODELS, GEMINI_SETTINGS, IMAGE_GENERATION
 
+# A place card is complete once closed inside {"places": [...]} (depth 2);
+# recovery from cut-off output never keeps a half-written card
+PLACES_RECOVER_DEPTH = 2
+
+
 class PlacesService:
-    async def get_places(self, req: ItineraryPlacesRequest) -> ItineraryPlacesResponse:
-        system_prompt = SYSTEM_PROMPT_ITINERARY_PLACES
+    async def get_places(self, req: ItineraryPlacesRequest) -> Any:
+        default_response = {"destination_city": req.destination_city, "places": []}
+        data, partial = await self._request_places(
+            req, req.max_places, "Return concise place cards as per schema.", default_response
+        )
+
+        missing = req.max_places - len(data["places"])
+        if partial and data["places"] and missing > 0:
+            # Ask only for the cards the cut-off reply did not get to
+            print(f"SERVER_LOG: Places reply stopped early; asking for {missing} more")
+            listed = ", ".join(p["place_name"] for p in data["places"])
+            more, _ = await self._request_places(
+                req,
+                missing,
+                f"Already listed: {listed}.\nReturn {missing} more concise place cards, different from those, as per schema.",
+                None,
+            )
+            seen = {p["place_name"].casefold() for p in data["places"]}
+            for place in (more or {}).get("places", []):
+                if place["place_name"].casefold() not in seen and len(data["places"]) < req.max_places:
+                    seen.add(place["place_name"].casefold())
+                    data["places"].append(place)
+
+        # Images are generated in the background; clients follow data["image_job_id"]
+        self._queue_place_images(data)
+
+        # Validated when the reply was parsed; the endpoint serializes it as is
+        return data
+
+    async def _request_places(
+        self, req: ItineraryPlacesRequest, count: int, instruction: str, default_response: Any
+    ) -> Tuple[Any, bool]:
+        """One places call for `count` cards; also reports whether the reply was cut off."""
         user_prompt = (
             f"Destination: {req.destination_city}\n"
             f"Interests: {', '.join(req.interests) if req.interests else 'general'}\n"
-            f"Max places: {req.max_places}\n"
-            "Return concise place cards as per schema."
+            f"Max places: {count}\n"
+            f"{instruction}"
         )
 
         contents = [
@@ -25,88 +61,44 @@ class PlacesService:
             )
         ]
 
-        response_schema = self._get_places_schema()
-        default_response = {"destination_city": req.destination_city, "places": []}
-
+        partial = []
+        plan = output_budgets.plan("places", count)
         data = await async_gemini_generate_content(
             model=MODELS["gemini"]["text"],
             contents=contents,
-            system_prompt=system_prompt,
-            response_schema=response_schema,
+            system_prompt=SYSTEM_PROMPT_ITINERARY_PLACES,
+            response_schema=PLACES_SCHEMA.schema,
             temperature=GEMINI_SETTINGS["temperature"]["text"],
             top_p=GEMINI_SETTINGS["top_p"]["text"],
-            max_output_tokens=GEMINI_SETTINGS["max_output_tokens"]["text"],
+            max_output_tokens=plan.max_output_tokens,
+            thinking_budget=plan.thinking_budget,
+            on_usage=plan.observe,
             timeout=GEMINI_SETTINGS["timeout"]["text"],
             default_response=default_response,
+            endpoint="places",
+            response_model=ItineraryPlacesResponse,
+            recover_depth=PLACES_RECOVER_DEPTH,
+            on_partial=lambda: partial.append(True),
         )
+        return data, bool(partial)
 
-        # Image Generation
-        await self._generate_place_images(req.destination_city, data)
-
-        return ItineraryPlacesResponse(**data)
-
-    async def _generate_place_images(self, destination_city: str, data: Any):
-        image_base_url = "/static"
-        dest_slug = destination_city.lower().replace(" ", "-")
-        output_dir = os.path.join(static_dir(), f"itineraries/{dest_slug}/places")
-        ensure_dir(output_dir)
-
-        image_tasks = []
-        for place in data.get("places", []):
+    def _queue_place_images(self, data: Any) -> ImageJob:
+        """Give place cards image slots and hand generation to the image worker."""
+        requests: List[ImageRequest] = []
+        places = {}
+        for index, place in enumerate(data.get("places", [])):
+            place["image_urls"] = []
             prompts = place.get("photo_prompts", [])[:IMAGE_GENERATION["max_images_per_entity"]]
             if prompts:
-                base_file_name = place.get("place_name", "place").lower().replace(" ", "-")
-                task = async_generate_image_files(
-                    prompts=prompts,
-                    output_dir=output_dir,
-                    base_file_name=base_file_name,
-                )
-                image_tasks.append((place, task))
+                slot = f"p{index}"
+                place["image_slot"] = slot
+                places[slot] = place
+                requests.append(ImageRequest(slot=slot, prompts=prompts))
 
-        # Parallel Execution (assuming less strict rate limit for places or keep consistent with itinerary)
-        # Using parallel here but if ratelimit is global we might need throttle. 
-        # For safety, let's just use gather but keep logic similar to original file for now.
-        if image_tasks:
-            results = await asyncio.gather(*[task for _, task in image_tasks], return_exceptions=True)
-            
-            for i, (place, _) in enumerate(image_tasks):
-                result = results[i]
-                if isinstance(result, Exception):
-                    place["image_urls"] = []
-                else:
-                    files = result
-                    place["image_urls"] = [
-                        f"{image_base_url}/{os.path.relpath(fp, static_dir())}" for fp in files
-                    ]
-        else:
-             for place in data.get("places", []):
-                place["image_urls"] = []
-
-    def _get_places_schema(self):
-        return genai_types.Schema(
-            type=genai_types.Type.OBJECT,
-            required=["destination_city", "places"],
-            properties={
-                "destination_city": genai_types.Schema(type=genai_types.Type.STRING),
-                "places": genai_types.Schema(
-                    type=genai_types.Type.ARRAY,
-                    items=genai_types.Schema(
-                        type=genai_types.Type.OBJECT,
-                        required=["city", "place_name", "speciality", "tips", "photo_prompts"],
-                        properties={
-                            "city": genai_types.Schema(type=genai_types.Type.STRING),
-                            "place_name": genai_types.Schema(type=genai_types.Type.STRING),
-                            "speciality": genai_types.Schema(type=genai_types.Type.STRING),
-                            "tips": genai_types.Schema(
-                                type=genai_types.Type.ARRAY,
-                                items=genai_types.Schema(type=genai_types.Type.STRING),
-                            ),
-                            "photo_prompts": genai_types.Schema(
-                                type=genai_types.Type.ARRAY,
-                                items=genai_types.Schema(type=genai_types.Type.STRING),
-                            ),
-                        },
-                    ),
-                ),
-            },
-        )
+        job = image_jobs.submit(requests)
+        data["image_job_id"] = job.job_id
+        # Slots already in the image store are filled straight away
+        for slot, images in job.images.items():
+            places[slot]["image_urls"] = job.urls(slot)
+            places[slot]["images"] = images
+        return job
@@ -1,37 +1,286 @@
-from typing import Any, List, Optional
-import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 import asyncio
+from pydantic import ValidationError
 from google.genai import types as genai_types
-from engine.ai_core import async_gemini_generate_content, async_generate_image_files
-from schemas.models import ItineraryRequest
-from instructions.schedule import SYSTEM_PROMPT_ITINERARY
-from lib.file_ops import static_dir, ensure_dir
-from settings import MODELS, GEMINI_SETTINGS, IMAGE_GENERATION
+from engine.ai_core import async_gemini_generate_content, async_gemini_generate_content_stream
+from engine.services.image_jobs import ImageJob, ImageRequest, image_jobs
+from schemas.gemini import ITINERARY_DAYS_SCHEMA, ITINERARY_SCHEMA, ITINERARY_SKELETON_SCHEMA
+from schemas.models import (
+    ItineraryRequest,
+    ItineraryDay,
+    ItineraryDaysResponse,
+    ItineraryResponse,
+    ItinerarySkeleton,
+)
+from instructions.schedule import (
+    SYSTEM_PROMPT_ITINERARY,
+    SYSTEM_PROMPT_ITINERARY_DAYS,
+    SYSTEM_PROMPT_ITINERARY_SKELETON,
+)
+from lib.async_ops import SingleFlight
+from lib.fast_json import clone_json
+from lib.json_stream import JsonObjectStream
+from lib.token_usage import budget_scope
+from engine.usage import output_budgets
+from settings import MODELS, GEMINI_SETTINGS, IMAGE_GENERATION, ITINERARY_PARALLEL
+
+# Concurrent requests for the same trip share one generation + image pipeline
+_itinerary_flight = SingleFlight()
+
+# In {"days": [...]} replies a day is complete once closed at depth 2; recovery
+# from cut-off output never keeps a half-written day
+DAYS_RECOVER_DEPTH = 2
+
+
+def itinerary_fingerprint(payload: ItineraryRequest) -> tuple:
+    """Normalize a request so cosmetic differences map to the same trip."""
+    return (
+        " ".join(payload.home_city.split()).casefold(),
+        " ".join(payload.destination_city.split()).casefold(),
+        payload.num_days,
+        tuple(sorted({i.strip().casefold() for i in payload.interests if i.strip()})),
+    )
+
 
 class PlannerService:
     async def generate_itinerary(self, payload: ItineraryRequest) -> Any:
         print(f"SERVER_LOG: Received itinerary request for {payload.destination_city} from {payload.home_city}")
+        # Requests with a token budget never join another request's generation
+        key = (itinerary_fingerprint(payload), budget_scope())
+        if key in _itinerary_flight:
+            print(f"SERVER_LOG: Joining in-flight itinerary generation for {payload.destination_city}")
+        data = await _itinerary_flight.do(key, lambda: self._generate_itinerary(payload))
+        return clone_json(data)
+
+    async def _generate_itinerary(self, payload: ItineraryRequest) -> Any:
+        skeleton = await self._generate_skeleton(payload) if self._use_day_groups(payload) else None
+        if skeleton is not None:
+            print(f"SERVER_LOG: Generating {payload.num_days} days in groups from the skeleton...")
+            data = self._default_response(payload)
+            data["overall_tips"] = skeleton["overall_tips"]
+            async for days in self._iter_day_groups(payload, skeleton):
+                data["days"].extend(days)
+            data["days"].sort(key=lambda d: d["day"])
+        else:
+            print("SERVER_LOG: Calling Gemini API for itinerary generation...")
+            data = await async_gemini_generate_content(
+                **self._generation_args(payload),
+                default_response=self._default_response(payload),
+                endpoint="itinerary",
+                response_model=ItineraryResponse,
+                recover_depth=DAYS_RECOVER_DEPTH,
+            )
+            data["days"].extend(await self._continue_days(payload, data))
+            data["days"].sort(key=lambda d: d["day"])
+        print("SERVER_LOG: Gemini response received. Processing data...")
+
+        # Images are generated in the background; clients follow data["image_job_id"]
+        self._queue_images(data)
         
-        system_prompt = SYSTEM_PROMPT_ITINERARY
+        return data
+
+    async def stream_itinerary(self, payload: ItineraryRequest) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Yield (event, data) pairs: "meta" first, one "day" per completed day as
+        Gemini streams it, then "tips", "images" with the background image job,
+        one "image" per filled entity slot and finally "done" with the full
+        itinerary.
+        """
+        print(f"SERVER_LOG: Streaming itinerary for {payload.destination_city} from {payload.home_city}")
+        data = self._default_response(payload)
+        yield "meta", {
+            "home_city": payload.home_city,
+            "destination_city": payload.destination_city,
+            "num_days": payload.num_days,
+        }
+
+        skeleton = await self._generate_skeleton(payload) if self._use_day_groups(payload) else None
+        if skeleton is not None:
+            # Day groups finish in any order; each "day" event carries its day number
+            data["overall_tips"] = skeleton["overall_tips"]
+            async for days in self._iter_day_groups(payload, skeleton):
+                for day in days:
+                    data["days"].append(day)
+                    yield "day", day
+            data["days"].sort(key=lambda d: d["day"])
+        else:
+            parser = JsonObjectStream("days")
+            async for chunk in async_gemini_generate_content_stream(
+                **self._generation_args(payload), endpoint="itinerary"
+            ):
+                for kind, value in parser.feed(chunk):
+                    if kind == "item":
+                        try:
+                            day = ItineraryDay(**value).model_dump()
+                        except ValidationError as e:
+                            print(f"SERVER_LOG: Skipping malformed streamed day: {e}")
+                            continue
+                        data["days"].append(day)
+                        yield "day", day
+                    elif value[0] == "overall_tips" and isinstance(value[1], list):
+                        data["overall_tips"] = value[1]
+            # The stream parser only ever hands over complete days
+            for day in await self._continue_days(payload, data):
+                data["days"].append(day)
+                yield "day", day
+            data["days"].sort(key=lambda d: d["day"])
+
+        yield "tips", {"overall_tips": data["overall_tips"]}
+
+        job = self._queue_images(data)
+        yield "images", {"image_job_id": job.job_id, "total": job.total}
+
+        slots = {}
+        for day_index, day in enumerate(data["days"]):
+            for entity_index, entity in enumerate(day["entities"]):
+                if entity.get("image_slot"):
+                    slots[entity["image_slot"]] = (day_index, entity_index, entity)
+
+        async for event, update in image_jobs.subscribe(job.job_id):
+            if event != "image" or update["slot"] not in slots:
+                continue
+            day_index, entity_index, entity = slots[update["slot"]]
+            entity["image_urls"] = update["image_urls"]
+            entity["images"] = update["images"]
+            yield "image", {
+                "day": data["days"][day_index]["day"],
+                "day_index": day_index,
+                "entity_index": entity_index,
+                "slot": update["slot"],
+                "image_urls": update["image_urls"],
+                "images": update["images"],
+            }
+
+        yield "done", data
+
+    def _use_day_groups(self, payload: ItineraryRequest) -> bool:
+        return ITINERARY_PARALLEL["enabled"] and payload.num_days >= ITINERARY_PARALLEL["min_days"]
+
+    async def _generate_skeleton(self, payload: ItineraryRequest) -> Optional[dict]:
+        """Cheap outline (theme and areas per day); None when unusable, so callers fall back to one call."""
+        plan = output_budgets.plan("itinerary_skeleton", payload.num_days)
+        skeleton = await async_gemini_generate_content(
+            model=MODELS["gemini"]["skeleton"],
+            contents=self._user_contents(payload, "Outline the trip day by day as per schema."),
+            system_prompt=SYSTEM_PROMPT_ITINERARY_SKELETON,
+            response_schema=ITINERARY_SKELETON_SCHEMA.schema,
+            temperature=GEMINI_SETTINGS["temperature"]["text"],
+            top_p=GEMINI_SETTINGS["top_p"]["text"],
+            max_output_tokens=plan.max_output_tokens,
+            thinking_budget=plan.thinking_budget,
+            on_usage=plan.observe,
+            timeout=GEMINI_SETTINGS["timeout"]["text"],
+            endpoint="itinerary_skeleton",
+            response_model=ItinerarySkeleton,
+        )
+        if not skeleton or len(skeleton["days"]) != payload.num_days:
+            print("SERVER_LOG: Itinerary skeleton unusable; generating in one call")
+            return None
+        skeleton["days"].sort(key=lambda d: d["day"])
+        for number, day in enumerate(skeleton["days"], start=1):
+            day["day"] = number
+        return skeleton
+
+    async def _iter_day_groups(self, payload: ItineraryRequest, skeleton: dict) -> AsyncIterator[List[dict]]:
+        """Generate every group of days concurrently and yield each group's days as it completes."""
+        size = ITINERARY_PARALLEL["days_per_group"]
+        groups = [skeleton["days"][i : i + size] for i in range(0, len(skeleton["days"]), size)]
+        tasks = [asyncio.create_task(self._generate_day_group(payload, skeleton, group)) for group in groups]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Reader gone (e.g. SSE disconnect): unfinished groups stop their model calls
+            for task in tasks:
+                task.cancel()
+
+    async def _generate_day_group(self, payload: ItineraryRequest, skeleton: dict, group: List[dict]) -> List[dict]:
+        outline = "\n".join(
+            f"Day {d['day']}: {d['theme']} ({', '.join(d['areas'])})" for d in skeleton["days"]
+        )
+        written = await self._write_days(payload, outline, [d["day"] for d in group])
+        days = []
+        for planned in group:
+            day = written.get(planned["day"])
+            if day is None:
+                # Keep the trip's shape; the outline stands in for the missing day
+                print(f"SERVER_LOG: Day {planned['day']} missing from its group; using the skeleton outline")
+                day = ItineraryDay(day=planned["day"], summary=planned["theme"], entities=[]).model_dump()
+            days.append(day)
+        return days
+
+    async def _continue_days(self, payload: ItineraryRequest, data: dict) -> List[dict]:
+        """Write only the days a cut-off reply is missing, outlined by the days it did finish."""
+        present = {d["day"] for d in data["days"]}
+        missing = [n for n in range(1, payload.num_days + 1) if n not in present]
+        if not present or not missing:
+            return []
+        print(f"SERVER_LOG: Itinerary reply stopped early; continuing with days {missing}")
+        outline = "\n".join(f"Day {d['day']}: {d['summary']}" for d in data["days"])
+        written = await self._write_days(payload, outline, missing)
+        return [written[n] for n in missing if n in written]
+
+    async def _write_days(self, payload: ItineraryRequest, outline: str, numbers: List[int]) -> Dict[int, dict]:
+        """Ask for just `numbers` of an outlined trip; returns the days that came back complete, by number."""
+        if len(numbers) == 1:
+            days_wanted = f"day {numbers[0]}"
+        elif numbers == list(range(numbers[0], numbers[-1] + 1)):
+            days_wanted = f"days {numbers[0]} to {numbers[-1]}"
+        else:
+            days_wanted = "days " + ", ".join(str(n) for n in numbers)
+        instruction = f"Trip outline:\n{outline}\nWrite {days_wanted} only as per schema."
+        plan = output_budgets.plan("itinerary_days", len(numbers))
+        data = await async_gemini_generate_content(
+            model=MODELS["gemini"]["text"],
+            contents=self._user_contents(payload, instruction),
+            system_prompt=SYSTEM_PROMPT_ITINERARY_DAYS,
+            response_schema=ITINERARY_DAYS_SCHEMA.schema,
+            temperature=GEMINI_SETTINGS["temperature"]["text"],
+            top_p=GEMINI_SETTINGS["top_p"]["text"],
+            max_output_tokens=plan.max_output_tokens,
+            thinking_budget=plan.thinking_budget,
+            on_usage=plan.observe,
+            timeout=GEMINI_SETTINGS["timeout"]["text"],
+            endpoint="itinerary_days",
+            response_model=ItineraryDaysResponse,
+            recover_depth=DAYS_RECOVER_DEPTH,
+        )
+        return {d["day"]: d for d in (data or {}).get("days", []) if d["day"] in numbers}
+
+    def _user_contents(self, payload: ItineraryRequest, instruction: str) -> List[genai_types.Content]:
         user_prompt = (
             f"Home: {payload.home_city}\n"
             f"Destination: {payload.destination_city}\n"
             f"Days: {payload.num_days}\n"
             f"Interests: {', '.join(payload.interests) if payload.interests else 'general'}\n"
-            "Generate an end-to-end itinerary as per schema."
+            f"{instruction}"
         )
-
-        contents = [
+        return [
             genai_types.Content(
                 role="user",
                 parts=[genai_types.Part.from_text(text=user_prompt)],
             )
         ]
 
-        # Structured schema for itinerary (reused from original)
-        response_schema = self._get_itinerary_schema()
-        
-        default_response = {
+    def _generation_args(self, payload: ItineraryRequest) -> dict:
+        contents = self._user_contents(payload, "Generate an end-to-end itinerary as per schema.")
+        plan = output_budgets.plan("itinerary", payload.num_days)
+
+        return {
+            "model": MODELS["gemini"]["text"],
+            "contents": contents,
+            "system_prompt": SYSTEM_PROMPT_ITINERARY,
+            "response_schema": ITINERARY_SCHEMA.schema,
+            "temperature": GEMINI_SETTINGS["temperature"]["text"],
+            "top_p": GEMINI_SETTINGS["top_p"]["text"],
+            "max_output_tokens": plan.max_output_tokens,
+            "thinking_budget": plan.thinking_budget,
+            "on_usage": plan.observe,
+            "timeout": GEMINI_SETTINGS["timeout"]["text"],
+        }
+
+    def _default_response(self, payload: ItineraryRequest) -> dict:
+        return {
             "home_city": payload.home_city,
             "destination_city": payload.destination_city,
             "num_days": payload.num_days,
@@ -39,130 +288,32 @@ class PlannerService:
             "overall_tips": [],
         }
 
-        print("SERVER_LOG: Calling Gemini API for itinerary generation...")
-        
-        data = await async_gemini_generate_content(
-            model=MODELS["gemini"]["text"],
-            contents=contents,
-            system_prompt=system_prompt,
-            response_schema=response_schema,
-            temperature=GEMINI_SETTINGS["temperature"]["text"],
-            top_p=GEMINI_SETTINGS["top_p"]["text"],
-            max_output_tokens=GEMINI_SETTINGS["max_output_tokens"]["text"],
-            timeout=GEMINI_SETTINGS["timeout"]["text"],
-            default_response=default_response,
-        )
-        print("SERVER_LOG: Gemini response received. Processing data...")
-
-        # Image Generation Logic
-        await self._generate_images(payload.destination_city, data)
-        
-        return data
+    def _queue_images(self, data: Any) -> ImageJob:
+        """Give entities image slots and hand generation to the image worker."""
+        requests: List[ImageRequest] = []
+        entities = {}
+        for day_index, day in enumerate(data.get("days", [])):
+            for entity_index, entity in enumerate(day.get("entities", [])):
+                prompts = entity.get("photo_prompts", [])[:IMAGE_GENERATION["max_images_per_entity"]]
+                if prompts and len(requests) < IMAGE_GENERATION["max_images_per_itinerary"]:
+                    slot = f"d{day_index}e{entity_index}"
+                    entity["image_slot"] = slot
+                    entities[slot] = entity
+                    requests.append(ImageRequest(slot=slot, prompts=prompts))
 
-    async def _generate_images(self, destination_city: str, data: Any):
-        image_base_url = "/static"
-        dest_slug = destination_city.lower().replace(" ", "-")
-        output_dir = os.path.join(static_dir(), f"itineraries/{dest_slug}")
-        ensure_dir(output_dir)
+        job = image_jobs.submit(requests)
+        data["image_job_id"] = job.job_id
+        # Slots already in the image store are filled straight away
+        for slot, images in job.images.items():
+            entities[slot]["image_urls"] = job.urls(slot)
+            entities[slot]["images"] = images
 
-        image_tasks = []
-        for day in data.get("days", []):
-            for entity in day.get("entities", []):
-                prompts = entity.get("photo_prompts", [])[:IMAGE_GENERATION["max_images_per_entity"]]
-                if prompts:
-                    base_file_name = entity.get("name", "entity").lower().replace(" ", "-")
-                    # We create the coroutine but don't schedule it yet
-                    task = async_generate_image_files(
-                        prompts=prompts,
-                        output_dir=output_dir,
-                        base_file_name=base_file_name,
-                    )
-                    image_tasks.append((entity, task))
-
-        # Throttling Logic
-        MAX_TOTAL_IMAGES = 3
-        image_tasks = image_tasks[:MAX_TOTAL_IMAGES]
-        
-        print(f"SERVER_LOG: Processing {len(image_tasks)} image tasks sequentially (throttled)...")
-
-        for i, (entity, task) in enumerate(image_tasks):
-            try:
-                if i > 0:
-                    print("SERVER_LOG: Waiting 5s before next image generation...")
-                    await asyncio.sleep(5)
-                
-                print(f"SERVER_LOG: Generating image for {entity.get('name', 'entity')}...")
-                files = await task
-                
-                if files:
-                    entity["image_urls"] = [
-                         f"{image_base_url}/{os.path.relpath(fp, static_dir())}" for fp in files
-                    ]
-                    print(f"SERVER_LOG: Image generated for {entity.get('name')}")
-                else:
-                     entity["image_urls"] = []
-            except Exception as e:
-                print(f"SERVER_LOG: Failed to generate image for {entity.get('name')}: {e}")
-                entity["image_urls"] = []
-        
         # Ensure entities without images have empty list
         self._ensure_empty_images(data)
+        return job
 
     def _ensure_empty_images(self, data: Any):
         for day in data.get("days", []):
             for entity in day.get("entities", []):
                 if "image_urls" not in entity:
                     entity["image_urls"] = []
-
-    def _get_itinerary_schema(self):
-        return genai_types.Schema(
-            type=genai_types.Type.OBJECT,
-            required=["home_city", "destination_city", "num_days", "days"],
-            properties={
-                "home_city": genai_types.Schema(type=genai_types.Type.STRING),
-                "destination_city": genai_types.Schema(type=genai_types.Type.STRING),
-                "num_days": genai_types.Schema(type=genai_types.Type.INTEGER),
-                "days": genai_types.Schema(
-                    type=genai_types.Type.ARRAY,
-                    items=genai_types.Schema(
-                        type=genai_types.Type.OBJECT,
-                        required=["day", "summary", "entities"],
-                        properties={
-                            "day": genai_types.Schema(type=genai_types.Type.INTEGER),
-                            "summary": genai_types.Schema(type=genai_types.Type.STRING),
-                            "route_info": genai_types.Schema(type=genai_types.Type.STRING),
-                            "entities": genai_types.Schema(
-                                type=genai_types.Type.ARRAY,
-                                items=genai_types.Schema(
-                                    type=genai_types.Type.OBJECT,
-                                    required=["name", "speciality", "places_to_visit", "photo_prompts"],
-                                    properties={
-                                        "name": genai_types.Schema(type=genai_types.Type.STRING),
-                                        "speciality": genai_types.Schema(type=genai_types.Type.STRING),
-                                        "places_to_visit": genai_types.Schema(
-                                            type=genai_types.Type.ARRAY,
-                                            items=genai_types.Schema(
-                                                type=genai_types.Type.OBJECT,
-                                                required=["name", "description"],
-                                                properties={
-                                                    "name": genai_types.Schema(type=genai_types.Type.STRING),
-                                                    "description": genai_types.Schema(type=genai_types.Type.STRING),
-                                                },
-                                            ),
-                                        ),
-                                        "photo_prompts": genai_types.Schema(
-                                            type=genai_types.Type.ARRAY,
-                                            items=genai_types.Schema(type=genai_types.Type.STRING),
-                                        ),
-                                    },
-                                ),
-                            ),
-                        },
-                    ),
-                ),
-                "overall_tips": genai_types.Schema(
-                    type=genai_types.Type.ARRAY,
-                    items=genai_types.Schema(type=genai_types.Type.STRING),
-                ),
-            },
-        )
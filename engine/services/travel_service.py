@@ -1,12 +1,51 @@
-from typing import Any
+from typing import Any, Union
 from schemas.models import TravelOptionsRequest, TravelOptionsResponse
+from engine.cache import search_result_cache, search_result_ttl
 from engine.search_core import PerplexityService
 from instructions.logistics import SYSTEM_PROMPT_TRAVEL_OPTIONS
-from settings import MODELS, PERPLEXITY_SETTINGS
-import json
+from lib.cache import Uncached, request_fingerprint
+from lib.structured_output import parse_structured
+from settings import MODELS, PERPLEXITY_SETTINGS, SEARCH_RESULT_CACHE
 
 class TravelService:
-    async def get_travel_options(self, payload: TravelOptionsRequest) -> TravelOptionsResponse:
+    async def get_travel_options(self, payload: TravelOptionsRequest) -> Any:
+        if SEARCH_RESULT_CACHE["enabled"]:
+            key = request_fingerprint(
+                kind="travel_options",
+                model=MODELS["perplexity"]["text"],
+                system_prompt=SYSTEM_PROMPT_TRAVEL_OPTIONS,
+                origin=payload.origin_city.strip().lower(),
+                destination=payload.destination_city.strip().lower(),
+                recency_filter=payload.recency_filter,
+            )
+            data = await search_result_cache.get_or_compute(
+                key,
+                lambda: self._fetch_travel_options(payload),
+                fresh_ttl=search_result_ttl(payload.recency_filter),
+                max_stale=SEARCH_RESULT_CACHE["max_stale_seconds"],
+                namespace="travel_options",
+            )
+        else:
+            data = await self._fetch_travel_options(payload)
+            if isinstance(data, Uncached):
+                data = data.value
+
+        if data is None:
+            # Fallback
+            data = {
+                "origin_city": payload.origin_city,
+                "destination_city": payload.destination_city,
+                "modes": [],
+            }
+        # Fetched results are normalized through the model; the fallback is valid as built
+        return data
+
+    async def _fetch_travel_options(self, payload: TravelOptionsRequest) -> Union[dict, Uncached, None]:
+        """
+        Search and normalize travel options; None when Perplexity gave no
+        usable answer, Uncached when it was cut off or came from a
+        budget-downgraded call.
+        """
         user_prompt = (
             f"Origin: {payload.origin_city}\n"
             f"Destination: {payload.destination_city}\n"
@@ -23,6 +62,8 @@ class TravelService:
             max_tokens=PERPLEXITY_SETTINGS["max_tokens"],
             web_search_options=PERPLEXITY_SETTINGS["web_search_options"],
             recency_filter=payload.recency_filter,
+            endpoint="travel_options",
+            use_cache=False,  # cached above as a parsed result
         )
 
         # Extract assistant message content
@@ -32,19 +73,11 @@ class TravelService:
             msg = choices[0].get("message", {})
             text = msg.get("content", "")
 
-        # Safe JSON parsing
-        data = self._parse_json(text)
-
-        if data is None:
-            # Fallback
-            data = {
-                "origin": payload.origin_city,
-                "destination": payload.destination_city,
-                "travel_options": {
-                    "train": [], "bus": [], "car_taxi": [], "car_transport": [], 
-                    "part_load_transport": [], "flight": []
-                }
-            }
+        # Tolerates fences, prose and cut-off replies; keeps complete options only
+        parsed = parse_structured(text, recover=True, max_depth=4)
+        data = parsed.value if parsed else None
+        if not isinstance(data, dict):
+            return None
 
         # Normalize data (ensure top-level fields)
         data.setdefault("origin", payload.origin_city)
@@ -60,22 +93,14 @@ class TravelService:
             data["modes"] = modes_list
             del data["travel_options"]
 
+        # A reply cut off inside a mode can leave it without options
+        data["modes"] = [m for m in data.get("modes", []) if isinstance(m, dict) and m.get("options")]
+
         # Final field mapping
         data["origin_city"] = data.pop("origin", payload.origin_city)
         data["destination_city"] = data.pop("destination", payload.destination_city)
 
-        return TravelOptionsResponse(**data)
-
-    def _parse_json(self, text: str) -> Any:
-        try:
-            return json.loads(text)
-        except json.JSONDecodeError:
-            # Try finding { } block
-            start_idx = text.find('{')
-            end_idx = text.rfind('}') + 1
-            if start_idx != -1 and end_idx > start_idx:
-                try:
-                    return json.loads(text[start_idx:end_idx])
-                except:
-                    pass
-        return None
+        data = TravelOptionsResponse(**data).model_dump(mode="json")
+        if parsed.truncated or result.get("budget_downgraded"):
+            return Uncached(data)
+        return data
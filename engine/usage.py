@@ -0,0 +1,139 @@
+import json
+from typing import Any, Optional, Tuple
+
+from lib.output_budget import OutputBudgeter
+from lib.token_usage import TokenBudget, TokenBudgetExceeded, TokenUsageTracker, current_token_budget, token_budget
+from engine.metrics import tokens_used
+from settings import OUTPUT_BUDGETS, TOKEN_BUDGET, TOKEN_USAGE
+
+
+token_usage = TokenUsageTracker(
+    bucket_seconds=TOKEN_USAGE["bucket_seconds"],
+    max_window_seconds=TOKEN_USAGE["max_window_seconds"],
+)
+
+# Sizes max_output_tokens/thinking budgets per schema and learns from usage
+output_budgets = OutputBudgeter(OUTPUT_BUDGETS)
+
+
+def _record(
+    endpoint: str,
+    provider: str,
+    model: str,
+    prompt_tokens: int,
+    output_tokens: int,
+    thinking_tokens: int,
+    total_tokens: Optional[int],
+) -> None:
+    token_usage.record(endpoint, provider, model, prompt_tokens, output_tokens, thinking_tokens, total_tokens)
+    for kind, count in (("prompt", prompt_tokens), ("output", output_tokens), ("thinking", thinking_tokens)):
+        if count:
+            tokens_used.inc(count, provider=provider, model=model, endpoint=endpoint, kind=kind)
+    budget = current_token_budget()
+    if budget is not None:
+        budget.charge(total_tokens or prompt_tokens + output_tokens + thinking_tokens)
+
+
+def record_gemini_usage(endpoint: str, model: str, usage_metadata: Any) -> None:
+    """Record a Gemini response's usage_metadata and charge it to the request's budget."""
+    if usage_metadata is None:
+        return
+    _record(
+        endpoint,
+        "gemini",
+        model,
+        usage_metadata.prompt_token_count or 0,
+        usage_metadata.candidates_token_count or 0,
+        usage_metadata.thoughts_token_count or 0,
+        usage_metadata.total_token_count,
+    )
+    # Already part of prompt_token_count; tracked to show what the context cache saves
+    cached_tokens = getattr(usage_metadata, "cached_content_token_count", None)
+    if cached_tokens:
+        tokens_used.inc(cached_tokens, provider="gemini", model=model, endpoint=endpoint, kind="cached")
+
+
+def record_perplexity_usage(endpoint: str, model: str, usage: Optional[dict]) -> None:
+    """Record a Perplexity response's `usage` block and charge it to the request's budget."""
+    if not usage:
+        return
+    _record(
+        endpoint,
+        "perplexity",
+        model,
+        usage.get("prompt_tokens") or 0,
+        usage.get("completion_tokens") or 0,
+        usage.get("reasoning_tokens") or 0,
+        usage.get("total_tokens"),
+    )
+
+
+def apply_token_budget(model: str, prompt_tokens: int, max_output_tokens: int) -> Tuple[str, int]:
+    """
+    Fit a call into the current request's token budget, if it has one.
+
+    Returns the (model, max_output_tokens) to use, downgraded when the budget
+    allows it, or raises TokenBudgetExceeded.
+    """
+    budget = current_token_budget()
+    if budget is None:
+        return model, max_output_tokens
+    needed = prompt_tokens + max_output_tokens
+    if needed <= budget.remaining:
+        return model, max_output_tokens
+    if budget.mode == TokenBudget.DOWNGRADE:
+        allowed_output = budget.remaining - prompt_tokens
+        if allowed_output >= TOKEN_BUDGET["min_output_tokens"]:
+            downgraded = TOKEN_BUDGET["downgrades"].get(model, model)
+            print(
+                f"SERVER_LOG: Token budget downgrade {model} -> {downgraded}, "
+                f"max_output_tokens {max_output_tokens} -> {allowed_output}"
+            )
+            return downgraded, allowed_output
+    raise TokenBudgetExceeded(budget.limit, budget.spent, needed)
+
+
+class TokenBudgetMiddleware:
+    """
+    ASGI middleware that gives each HTTP request its own TokenBudget.
+
+    The limit comes from the budget header, else TOKEN_BUDGET["default_limit"]
+    (None disables budgets). Streaming bodies and background tasks run inside
+    the same context, so they draw on the same budget.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self._limit_header = TOKEN_BUDGET["header"].lower().encode("latin-1")
+        self._mode_header = TOKEN_BUDGET["mode_header"].lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        limit = TOKEN_BUDGET["default_limit"]
+        mode = TOKEN_BUDGET["default_mode"]
+        try:
+            if self._limit_header in headers:
+                limit = int(headers[self._limit_header].decode("latin-1"))
+            if self._mode_header in headers:
+                mode = headers[self._mode_header].decode("latin-1").strip().lower()
+            budget = TokenBudget(limit, mode) if limit else None
+        except ValueError as e:
+            await _send_json(send, 400, {"detail": f"Invalid token budget: {e}"})
+            return
+
+        with token_budget(budget):
+            await self.app(scope, receive, send)
+
+
+async def _send_json(send, status: int, payload: dict) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -3,7 +3,9 @@ import concurrent.futures
 import httpx
 import asyncio
 import functools
-from typing import Any, Optional
+import importlib.util
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple, Union
 import logging
 import requests
 from urllib.parse import quote, urlparse, urlunparse
@@ -38,26 +40,102 @@ async def forcefully_async(fn: Any, *args: Any, threadpool=default_threadpool, *
 class AsyncRequests:
     """
     Drop in async replacement for requests library.
+
+    Requests share one pooled httpx.AsyncClient, except for hosts given their
+    own limits in `configure(hosts=...)`, which get a dedicated client so a
+    busy upstream cannot starve the others of connections.
     """
     _client: Optional[httpx.AsyncClient] = None
+    _host_clients: Dict[str, httpx.AsyncClient] = {}
+    _config: Dict[str, Any] = {
+        "timeout": 30.0,
+        "connect_timeout": 10.0,
+        "http2": True,
+        "max_connections": 100,
+        "max_keepalive_connections": 20,
+        "keepalive_expiry": 30.0,
+        "hosts": {},
+    }
+
+    @classmethod
+    def configure(cls, **config: Any) -> None:
+        """
+        Set pool options for clients created from now on (see `_config` for keys).
+        `hosts` maps a hostname to overrides of the pool limits for that host.
+        """
+        unknown = set(config) - set(cls._config)
+        if unknown:
+            raise ValueError(f"Unknown AsyncRequests options: {', '.join(sorted(unknown))}")
+        cls._config = {**cls._config, **config}
+
+    @staticmethod
+    def http2_available() -> bool:
+        """httpx needs the optional `h2` package to speak HTTP/2."""
+        return importlib.util.find_spec("h2") is not None
 
     @classmethod
-    def get_client(cls) -> httpx.AsyncClient:
-        """Get or create the singleton httpx.AsyncClient instance."""
+    def _build_client(cls, **overrides: Any) -> httpx.AsyncClient:
+        config = {**cls._config, **overrides}
+        http2 = config["http2"]
+        if http2 and not cls.http2_available():
+            logger.warning("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout=config["timeout"], connect=config["connect_timeout"]),
+            limits=httpx.Limits(
+                max_connections=config["max_connections"],
+                max_keepalive_connections=config["max_keepalive_connections"],
+                keepalive_expiry=config["keepalive_expiry"],
+            ),
+            http2=http2,
+            follow_redirects=True,
+        )
+
+    @classmethod
+    def get_client(cls, host: Optional[str] = None) -> httpx.AsyncClient:
+        """Get or create the client for `host`: its own pool if configured, else the shared one."""
+        host_limits = cls._config["hosts"].get(host) if host else None
+        if host_limits is not None:
+            if host not in cls._host_clients:
+                cls._host_clients[host] = cls._build_client(**host_limits)
+            return cls._host_clients[host]
         if cls._client is None:
-            cls._client = httpx.AsyncClient(
-                timeout=httpx.Timeout(timeout=30.0, connect=10.0),
-                http2=True,
-                follow_redirects=True,
-            )
+            cls._client = cls._build_client()
         return cls._client
 
+    @classmethod
+    def client_for(cls, url: str) -> httpx.AsyncClient:
+        return cls.get_client(urlparse(url).hostname)
+
+    @classmethod
+    async def prewarm(cls, urls: Iterable[str], timeout: float = 3.0) -> Dict[str, str]:
+        """
+        Open a connection to each URL ahead of the first real request.
+
+        Returns the negotiated HTTP version per URL (or the error), so startup
+        can confirm that HTTP/2 multiplexing is actually in use. Each HEAD gets
+        its own short `timeout` rather than the pool's request timeouts.
+        """
+        async def _warm(url: str) -> str:
+            try:
+                response = await cls.client_for(url).head(url, timeout=timeout)
+                return response.http_version
+            except Exception as e:
+                return f"error: {e!r}"
+
+        results = await asyncio.gather(*[_warm(url) for url in urls])
+        return dict(zip(urls, results))
+
     @classmethod
     async def close(cls) -> None:
-        """Close the client connection"""
+        """Close every client connection pool"""
+        clients = list(cls._host_clients.values())
         if cls._client is not None:
-            await cls._client.aclose()
-            cls._client = None
+            clients.append(cls._client)
+        cls._client = None
+        cls._host_clients = {}
+        for client in clients:
+            await client.aclose()
 
     @classmethod
     def _encode_url(cls, url: str) -> str:
@@ -89,7 +167,7 @@ class AsyncRequests:
         """Async GET request."""
         encoded_url = cls._encode_url(url)
         try:
-            return await cls.get_client().get(encoded_url, **kwargs)
+            return await cls.client_for(encoded_url).get(encoded_url, **kwargs)
         except Exception as e:
             logger.error(f"Async GET request failed for {encoded_url}: {e}. Forcefully retrying...")
             try:
@@ -103,7 +181,7 @@ class AsyncRequests:
         """Async POST request."""
         encoded_url = cls._encode_url(url)
         try:
-            return await cls.get_client().post(encoded_url, **kwargs)
+            return await cls.client_for(encoded_url).post(encoded_url, **kwargs)
         except Exception as e:
             logger.error(f"Async POST request failed for {encoded_url}: {e}. Forcefully retrying...")
             try:
@@ -117,7 +195,7 @@ class AsyncRequests:
         """Async PUT request."""
         encoded_url = cls._encode_url(url)
         try:
-            return await cls.get_client().put(encoded_url, **kwargs)
+            return await cls.client_for(encoded_url).put(encoded_url, **kwargs)
         except Exception as e:
             logger.error(f"Async PUT request failed for {encoded_url}: {e}. Forcefully retrying...")
             try:
@@ -131,7 +209,7 @@ class AsyncRequests:
         """Async PATCH request."""
         encoded_url = cls._encode_url(url)
         try:
-            return await cls.get_client().patch(encoded_url, **kwargs)
+            return await cls.client_for(encoded_url).patch(encoded_url, **kwargs)
         except Exception as e:
             logger.error(f"Async PATCH request failed for {encoded_url}: {e}. Forcefully retrying...")
             try:
@@ -145,7 +223,7 @@ class AsyncRequests:
         """Async DELETE request."""
         encoded_url = cls._encode_url(url)
         try:
-            return await cls.get_client().delete(encoded_url, **kwargs)
+            return await cls.client_for(encoded_url).delete(encoded_url, **kwargs)
         except Exception as e:
             logger.error(f"Async DELETE request failed for {encoded_url}: {e}. Forcefully retrying...")
             try:
@@ -159,7 +237,7 @@ class AsyncRequests:
         """Async HEAD request."""
         encoded_url = cls._encode_url(url)
         try:
-            return await cls.get_client().head(encoded_url, **kwargs)
+            return await cls.client_for(encoded_url).head(encoded_url, **kwargs)
         except Exception as e:
             logger.error(f"Async HEAD request failed for {encoded_url}: {e}. Forcefully retrying...")
             try:
@@ -173,7 +251,7 @@ class AsyncRequests:
         """Async OPTIONS request."""
         encoded_url = cls._encode_url(url)
         try:
-            return await cls.get_client().options(encoded_url, **kwargs)
+            return await cls.client_for(encoded_url).options(encoded_url, **kwargs)
         except Exception as e:
             logger.error(f"Async OPTIONS request failed for {encoded_url}: {e}. Forcefully retrying...")
             try:
@@ -187,7 +265,7 @@ class AsyncRequests:
         """Generic async request method."""
         encoded_url = cls._encode_url(url)
         try:
-            return await cls.get_client().request(method, encoded_url, **kwargs)
+            return await cls.client_for(encoded_url).request(method, encoded_url, **kwargs)
         except Exception as e:
             logger.error(f"{method.upper()} request failed for {encoded_url}: {e}")
             try:
@@ -196,6 +274,80 @@ class AsyncRequests:
                 logger.error(f"{method.upper()} request failed for {encoded_url}: {e}")
                 raise
 
+async def iter_batch_requests(
+    requests_data: list,
+    max_concurrent: int = 10,
+    max_per_host: Optional[int] = None,
+    host_limits: Optional[Dict[str, int]] = None,
+    deadline: Optional[float] = None,
+) -> AsyncIterator[Tuple[int, Union[httpx.Response, BaseException]]]:
+    """
+    Execute HTTP requests concurrently and yield `(index, response)` as each one completes.
+
+    Args:
+        requests_data: List of dictionaries with 'method', 'url', and optional 'kwargs'
+        max_concurrent: Maximum number of requests in flight overall
+        max_per_host: Maximum number of requests in flight to any single host
+        host_limits: Per-hostname overrides of max_per_host
+        deadline: Seconds the whole batch may take; requests still running then
+            are cancelled and yielded with an asyncio.TimeoutError
+
+    Failed requests are yielded with their exception instead of a response.
+    Leaving the loop early cancels every request that has not finished.
+
+    Example:
+        async for index, response in iter_batch_requests(requests_data, max_per_host=4, deadline=20):
+            if isinstance(response, httpx.Response):
+                handle(index, response)
+    """
+    overall = asyncio.Semaphore(max_concurrent)
+    host_slots: Dict[str, asyncio.Semaphore] = {}
+
+    def slots_for(host: str) -> Optional[asyncio.Semaphore]:
+        limit = (host_limits or {}).get(host, max_per_host)
+        if not limit:
+            return None
+        if host not in host_slots:
+            host_slots[host] = asyncio.Semaphore(limit)
+        return host_slots[host]
+
+    async def make_request(request_data):
+        method = request_data['method'].upper()
+        url = request_data['url']
+        kwargs = request_data.get('kwargs', {})
+        per_host = slots_for(urlparse(url).hostname or "")
+        if per_host is not None:
+            async with per_host, overall:
+                return await AsyncRequests.request(method, url, **kwargs)
+        async with overall:
+            return await AsyncRequests.request(method, url, **kwargs)
+
+    pending = {
+        asyncio.ensure_future(make_request(req_data)): index
+        for index, req_data in enumerate(requests_data)
+    }
+    give_up_at = time.monotonic() + deadline if deadline is not None else None
+    try:
+        while pending:
+            timeout = None
+            if give_up_at is not None:
+                timeout = max(give_up_at - time.monotonic(), 0)
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.warning(f"Batch deadline of {deadline}s hit; cancelling {len(pending)} requests")
+                for task, index in sorted(pending.items(), key=lambda item: item[1]):
+                    task.cancel()
+                    yield index, asyncio.TimeoutError(f"Batch deadline of {deadline}s exceeded")
+                pending.clear()
+                break
+            for task in done:
+                index = pending.pop(task)
+                yield index, task.exception() or task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
 async def async_batch_requests(requests_data: list, max_concurrent: int = 10) -> list:
     """
     Execute multiple HTTP requests concurrently with a limit on concurrent requests.
@@ -213,19 +365,58 @@ async def async_batch_requests(requests_data: list, max_concurrent: int = 10) ->
             {'method': 'POST', 'url': 'https://api.example.com/2', 'kwargs': {'json': {'key': 'value'}}},
         ]
     """
-    semaphore = asyncio.Semaphore(max_concurrent)
-    
-    async def make_request(request_data):
-        async with semaphore:
-            method = request_data['method'].upper()
-            url = request_data['url']
-            kwargs = request_data.get('kwargs', {})
-            
-            return await AsyncRequests.request(method, url, **kwargs)
-    
-    tasks = [make_request(req_data) for req_data in requests_data]
-    return await asyncio.gather(*tasks, return_exceptions=True)
+    results: list = [None] * len(requests_data)
+    async for index, response in iter_batch_requests(requests_data, max_concurrent=max_concurrent):
+        results[index] = response
+    return results
+
+
+class SingleFlight:
+    """
+    Merge concurrent calls that share a key into one in-flight execution.
+
+    The first caller for a key starts the work as a task; every caller that
+    arrives while it is running awaits the same task. Callers are shielded from
+    each other, so one client disconnecting does not cancel the shared work;
+    once every caller has gone away, though, the work is cancelled rather than
+    left running (and billed) for nobody.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        else:
+            logger.debug("joining in-flight call for %s", key)
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            remaining = self._waiters.pop(task) - 1
+            if remaining:
+                self._waiters[task] = remaining
+            elif not task.done():
+                logger.debug("last caller left in-flight call for %s, cancelling it", key)
+                task.cancel()
 
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved when every waiter has gone away
+            task.exception()
 
 
 class AsyncResultWrapper:
@@ -0,0 +1,288 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from cachetools import TLRUCache
+import orjson
+
+from lib.async_ops import SingleFlight, forcefully_async
+from lib.token_usage import budget_scope, token_budget
+
+
+logger = logging.getLogger("cortex_logger")
+
+
+def _dump(value: Any) -> Any:
+    if value is None:
+        return None
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    return value
+
+
+def request_fingerprint(**parts: Any) -> str:
+    """Stable hash of a request's parts; pydantic values are dumped to JSON first."""
+    normalized = {
+        name: [_dump(v) for v in value] if isinstance(value, list) else _dump(value)
+        for name, value in parts.items()
+    }
+    encoded = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class TwoTierCache:
+    """
+    JSON value cache with an in-memory LRU/TTL tier in front of a SQLite tier.
+
+    Values are stored as serialized JSON, so every read hands back a fresh copy
+    and both tiers can evict by payload size (UTF-8 bytes; the memory tier
+    holds the encoded bytes themselves). SQLite work runs on a dedicated
+    single-thread executor, which also serializes access to the connection.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            key TEXT PRIMARY KEY,
+            namespace TEXT NOT NULL,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        memory_max_bytes: int,
+        disk_max_bytes: int,
+    ) -> None:
+        self.path = path
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: TLRUCache = TLRUCache(
+            maxsize=memory_max_bytes,
+            ttu=lambda _key, entry, _now: entry[1],
+            timer=time.time,
+            getsizeof=lambda entry: len(entry[0]),
+        )
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="cache-disk"
+        )
+        self._counters: Dict[Tuple[str, str], int] = defaultdict(int)
+        # Disk evictions happen on the executor thread, apart from the per-namespace counters
+        self._disk_evictions = 0
+        self._evictions_lock = threading.Lock()
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        """The single thread running disk tier work."""
+        return self._disk_pool
+
+    # --- public API ---
+
+    async def get(self, key: str, namespace: str = "default") -> Optional[Any]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._counters[(namespace, "memory_hit")] += 1
+            return orjson.loads(entry[0])
+
+        if self.path:
+            try:
+                row = await forcefully_async(self._disk_get, key, threadpool=self._disk_pool)
+            except Exception as e:
+                logger.warning(f"Cache disk read failed for {key}: {e}")
+                row = None
+            if row is not None:
+                payload, expires_at = row
+                data = payload.encode("utf-8")
+                self._remember(key, data, expires_at)
+                self._counters[(namespace, "disk_hit")] += 1
+                return orjson.loads(data)
+
+        self._counters[(namespace, "miss")] += 1
+        return None
+
+    async def set(self, key: str, value: Any, ttl: float, namespace: str = "default") -> None:
+        if ttl <= 0:
+            return
+        data = orjson.dumps(value)
+        expires_at = time.time() + ttl
+        self._remember(key, data, expires_at)
+        self._counters[(namespace, "write")] += 1
+
+        if self.path:
+            try:
+                await forcefully_async(
+                    self._disk_set, key, namespace, data.decode("utf-8"), expires_at, threadpool=self._disk_pool
+                )
+            except Exception as e:
+                logger.warning(f"Cache disk write failed for {key}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        by_namespace: Dict[str, Dict[str, int]] = defaultdict(dict)
+        for (namespace, outcome), count in list(self._counters.items()):
+            by_namespace[namespace][outcome] = count
+        totals: Dict[str, int] = defaultdict(int)
+        for counts in by_namespace.values():
+            for outcome, count in counts.items():
+                totals[outcome] += count
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory.currsize,
+            "disk_evictions": self._disk_evictions,
+            "totals": dict(totals),
+            "by_namespace": dict(by_namespace),
+        }
+
+    # --- memory tier ---
+
+    def _remember(self, key: str, data: bytes, expires_at: float) -> None:
+        if len(data) > self._memory.maxsize:
+            return
+        self._memory[key] = (data, expires_at)
+
+    # --- disk tier (runs on the cache executor thread) ---
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(self._SCHEMA)
+            self._conn.commit()
+        return self._conn
+
+    def _disk_get(self, key: str) -> Optional[Tuple[str, float]]:
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            conn.commit()
+            return None
+        conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return row[0], row[1]
+
+    def _disk_set(self, key: str, namespace: str, payload: str, expires_at: float) -> None:
+        conn = self._connection()
+        now = time.time()
+        size = len(payload.encode("utf-8"))
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries "
+            "(key, namespace, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, namespace, payload, size, expires_at, now),
+        )
+        self._evict(conn, now)
+        conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+        if total <= self.disk_max_bytes:
+            return
+        freed = 0
+        victims = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM cache_entries ORDER BY accessed_at ASC"
+        ):
+            victims.append((key,))
+            freed += size
+            if total - freed <= self.disk_max_bytes:
+                break
+        conn.executemany("DELETE FROM cache_entries WHERE key = ?", victims)
+        with self._evictions_lock:
+            self._disk_evictions += len(victims)
+
+
+@dataclass
+class Uncached:
+    """A computed value to hand to callers without storing it, e.g. a degraded answer."""
+
+    value: Any
+
+
+class StaleWhileRevalidateCache:
+    """
+    Result cache on a TwoTierCache that keeps serving expired answers while
+    they are refreshed in the background.
+
+    Entries are stored as {"value", "fresh_until"} for `fresh_ttl + max_stale`
+    seconds. A fresh hit is returned as is; a stale hit is returned immediately
+    and starts at most one background refresh per key; a miss computes inline,
+    with concurrent misses merged. `compute` returns None when there is no
+    result (e.g. an upstream failure), or wraps a result in Uncached to
+    return it without caching it.
+
+    A miss computes under the caller's token budget and is shared only with
+    callers on the same budget; background refreshes serve later callers, so
+    they run without one.
+    """
+
+    def __init__(self, cache: TwoTierCache) -> None:
+        self.cache = cache
+        self._flight = SingleFlight()
+        self._refreshes: Set[asyncio.Task] = set()
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Optional[Any]]],
+        fresh_ttl: float,
+        max_stale: float,
+        namespace: str = "default",
+    ) -> Optional[Any]:
+        entry = await self.cache.get(key, namespace=namespace)
+        if entry is not None:
+            if entry["fresh_until"] <= time.time() and (key, None) not in self._flight:
+                with token_budget(None):
+                    refresh = asyncio.ensure_future(
+                        self._flight.do(
+                            (key, None), lambda: self._compute(key, compute, fresh_ttl, max_stale, namespace)
+                        )
+                    )
+                self._refreshes.add(refresh)
+                refresh.add_done_callback(self._refresh_done)
+            return entry["value"]
+        return await self._flight.do(
+            (key, budget_scope()), lambda: self._compute(key, compute, fresh_ttl, max_stale, namespace)
+        )
+
+    async def _compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Optional[Any]]],
+        fresh_ttl: float,
+        max_stale: float,
+        namespace: str,
+    ) -> Optional[Any]:
+        value = await compute()
+        if isinstance(value, Uncached):
+            return value.value
+        if value is not None and fresh_ttl > 0:
+            await self.cache.set(
+                key,
+                {"value": value, "fresh_until": time.time() + fresh_ttl},
+                ttl=fresh_ttl + max_stale,
+                namespace=namespace,
+            )
+        return value
+
+    def _refresh_done(self, task: asyncio.Task) -> None:
+        self._refreshes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background cache refresh failed: {task.exception()}")
@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from google.genai import types
+
+from lib.async_ops import SingleFlight
+
+
+logger = logging.getLogger("cortex_logger")
+
+
+@dataclass
+class _CachedContext:
+    name: str
+    expires_at: float
+    hits: int = 0
+
+
+class ContextCache:
+    """
+    Provider-side cached contexts for static system prompts.
+
+    Each (model, system prompt) pair is uploaded once with `caches.create`
+    and then referenced by name (GenerateContentConfig.cached_content), so
+    the prompt's tokens are billed at the cached rate and are not resent
+    with every call. Gemini's caches client is injected (client.aio.caches
+    in production), so anything with the same async `create`/`update` can
+    stand in for it.
+
+    `config` keys:
+        enabled, ttl_seconds, refresh_before_seconds, retry_after_seconds,
+        min_tokens ({"default": n, <model>: n}, the provider's minimum
+        cacheable size; smaller prompts are never uploaded)
+
+    A context is refreshed when it is used within `refresh_before_seconds`
+    of expiry, so unused prompts are left to expire. When create/update
+    fails the prompt is sent inline and the pair is not retried for
+    `retry_after_seconds`.
+    """
+
+    def __init__(
+        self,
+        caches: Any,
+        config: Dict[str, Any],
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self._caches = caches
+        self.enabled = config.get("enabled", True)
+        self.ttl_seconds = config.get("ttl_seconds", 60 * 60)
+        self.refresh_before_seconds = config.get("refresh_before_seconds", 5 * 60)
+        self.retry_after_seconds = config.get("retry_after_seconds", 5 * 60)
+        self.min_tokens = config.get("min_tokens", {"default": 1024})
+        self._clock = clock
+        self._contexts: Dict[Tuple[str, str], _CachedContext] = {}
+        self._failed_until: Dict[Tuple[str, str], float] = {}
+        self._flight = SingleFlight()
+
+    @staticmethod
+    def _key(model: str, system_prompt: str) -> Tuple[str, str]:
+        return model, hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+    def eligible(self, model: str, system_prompt: str) -> bool:
+        """Whether the prompt is large enough (~4 chars/token) to be cached for this model."""
+        if not self.enabled or not system_prompt:
+            return False
+        min_tokens = self.min_tokens.get(model, self.min_tokens.get("default", 0))
+        return len(system_prompt) // 4 >= min_tokens
+
+    async def name_for(self, model: str, system_prompt: str) -> Optional[str]:
+        """Cached context name to reference, or None to send the prompt inline."""
+        if not self.eligible(model, system_prompt):
+            return None
+        key = self._key(model, system_prompt)
+        now = self._clock()
+        context = self._contexts.get(key)
+        if context is not None and now < context.expires_at - self.refresh_before_seconds:
+            context.hits += 1
+            return context.name
+        if self._failed_until.get(key, 0) > now:
+            return None
+        try:
+            name = await self._flight.do(key, lambda: self._refresh(key, model, system_prompt))
+        except Exception as e:
+            logger.warning("cached context for %s (%s) unavailable, sending inline: %s", model, key[1][:12], e)
+            self._contexts.pop(key, None)
+            self._failed_until[key] = now + self.retry_after_seconds
+            return None
+        context = self._contexts.get(key)
+        if context is not None:
+            context.hits += 1
+        return name
+
+    def invalidate(self, model: str, system_prompt: str) -> None:
+        """Forget a context the provider rejected; the next call re-creates it."""
+        self._contexts.pop(self._key(model, system_prompt), None)
+
+    async def _refresh(self, key: Tuple[str, str], model: str, system_prompt: str) -> str:
+        ttl = f"{self.ttl_seconds}s"
+        context = self._contexts.get(key)
+        if context is not None:
+            try:
+                await self._caches.update(name=context.name, config=types.UpdateCachedContentConfig(ttl=ttl))
+                context.expires_at = self._clock() + self.ttl_seconds
+                return context.name
+            except Exception as e:
+                # Expired or deleted on the provider side; upload it again
+                logger.info("refreshing cached context %s failed, re-creating: %s", context.name, e)
+                self._contexts.pop(key, None)
+
+        cached = await self._caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_prompt,
+                ttl=ttl,
+                display_name=f"system-{key[1][:16]}",
+            ),
+        )
+        self._contexts[key] = _CachedContext(name=cached.name, expires_at=self._clock() + self.ttl_seconds)
+        self._failed_until.pop(key, None)
+        logger.info("created cached context %s for %s", cached.name, model)
+        return cached.name
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = self._clock()
+        return {
+            "enabled": self.enabled,
+            "contexts": [
+                {
+                    "model": model,
+                    "prompt_sha256": digest,
+                    "name": context.name,
+                    "expires_in_seconds": max(0, int(context.expires_at - now)),
+                    "hits": context.hits,
+                }
+                for (model, digest), context in sorted(self._contexts.items(), key=lambda item: item[0])
+            ],
+            "backing_off": len([until for until in self._failed_until.values() if until > now]),
+        }
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+from lib.storage import StorageBackend
+
+
+logger = logging.getLogger("cortex_logger")
+
+
+class ContentAddressedImageStore:
+    """
+    Image files addressed by a hash of (model, prompt).
+
+    Files live at `<hash[:2]>/<hash><ext>` in the storage backend, next to a
+    `<hash>.json` sidecar with the file's key, variants and a little
+    provenance, so a repeat prompt resolves to the existing file without
+    calling the model again. Each hash has its own sidecar, so several
+    workers sharing the backend never overwrite each other's entries.
+
+    Sidecars already read are kept in memory: `lookup` answers from there
+    only, `resolve` falls back to the backend for images another worker
+    stored. A pre-sidecar `index.json` is still read once as a seed.
+    """
+
+    LEGACY_INDEX_KEY = "index.json"
+
+    def __init__(self, backend: StorageBackend) -> None:
+        self.backend = backend
+        self._index: Dict[str, dict] = self._load_legacy_index()
+
+    @staticmethod
+    def key_for(model: str, prompt: str) -> str:
+        normalized = " ".join(prompt.split())
+        return hashlib.sha256(f"{model}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> Optional[dict]:
+        """The stored image for `key` as {"url", "variants": [{"url", "format", "width", "height"}]}, if known here."""
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        return {
+            "url": self.backend.url_for(entry["path"]),
+            "variants": [
+                {**variant, "url": self.backend.url_for(variant["path"])}
+                for variant in entry.get("variants", [])
+            ],
+        }
+
+    async def resolve(self, key: str) -> Optional[dict]:
+        """Like lookup, but reads the sidecar from the backend on a miss."""
+        if key not in self._index:
+            entry = await self._read_entry(key)
+            if entry is None:
+                return None
+            self._index[key] = entry
+        return self.lookup(key)
+
+    def object_key(self, key: str, suffix: str) -> str:
+        return f"{key[:2]}/{key}{suffix}"
+
+    async def save(
+        self, key: str, data: bytes, extension: str, mime_type: str, model: str, prompt: str
+    ) -> dict:
+        path = self.object_key(key, extension)
+        await self.backend.write(path, data, content_type=mime_type)
+        # The sidecar goes last: once it exists, so does the file it points to
+        await self._write_entry(
+            key,
+            {
+                "path": path,
+                "model": model,
+                "prompt": prompt[:200],
+                "bytes": len(data),
+                "created_at": time.time(),
+            },
+        )
+        return self.lookup(key)
+
+    async def save_variants(self, key: str, variants: List[dict]) -> Optional[dict]:
+        """Write encoded variants next to the original and list them in its sidecar."""
+        recorded = []
+        for variant in variants:
+            path = self.object_key(key, f"_{variant['width']}.{variant['format']}")
+            await self.backend.write(path, variant["data"], content_type=f"image/{variant['format']}")
+            recorded.append(
+                {
+                    "path": path,
+                    "format": variant["format"],
+                    "width": variant["width"],
+                    "height": variant["height"],
+                }
+            )
+        entry = self._index.get(key) or await self._read_entry(key)
+        if entry is None:
+            return None
+        await self._write_entry(key, {**entry, "variants": recorded})
+        return self.lookup(key)
+
+    async def _read_entry(self, key: str) -> Optional[dict]:
+        try:
+            raw = await self.backend.read(self.object_key(key, ".json"))
+            return json.loads(raw) if raw else None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable image sidecar for {key[:12]}: {e}")
+            return None
+
+    async def _write_entry(self, key: str, entry: dict) -> None:
+        payload = json.dumps(entry, ensure_ascii=False, indent=1, sort_keys=True)
+        await self.backend.write(
+            self.object_key(key, ".json"), payload.encode("utf-8"), content_type="application/json"
+        )
+        self._index[key] = entry
+
+    def _load_legacy_index(self) -> Dict[str, dict]:
+        try:
+            raw = self.backend.read_blocking(self.LEGACY_INDEX_KEY)
+            return json.loads(raw) if raw else {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable image index: {e}")
+            return {}
@@ -0,0 +1,45 @@
+import io
+from typing import List, Sequence
+
+from PIL import Image, features
+
+
+def supported_formats(formats: Sequence[str]) -> List[str]:
+    """Drop output formats this Pillow build cannot encode (AVIF needs libavif)."""
+    return [fmt for fmt in formats if features.check(fmt)]
+
+
+def render_variants(
+    data: bytes, widths: Sequence[int], formats: Sequence[str], quality: int
+) -> List[dict]:
+    """
+    Encode `data` into each format at each width, plus the full-size image.
+
+    Widths at or above the source width are skipped so nothing is upscaled.
+    Runs in a worker process, so it only takes and returns plain values:
+    one {"format", "width", "height", "data"} dict per variant.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        image = source.convert("RGBA" if "A" in source.getbands() else "RGB")
+
+    targets = sorted({w for w in widths if w < image.width} | {image.width})
+    variants = []
+    for width in targets:
+        if width == image.width:
+            resized = image
+        else:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt in formats:
+            buffer = io.BytesIO()
+            resized.save(buffer, format=fmt.upper(), quality=quality)
+            variants.append(
+                {
+                    "format": fmt,
+                    "width": resized.width,
+                    "height": resized.height,
+                    "data": buffer.getvalue(),
+                }
+            )
+    return variants
@@ -0,0 +1,126 @@
+from typing import Any, List, Optional, Tuple
+
+import orjson
+
+
+class JsonObjectStream:
+    """
+    Incremental scanner for a JSON object that arrives in chunks.
+
+    Emits ("item", value) for every complete element of the array stored under
+    `array_key`, as soon as the element closes, and ("field", (key, value)) for
+    every other top-level member once its value is complete. Each character is
+    scanned once; only finished slices are handed to orjson.loads.
+    """
+
+    def __init__(self, array_key: str) -> None:
+        self.array_key = array_key
+        self._buf = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._awaiting_value = False
+        self._value_start: Optional[int] = None
+        self._in_array = False
+        self._item_start: Optional[int] = None
+        self.done = False
+
+    @property
+    def text(self) -> str:
+        return self._buf
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._buf += chunk
+        events: List[Tuple[str, Any]] = []
+        buf = self._buf
+        i = self._pos
+        n = len(buf)
+        while i < n and not self.done:
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_start is not None:
+                        self._key = orjson.loads(buf[self._key_start : i + 1])
+                        self._key_start = None
+                i += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = i
+                    self._expect_key = False
+                else:
+                    self._mark_value_start(i)
+            elif ch in "{[":
+                self._mark_value_start(i)
+                if self._depth == 1 and ch == "[" and self._key == self.array_key:
+                    self._in_array = True
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = True
+            elif ch in "}]":
+                if ch == "}" and self._depth == 1:
+                    self._finish_field(i, events)
+                elif ch == "]" and self._depth == 2 and self._in_array:
+                    self._finish_item(i, events)
+                self._depth -= 1
+                if self._depth == 2 and self._in_array:
+                    self._finish_item(i + 1, events)
+                elif self._depth == 1:
+                    if self._in_array:
+                        self._in_array = False
+                        self._value_start = None
+                    else:
+                        self._finish_field(i + 1, events)
+                elif self._depth == 0:
+                    self.done = True
+            elif ch == ":" and self._depth == 1:
+                self._awaiting_value = True
+            elif ch == ",":
+                if self._depth == 1:
+                    self._finish_field(i, events)
+                    self._expect_key = True
+                elif self._depth == 2 and self._in_array:
+                    self._finish_item(i, events)
+            elif not ch.isspace():
+                self._mark_value_start(i)
+            i += 1
+        self._pos = i
+        return events
+
+    def _mark_value_start(self, i: int) -> None:
+        if self._depth == 1 and self._awaiting_value:
+            self._value_start = i
+            self._awaiting_value = False
+        elif self._depth == 2 and self._in_array and self._item_start is None:
+            self._item_start = i
+
+    def _finish_field(self, end: int, events: List[Tuple[str, Any]]) -> None:
+        if self._value_start is None:
+            return
+        raw = self._buf[self._value_start : end]
+        self._value_start = None
+        try:
+            events.append(("field", (self._key, orjson.loads(raw))))
+        except orjson.JSONDecodeError:
+            pass
+
+    def _finish_item(self, end: int, events: List[Tuple[str, Any]]) -> None:
+        if self._item_start is None:
+            return
+        raw = self._buf[self._item_start : end]
+        self._item_start = None
+        try:
+            events.append(("item", orjson.loads(raw)))
+        except orjson.JSONDecodeError:
+            pass
@@ -0,0 +1,118 @@
+import math
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Optional
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+@dataclass
+class OutputPlan:
+    """Token limits for one call, plus the hook that feeds its actual usage back."""
+
+    schema: str
+    units: int
+    max_output_tokens: int
+    thinking_budget: Optional[int]
+    observe: Callable[[Any], None] = field(repr=False)
+
+
+class OutputBudgeter:
+    """
+    Sizes max_output_tokens and the thinking budget per call from the size of
+    the request (days, places, ...) instead of one worst-case reservation.
+
+    `config` maps a schema name to:
+        base_output, output_per_unit, min_output, max_output,
+        base_thinking, thinking_per_unit, max_thinking (thinking keys optional;
+        no base_thinking means thinking is left to the model's default)
+    plus top-level "headroom", "history_size" and "min_samples".
+
+    Until a schema has `min_samples` observations the per-unit rates come from
+    the config. After that they come from the 95th percentile of observed
+    tokens per unit (response and thoughts tracked separately) times
+    `headroom`, so limits follow what the model actually produces.
+    """
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        self.config = config
+        self.headroom = config.get("headroom", 1.3)
+        self.min_samples = config.get("min_samples", 20)
+        history_size = config.get("history_size", 200)
+        self._output_per_unit: Dict[str, Deque[float]] = {}
+        self._thinking_per_unit: Dict[str, Deque[float]] = {}
+        self._history_size = history_size
+        self._lock = threading.Lock()
+
+    def plan(self, schema: str, units: int) -> OutputPlan:
+        cfg = self.config[schema]
+        units = max(units, 1)
+
+        output_rate = self._observed_rate(self._output_per_unit, schema)
+        if output_rate is None:
+            output_tokens = cfg["base_output"] + cfg["output_per_unit"] * units
+        else:
+            output_tokens = cfg["base_output"] + output_rate * units * self.headroom
+
+        thinking_budget = None
+        if cfg.get("base_thinking") is not None:
+            thinking_rate = self._observed_rate(self._thinking_per_unit, schema)
+            if thinking_rate is None:
+                thinking = cfg["base_thinking"] + cfg.get("thinking_per_unit", 0) * units
+            else:
+                thinking = max(cfg["base_thinking"], thinking_rate * units * self.headroom)
+            thinking_budget = int(min(thinking, cfg.get("max_thinking", thinking)))
+
+        # On Gemini 2.5 thoughts count against max_output_tokens
+        max_output = output_tokens + (thinking_budget or 0)
+        max_output = int(min(max(max_output, cfg["min_output"]), cfg["max_output"]))
+
+        return OutputPlan(
+            schema=schema,
+            units=units,
+            max_output_tokens=max_output,
+            thinking_budget=thinking_budget,
+            observe=lambda usage: self.observe(schema, units, usage),
+        )
+
+    def observe(self, schema: str, units: int, usage_metadata: Any) -> None:
+        """Record a response's usage_metadata against the schema's per-unit history."""
+        if usage_metadata is None:
+            return
+        output = getattr(usage_metadata, "candidates_token_count", None)
+        thoughts = getattr(usage_metadata, "thoughts_token_count", None)
+        with self._lock:
+            if output:
+                self._history(self._output_per_unit, schema).append(output / max(units, 1))
+            if thoughts:
+                self._history(self._thinking_per_unit, schema).append(thoughts / max(units, 1))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for schema in self.config:
+            if not isinstance(self.config[schema], dict):
+                continue
+            result[schema] = {
+                "output_samples": len(self._output_per_unit.get(schema, ())),
+                "output_per_unit_p95": self._observed_rate(self._output_per_unit, schema),
+                "thinking_samples": len(self._thinking_per_unit.get(schema, ())),
+                "thinking_per_unit_p95": self._observed_rate(self._thinking_per_unit, schema),
+            }
+        return result
+
+    def _history(self, histories: Dict[str, Deque[float]], schema: str) -> Deque[float]:
+        if schema not in histories:
+            histories[schema] = deque(maxlen=self._history_size)
+        return histories[schema]
+
+    def _observed_rate(self, histories: Dict[str, Deque[float]], schema: str) -> Optional[float]:
+        with self._lock:
+            values = list(histories.get(schema, ()))
+        if len(values) < self.min_samples:
+            return None
+        return _percentile(values, 95)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+
+logger = logging.getLogger("cortex_logger")
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute` tokens per minute.
+
+    Waiters are served FIFO. A request larger than the capacity is admitted once
+    the bucket is full, so oversized calls are slowed down rather than starved.
+    The balance may go negative through `debit` when a call turns out to cost
+    more than was reserved up front.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None) -> None:
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Take `amount` tokens, sleeping until they are available. Returns seconds waited."""
+        waited = 0.0
+        async with self._lock:
+            needed = min(amount, self.capacity)
+            while True:
+                self._refill()
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    return waited
+                delay = (needed - self._tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+    def debit(self, amount: float) -> None:
+        """Adjust the balance after the fact; negative amounts refund tokens."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - amount)
+
+
+class RateLimitPermit:
+    """Handed out by ModelRateLimiter.limit; settle() reconciles reserved vs actual tokens."""
+
+    def __init__(self, tokens: Optional[TokenBucket], reserved: int) -> None:
+        self._tokens = tokens
+        self.reserved = reserved
+        self.waited = 0.0
+
+    def settle(self, actual_tokens: Optional[int]) -> None:
+        if self._tokens is not None and actual_tokens is not None:
+            self._tokens.debit(actual_tokens - self.reserved)
+            self.reserved = actual_tokens
+
+
+class ModelRateLimiter:
+    """
+    Per-model requests/minute, tokens/minute and concurrency limits.
+
+    `limits` maps a model name to a dict with any of "requests_per_minute",
+    "tokens_per_minute" and "max_concurrency"; a "default" entry covers models
+    that are not listed. Missing or falsy values disable that dimension.
+    """
+
+    def __init__(self, limits: Dict[str, dict]) -> None:
+        self._limits = limits
+        self._requests: Dict[str, Optional[TokenBucket]] = {}
+        self._tokens: Dict[str, Optional[TokenBucket]] = {}
+        self._slots: Dict[str, Optional[asyncio.Semaphore]] = {}
+
+    def _config(self, model: str) -> dict:
+        return self._limits.get(model) or self._limits.get("default") or {}
+
+    def _buckets(self, model: str):
+        if model not in self._slots:
+            config = self._config(model)
+            rpm = config.get("requests_per_minute")
+            tpm = config.get("tokens_per_minute")
+            concurrency = config.get("max_concurrency")
+            self._requests[model] = TokenBucket(rpm) if rpm else None
+            self._tokens[model] = TokenBucket(tpm) if tpm else None
+            self._slots[model] = asyncio.Semaphore(concurrency) if concurrency else None
+        return self._requests[model], self._tokens[model], self._slots[model]
+
+    @asynccontextmanager
+    async def limit(self, model: str, tokens: int = 0) -> AsyncIterator[RateLimitPermit]:
+        requests, token_bucket, slots = self._buckets(model)
+        permit = RateLimitPermit(token_bucket, tokens)
+        if slots is not None:
+            await slots.acquire()
+        try:
+            if requests is not None:
+                permit.waited += await requests.acquire(1)
+            if token_bucket is not None and tokens:
+                permit.waited += await token_bucket.acquire(tokens)
+            if permit.waited > 1:
+                logger.info(f"Rate limiter delayed {model} call by {permit.waited:.1f}s")
+            yield permit
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def snapshot(self) -> Dict[str, dict]:
+        result = {}
+        for model in self._slots:
+            requests, token_bucket, slots = self._buckets(model)
+            result[model] = {
+                "requests_available": requests.available if requests else None,
+                "tokens_available": token_bucket.available if token_bucket else None,
+                "free_slots": slots._value if slots else None,
+            }
+        return result
@@ -0,0 +1,231 @@
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+from tenacity import (
+    AsyncRetrying,
+    RetryCallState,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from lib.async_ops import AsyncRequests
+
+
+logger = logging.getLogger("cortex_logger")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+    def __init__(self, host: str, retry_in: float) -> None:
+        super().__init__(f"Circuit open for {host}; retry in {retry_in:.1f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class RetryableStatusError(Exception):
+    """An upstream answered with a status worth retrying (429, 5xx)."""
+
+    def __init__(self, response: httpx.Response) -> None:
+        super().__init__(f"{response.request.url.host} returned {response.status_code}")
+        self.response = response
+
+    @property
+    def retry_after(self) -> Optional[float]:
+        """Seconds the server asked us to wait, from delay-seconds or an HTTP-date."""
+        value = self.response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one upstream host.
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    fail fast for `reset_timeout` seconds. Then a single probe is let through
+    (half-open): success closes the circuit, failure opens it again, and a
+    probe that ends with neither (e.g. cancelled) is released so the next
+    call can probe instead.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, host: str, failure_threshold: int, reset_timeout: float) -> None:
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError or let the call through; True when it is the half-open probe."""
+        if self.state == self.CLOSED:
+            return False
+        retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+        if self.state == self.OPEN and retry_in <= 0:
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        raise CircuitOpenError(self.host, max(retry_in, 0.0))
+
+    def release_probe(self) -> None:
+        self._probing = False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit for {self.host} closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit for {self.host} opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class ResilientHTTP:
+    """
+    HTTP calls on the pooled AsyncRequests clients with jittered exponential
+    retries and a circuit breaker per host.
+
+    Only transport errors and `retry_statuses` are retried; other responses
+    are returned to the caller untouched. There is deliberately no blocking
+    fallback: a failing upstream costs at most `max_attempts` async attempts,
+    and none at all while its circuit is open. The breaker sees each request
+    once, not each attempt: a request fails when its last attempt does.
+    A Retry-After longer than `max_retry_after` is not waited out: the
+    response is returned to the caller straight away.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        retry_statuses: Iterable[int] = (429, 500, 502, 503, 504),
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        max_retry_after: float = 10.0,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = frozenset(retry_statuses)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._backoff = wait_random_exponential(multiplier=backoff_base, max=backoff_max)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._counters: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+        return self._breakers[host]
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        Send a request, retrying retryable failures.
+
+        Raises CircuitOpenError when the host is known to be down and the last
+        httpx.TransportError when every attempt failed at the transport level.
+        A retryable status that persists through every attempt is returned as
+        the final response.
+        """
+        host = urlparse(url).hostname or url
+        breaker = self.breaker(host)
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=self._wait,
+            retry=retry_if_exception(self._retryable),
+            before_sleep=lambda state: self._count(host, "retry"),
+            reraise=True,
+        )
+        try:
+            probe = breaker.before_call()
+        except CircuitOpenError:
+            self._count(host, "short_circuit")
+            raise
+        try:
+            async for attempt in retrying:
+                with attempt:
+                    response = await self._attempt(host, method, url, **kwargs)
+        except RetryableStatusError as e:
+            breaker.record_failure()
+            return e.response
+        except Exception as e:
+            # Transport errors count against the host; anything else (e.g.
+            # TooManyRedirects, DecodingError) still must not leave a probe
+            # holding the half-open circuit
+            if probe or isinstance(e, httpx.TransportError):
+                breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled: no verdict on the host, just free the probe slot
+            if probe:
+                breaker.release_probe()
+            raise
+        breaker.record_success()
+        return response
+
+    async def _attempt(self, host: str, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        self._count(host, "attempt")
+        try:
+            response = await AsyncRequests.get_client(host).request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            self._count(host, "transport_error")
+            logger.warning(f"{method.upper()} {url} failed: {e!r}")
+            raise
+        if response.status_code in self.retry_statuses:
+            self._count(host, f"status_{response.status_code}")
+            raise RetryableStatusError(response)
+        return response
+
+    def _retryable(self, error: BaseException) -> bool:
+        if isinstance(error, RetryableStatusError):
+            # Asked to come back later than we are willing to hold the caller
+            return error.retry_after is None or error.retry_after <= self.max_retry_after
+        return isinstance(error, httpx.TransportError)
+
+    def _wait(self, retry_state: RetryCallState) -> float:
+        delay = self._backoff(retry_state)
+        error = retry_state.outcome.exception() if retry_state.outcome else None
+        if isinstance(error, RetryableStatusError) and error.retry_after is not None:
+            delay = max(delay, min(error.retry_after, self.max_retry_after))
+        return delay
+
+    def _count(self, host: str, outcome: str) -> None:
+        self._counters[(host, outcome)] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        by_host: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        for (host, outcome), count in self._counters.items():
+            by_host[host][outcome] = count
+        for host, breaker in self._breakers.items():
+            by_host[host]["breaker_state"] = breaker.state
+            by_host[host]["consecutive_failures"] = breaker.failures
+        return dict(by_host)
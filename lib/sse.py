@@ -0,0 +1,20 @@
+from typing import Any, Optional
+
+from lib.fast_json import dumps_str
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # disable proxy buffering (nginx)
+}
+
+
+def format_sse(event: str, data: Any, event_id: Optional[str] = None) -> str:
+    """Encode one Server-Sent Events message with a JSON payload."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {dumps_str(data)}")
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,182 @@
+import concurrent.futures
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from lib.async_ops import forcefully_async
+from lib.metrics import registry
+
+
+logger = logging.getLogger("cortex_logger")
+
+# Disk I/O gets its own pool so large writes never queue behind HTTP fallbacks
+storage_threadpool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="storage"
+)
+
+# Includes time queued for a storage thread, which is what callers actually wait
+storage_latency = registry.histogram(
+    "itinera_storage_latency_seconds",
+    "Storage backend operations, including time queued for a storage thread",
+    ["backend", "op"],
+)
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Write to a temp file in the target directory, fsync, then rename over `path`."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class StorageBackend(ABC):
+    """
+    Async object storage addressed by slash-separated keys.
+
+    Subclasses implement the *_blocking primitives; the async methods run them
+    on the storage thread pool so callers never touch the disk from the event
+    loop. The blocking readers are public only for startup code that runs
+    before the loop exists.
+    """
+
+    def __init__(self, threadpool: concurrent.futures.Executor = storage_threadpool) -> None:
+        self._threadpool = threadpool
+
+    async def write(self, key: str, data: bytes, content_type: Optional[str] = None) -> str:
+        with storage_latency.time(backend=type(self).__name__, op="write"):
+            await forcefully_async(self.write_blocking, key, data, content_type, threadpool=self._threadpool)
+        return self.url_for(key)
+
+    async def read(self, key: str) -> Optional[bytes]:
+        with storage_latency.time(backend=type(self).__name__, op="read"):
+            return await forcefully_async(self.read_blocking, key, threadpool=self._threadpool)
+
+    async def exists(self, key: str) -> bool:
+        return await forcefully_async(self.exists_blocking, key, threadpool=self._threadpool)
+
+    async def delete(self, key: str) -> None:
+        await forcefully_async(self.delete_blocking, key, threadpool=self._threadpool)
+
+    @abstractmethod
+    def url_for(self, key: str) -> str:
+        ...
+
+    @abstractmethod
+    def write_blocking(self, key: str, data: bytes, content_type: Optional[str] = None) -> None:
+        ...
+
+    @abstractmethod
+    def read_blocking(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def exists_blocking(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def delete_blocking(self, key: str) -> None:
+        ...
+
+
+class LocalStorageBackend(StorageBackend):
+    """Keys map to files under `root`, served from `base_url`."""
+
+    def __init__(self, root: str, base_url: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Storage key escapes the storage root: {key}")
+        return path
+
+    def url_for(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def write_blocking(self, key: str, data: bytes, content_type: Optional[str] = None) -> None:
+        atomic_write(self._path(key), data)
+
+    def read_blocking(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists_blocking(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def delete_blocking(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class LocalS3Backend(LocalStorageBackend):
+    """
+    Local stand-in for an S3-compatible bucket.
+
+    Objects live at `<root>/<bucket>/<key>` with a JSON sidecar under
+    `<root>/.meta/<bucket>/<key>.json` holding ContentType, ContentLength, ETag
+    and LastModified, mirroring put_object/head_object semantics closely enough
+    to swap in a real client later without touching callers.
+    """
+
+    def __init__(self, root: str, bucket: str, base_url: str, **kwargs) -> None:
+        super().__init__(os.path.join(root, bucket), f"{base_url.rstrip('/')}/{bucket}", **kwargs)
+        self.bucket = bucket
+        self.meta_root = os.path.join(root, ".meta", bucket)
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.meta_root, f"{key}.json")
+
+    def write_blocking(self, key: str, data: bytes, content_type: Optional[str] = None) -> None:
+        self.put_object(key, data, content_type)
+
+    def delete_blocking(self, key: str) -> None:
+        super().delete_blocking(key)
+        try:
+            os.unlink(self._meta_path(key))
+        except FileNotFoundError:
+            pass
+
+    def put_object(self, key: str, data: bytes, content_type: Optional[str] = None) -> dict:
+        meta = {
+            "ContentType": content_type
+            or mimetypes.guess_type(key)[0]
+            or "application/octet-stream",
+            "ContentLength": len(data),
+            "ETag": f'"{hashlib.md5(data).hexdigest()}"',
+            "LastModified": time.time(),
+        }
+        atomic_write(self._path(key), data)
+        atomic_write(self._meta_path(key), json.dumps(meta).encode("utf-8"))
+        return meta
+
+    def head_object(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._meta_path(key), "rb") as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,149 @@
+import re
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple, Type
+
+import orjson
+from pydantic import BaseModel, ValidationError
+
+
+_CLOSERS = {"{": "}", "[": "]"}
+# A whole string, a lone quote (string cut off), punctuation, or a bare scalar
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|"|[{}\[\],:]|[^\s{}\[\],:"]+')
+
+
+@dataclass
+class ParsedOutput:
+    value: Any
+    repaired: bool = False  # only parsed after recover_json fixed it up
+    truncated: bool = False  # containers had to be closed, so trailing content was lost
+
+
+def parse_structured(
+    text: str,
+    response_model: Optional[Type[BaseModel]] = None,
+    recover: bool = False,
+    max_depth: Optional[int] = None,
+) -> Optional[ParsedOutput]:
+    """
+    The parser for every structured model reply (Gemini and Perplexity).
+
+    Well-formed text takes the fast path: orjson, or with a response_model
+    model_validate_json straight from the text. Otherwise, if `recover` is
+    set, recover_json repairs it (see there for `max_depth`). A
+    response_model validates the result either way and is dumped back to
+    plain JSON values. Returns None when nothing valid can be had.
+    """
+    if not text:
+        return None
+    try:
+        if response_model is not None:
+            return ParsedOutput(response_model.model_validate_json(text).model_dump())
+        return ParsedOutput(orjson.loads(text))
+    except (orjson.JSONDecodeError, ValidationError):
+        if not recover:
+            return None
+
+    parsed = recover_json(text, max_depth=max_depth)
+    if parsed is None or response_model is None:
+        return parsed
+    try:
+        parsed.value = response_model.model_validate(parsed.value).model_dump()
+    except ValidationError:
+        return None
+    return parsed
+
+
+def recover_json(text: str, max_depth: Optional[int] = None) -> Optional[ParsedOutput]:
+    """
+    Parse model output that may be cut off or slightly malformed.
+
+    Scanning starts at the first bracket and stops after the first complete
+    top-level value, so prose and code fences around it are ignored, and
+    trailing commas are dropped. When the text ends inside a container, it is
+    cut back to the last complete element and the open containers are closed.
+
+    A token that cannot follow what came before (e.g. a missing comma in
+    `[1 2]`) ends the scan the same way, so everything before it is kept.
+
+    `max_depth` limits where that cut may land: only after an element whose
+    parent sits at most `max_depth` containers deep. E.g. for
+    {"days": [{...}, ...]} a max_depth of 2 keeps complete days only, never a
+    half-written one. Returns None when nothing usable remains.
+    """
+    if not text:
+        return None
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return None
+
+    out: List[str] = []
+    # Per open container: [opening char, state]; objects cycle key -> colon ->
+    # value -> comma, arrays cycle value -> comma
+    stack: List[List[str]] = []
+    # (tokens in out, open containers) after the last element that may end the value
+    cut: Optional[Tuple[int, Tuple[str, ...]]] = None
+
+    def expects(token: str) -> bool:
+        """Whether `token` may start the next value (or key) of the innermost container."""
+        state = stack[-1][1]
+        return state == "value" or (state == "key" and token[0] == '"')
+
+    def value_done() -> None:
+        nonlocal cut
+        parent = stack[-1]
+        if parent[0] == "{" and parent[1] == "key":
+            parent[1] = "colon"
+            return
+        parent[1] = "comma"
+        if max_depth is None or len(stack) <= max_depth:
+            cut = (len(out), tuple(c for c, _ in stack))
+
+    for match in _TOKEN.finditer(text, min(starts)):
+        token = match.group()
+        if token == '"':
+            break  # string cut off mid-way
+        if token in "{[":
+            if stack and not expects(token):
+                break
+            out.append(token)
+            stack.append([token, "key" if token == "{" else "value"])
+        elif token in "}]":
+            if not stack or _CLOSERS[stack[-1][0]] != token:
+                break
+            if stack[-1][1] != "comma" and out[-1] not in "{[,":
+                break  # e.g. {"a": } or {"a"}
+            if out[-1] == ",":
+                out.pop()
+            out.append(token)
+            stack.pop()
+            if not stack:
+                break
+            value_done()
+        elif token == ",":
+            if stack[-1][1] != "comma":
+                break
+            out.append(token)
+            stack[-1][1] = "key" if stack[-1][0] == "{" else "value"
+        elif token == ":":
+            if stack[-1][1] != "colon":
+                break
+            out.append(token)
+            stack[-1][1] = "value"
+        else:
+            if not expects(token):
+                break
+            if token[0] != '"' and match.end() == len(text):
+                break  # number or literal may be cut off
+            out.append(token)
+            value_done()
+
+    truncated = bool(stack)
+    if truncated:
+        if cut is None:
+            return None
+        length, open_containers = cut
+        out = out[:length] + [_CLOSERS[c] for c in reversed(open_containers)]
+    try:
+        return ParsedOutput(orjson.loads("".join(out)), repaired=True, truncated=truncated)
+    except orjson.JSONDecodeError:
+        return None
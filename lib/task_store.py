@@ -0,0 +1,301 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from lib.async_ops import forcefully_async
+
+
+logger = logging.getLogger("cortex_logger")
+
+
+class TaskStore(ABC):
+    """
+    Storage for background batch tasks and their per-destination progress.
+
+    A task is {"task_id", "status", "message", "created_at", "updated_at",
+    "version", "destinations": [dict, ...]}. Every write bumps `version`, so
+    readers can detect change cheaply; `wait_for_change` wakes immediately for
+    writes made through this instance and polls the version for writes made by
+    other processes.
+    """
+
+    def __init__(self, poll_interval: float = 0.5) -> None:
+        self.poll_interval = poll_interval
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._waiters: Dict[str, int] = {}  # task_id -> waits in progress on its event
+
+    @abstractmethod
+    async def create(self, task_id: str, status: str, message: str, destinations: List[dict]) -> None:
+        ...
+
+    @abstractmethod
+    async def update_destination(self, task_id: str, index: int, fields: Dict[str, Any]) -> None:
+        """Atomically merge `fields` into one destination's record."""
+
+    @abstractmethod
+    async def finish(self, task_id: str, status: str, message: str) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, task_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def version(self, task_id: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    async def evict_expired(self) -> int:
+        ...
+
+    async def wait_for_change(self, task_id: str, version: int, timeout: float) -> Optional[int]:
+        """
+        Wait up to `timeout` seconds for the task's version to move past `version`.
+
+        Returns the current version (unchanged on timeout), or None once the
+        task no longer exists.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            current = await self.version(task_id)
+            if current is None or current != version:
+                return current
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return current
+            event = self._changed.setdefault(task_id, asyncio.Event())
+            self._waiters[task_id] = self._waiters.get(task_id, 0) + 1
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, self.poll_interval))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._release(task_id, event)
+
+    def _release(self, task_id: str, event: asyncio.Event) -> None:
+        # The last waiter drops an event no write has consumed, so tasks that
+        # are never written again do not keep one alive
+        waiters = self._waiters.pop(task_id, 1) - 1
+        if waiters:
+            self._waiters[task_id] = waiters
+        elif self._changed.get(task_id) is event:
+            del self._changed[task_id]
+
+    def _notify(self, task_id: str) -> None:
+        event = self._changed.pop(task_id, None)
+        if event is not None:
+            event.set()
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    TaskStore on a local SQLite file in WAL mode.
+
+    Every uvicorn worker opens the same file, so a task started by one worker
+    can be polled on any other. Each destination is its own row and is updated
+    in a single IMMEDIATE transaction, so concurrent destinations never
+    overwrite each other. Finished tasks are evicted `finished_ttl` seconds
+    after they finish; tasks that never finish (e.g. the worker died) are
+    evicted `unfinished_ttl` seconds after their last update.
+    """
+
+    _SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            message TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            finished_at REAL,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS task_destinations (
+            task_id TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (task_id, idx)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS tasks_finished_at ON tasks (finished_at)",
+    )
+
+    def __init__(
+        self, path: str, finished_ttl: float, unfinished_ttl: float, poll_interval: float = 0.5
+    ) -> None:
+        super().__init__(poll_interval)
+        self.path = path
+        self.finished_ttl = finished_ttl
+        self.unfinished_ttl = unfinished_ttl
+        self._local = threading.local()
+        self._threadpool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="task-store"
+        )
+        self._last_eviction = 0.0
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        """Threads running the SQLite work, e.g. for queue depth metrics."""
+        return self._threadpool
+
+    # --- async API ---
+
+    async def create(self, task_id: str, status: str, message: str, destinations: List[dict]) -> None:
+        await self._run(self._create, task_id, status, message, destinations)
+        if time.time() - self._last_eviction > 60:
+            await self.evict_expired()
+
+    async def update_destination(self, task_id: str, index: int, fields: Dict[str, Any]) -> None:
+        await self._run(self._update_destination, task_id, index, fields)
+        self._notify(task_id)
+
+    async def finish(self, task_id: str, status: str, message: str) -> None:
+        await self._run(self._finish, task_id, status, message)
+        self._notify(task_id)
+
+    async def get(self, task_id: str) -> Optional[dict]:
+        return await self._run(self._get, task_id)
+
+    async def version(self, task_id: str) -> Optional[int]:
+        return await self._run(self._version, task_id)
+
+    async def evict_expired(self) -> int:
+        self._last_eviction = time.time()
+        evicted = await self._run(self._evict_expired)
+        if evicted:
+            logger.info(f"Evicted {evicted} expired tasks")
+        return evicted
+
+    async def _run(self, fn, *args):
+        return await forcefully_async(fn, *args, threadpool=self._threadpool)
+
+    # --- blocking implementation (runs on the task store threads) ---
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in self._SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    def _create(self, task_id: str, status: str, message: str, destinations: List[dict]) -> None:
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO tasks (task_id, status, message, created_at, updated_at, version) "
+                "VALUES (?, ?, ?, ?, ?, 1)",
+                (task_id, status, message, now, now),
+            )
+            conn.executemany(
+                "INSERT INTO task_destinations (task_id, idx, data) VALUES (?, ?, ?)",
+                [(task_id, i, json.dumps(dest)) for i, dest in enumerate(destinations)],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _update_destination(self, task_id: str, index: int, fields: Dict[str, Any]) -> None:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT data FROM task_destinations WHERE task_id = ? AND idx = ?",
+                (task_id, index),
+            ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return
+            data = json.loads(row[0])
+            data.update(fields)
+            conn.execute(
+                "UPDATE task_destinations SET data = ? WHERE task_id = ? AND idx = ?",
+                (json.dumps(data), task_id, index),
+            )
+            conn.execute(
+                "UPDATE tasks SET updated_at = ?, version = version + 1 WHERE task_id = ?",
+                (time.time(), task_id),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _finish(self, task_id: str, status: str, message: str) -> None:
+        now = time.time()
+        self._connection().execute(
+            "UPDATE tasks SET status = ?, message = ?, updated_at = ?, finished_at = ?, "
+            "version = version + 1 WHERE task_id = ?",
+            (status, message, now, now, task_id),
+        )
+
+    def _get(self, task_id: str) -> Optional[dict]:
+        conn = self._connection()
+        # One read transaction so the task row and its destinations are consistent
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute(
+                "SELECT task_id, status, message, created_at, updated_at, version "
+                "FROM tasks WHERE task_id = ?",
+                (task_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            destinations = conn.execute(
+                "SELECT data FROM task_destinations WHERE task_id = ? ORDER BY idx",
+                (task_id,),
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return {
+            "task_id": row[0],
+            "status": row[1],
+            "message": row[2],
+            "created_at": row[3],
+            "updated_at": row[4],
+            "version": row[5],
+            "destinations": [json.loads(d[0]) for d in destinations],
+        }
+
+    def _version(self, task_id: str) -> Optional[int]:
+        row = self._connection().execute(
+            "SELECT version FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _evict_expired(self) -> int:
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = [
+                (task_id,)
+                for (task_id,) in conn.execute(
+                    "SELECT task_id FROM tasks WHERE (finished_at IS NOT NULL AND finished_at < ?) "
+                    "OR (finished_at IS NULL AND updated_at < ?)",
+                    (now - self.finished_ttl, now - self.unfinished_ttl),
+                )
+            ]
+            conn.executemany("DELETE FROM task_destinations WHERE task_id = ?", expired)
+            conn.executemany("DELETE FROM tasks WHERE task_id = ?", expired)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(expired)
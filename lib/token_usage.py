@@ -0,0 +1,148 @@
+import contextvars
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+
+USAGE_FIELDS = ("calls", "prompt_tokens", "output_tokens", "thinking_tokens", "total_tokens")
+
+
+class TokenUsageTracker:
+    """
+    Token usage per (endpoint, provider, model), aggregated over a sliding window.
+
+    Usage is added to fixed-width time buckets (`bucket_seconds`) and buckets
+    older than `max_window_seconds` are dropped, so memory stays bounded no
+    matter the traffic and any window up to that size can be summarized.
+    """
+
+    def __init__(self, bucket_seconds: int = 60, max_window_seconds: int = 24 * 60 * 60) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.max_window_seconds = max_window_seconds
+        self._buckets: Deque[Tuple[float, Dict[Tuple[str, str, str], List[int]]]] = deque()
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        endpoint: str,
+        provider: str,
+        model: str,
+        prompt_tokens: int = 0,
+        output_tokens: int = 0,
+        thinking_tokens: int = 0,
+        total_tokens: Optional[int] = None,
+    ) -> None:
+        if total_tokens is None:
+            total_tokens = prompt_tokens + output_tokens + thinking_tokens
+        now = time.time()
+        start = now - now % self.bucket_seconds
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] != start:
+                self._buckets.append((start, defaultdict(lambda: [0] * len(USAGE_FIELDS))))
+            self._prune(now)
+            counts = self._buckets[-1][1][(endpoint, provider, model)]
+            for i, value in enumerate((1, prompt_tokens, output_tokens, thinking_tokens, total_tokens)):
+                counts[i] += value or 0
+
+    def summary(self, window_seconds: Optional[int] = None) -> Dict[str, Any]:
+        """Totals, per endpoint and per model over the last `window_seconds`."""
+        window = min(window_seconds or self.max_window_seconds, self.max_window_seconds)
+        since = time.time() - window
+        totals = [0] * len(USAGE_FIELDS)
+        by_endpoint: Dict[str, List[int]] = defaultdict(lambda: [0] * len(USAGE_FIELDS))
+        by_model: Dict[str, List[int]] = defaultdict(lambda: [0] * len(USAGE_FIELDS))
+        with self._lock:
+            buckets = [(start, dict(counts)) for start, counts in self._buckets]
+        for start, counts in buckets:
+            if start + self.bucket_seconds <= since:
+                continue
+            for (endpoint, provider, model), values in counts.items():
+                for target in (totals, by_endpoint[endpoint], by_model[f"{provider}/{model}"]):
+                    for i, value in enumerate(values):
+                        target[i] += value
+
+        def as_dict(values: List[int]) -> Dict[str, int]:
+            return dict(zip(USAGE_FIELDS, values))
+
+        return {
+            "window_seconds": window,
+            "totals": as_dict(totals),
+            "by_endpoint": {name: as_dict(v) for name, v in sorted(by_endpoint.items())},
+            "by_model": {name: as_dict(v) for name, v in sorted(by_model.items())},
+        }
+
+    def _prune(self, now: float) -> None:
+        while self._buckets and self._buckets[0][0] < now - self.max_window_seconds - self.bucket_seconds:
+            self._buckets.popleft()
+
+
+class TokenBudgetExceeded(Exception):
+    """Raised before a model call that would take a request past its token budget."""
+
+    def __init__(self, limit: int, spent: int, requested: int) -> None:
+        super().__init__(
+            f"Token budget exceeded: {spent}/{limit} tokens used, next call needs about {requested}"
+        )
+        self.limit = limit
+        self.spent = spent
+        self.requested = requested
+
+
+class TokenBudget:
+    """
+    Tokens one request may spend across all of its model calls.
+
+    mode "reject" refuses calls that do not fit; mode "downgrade" first tries
+    a cheaper model and a smaller max_output_tokens before refusing.
+    """
+
+    REJECT = "reject"
+    DOWNGRADE = "downgrade"
+
+    def __init__(self, limit: int, mode: str = REJECT) -> None:
+        if mode not in (self.REJECT, self.DOWNGRADE):
+            raise ValueError(f"Unknown token budget mode: {mode}")
+        self.limit = limit
+        self.mode = mode
+        self.spent = 0
+
+    @property
+    def remaining(self) -> int:
+        return max(self.limit - self.spent, 0)
+
+    def charge(self, tokens: Optional[int]) -> None:
+        self.spent += tokens or 0
+
+
+_current_budget: contextvars.ContextVar[Optional[TokenBudget]] = contextvars.ContextVar(
+    "token_budget", default=None
+)
+
+
+def current_token_budget() -> Optional[TokenBudget]:
+    return _current_budget.get()
+
+
+def budget_scope() -> Optional[int]:
+    """
+    Part of the key for single-flight work that calls models.
+
+    Shared work runs in the context of the caller that started it, so its
+    calls are checked against and charged to that caller's budget. Only
+    callers holding that same budget (the same request) may join it;
+    unbudgeted callers share with each other.
+    """
+    budget = _current_budget.get()
+    return None if budget is None else id(budget)
+
+
+@contextmanager
+def token_budget(budget: Optional[TokenBudget]) -> Iterator[Optional[TokenBudget]]:
+    """Make `budget` the budget for model calls made in this context (and tasks it spawns)."""
+    reset_token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(reset_token)
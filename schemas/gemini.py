@@ -0,0 +1,134 @@
+import hashlib
+import json
+import types
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Type, Union, get_args, get_origin
+
+from google.genai import types as genai_types
+from pydantic import BaseModel
+
+from schemas.models import (
+    DestinationAccommodations,
+    DestinationActivities,
+    DestinationFood,
+    ItineraryDaysResponse,
+    ItineraryPlacesResponse,
+    ItineraryResponse,
+    ItinerarySkeleton,
+)
+
+
+# Filled in by the server after generation; the model is never asked for them
+SERVER_FIELDS = frozenset({"image_urls", "images", "image_slot", "image_job_id"})
+
+_SCALAR_TYPES = {
+    str: genai_types.Type.STRING,
+    int: genai_types.Type.INTEGER,
+    float: genai_types.Type.NUMBER,
+    bool: genai_types.Type.BOOLEAN,
+}
+
+
+def _unwrap_optional(annotation: Any) -> Tuple[Any, bool]:
+    if get_origin(annotation) in (Union, types.UnionType):
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0], True
+    return annotation, False
+
+
+def _schema_for(annotation: Any, exclude: FrozenSet[str]) -> genai_types.Schema:
+    if annotation in _SCALAR_TYPES:
+        return genai_types.Schema(type=_SCALAR_TYPES[annotation])
+    if get_origin(annotation) in (list, List):
+        (item,) = get_args(annotation)
+        return genai_types.Schema(type=genai_types.Type.ARRAY, items=_schema_for(item, exclude))
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return schema_from_model(annotation, exclude)
+    raise TypeError(f"No Gemini schema mapping for {annotation!r}")
+
+
+def schema_from_model(model: Type[BaseModel], exclude: FrozenSet[str] = SERVER_FIELDS) -> genai_types.Schema:
+    """
+    Gemini response schema for a Pydantic model.
+
+    Fields in `exclude` are dropped at every level, fields without a default
+    are required (Optional ones may be null), and properties keep declaration
+    order (property_ordering), so e.g. trip metadata streams before days and
+    tips come last.
+    """
+    properties: Dict[str, genai_types.Schema] = {}
+    required: List[str] = []
+    for name, field in model.model_fields.items():
+        if name in exclude:
+            continue
+        annotation, optional = _unwrap_optional(field.annotation)
+        prop = _schema_for(annotation, exclude)
+        if field.description:
+            prop.description = field.description
+        if optional:
+            prop.nullable = True
+        properties[name] = prop
+        if field.is_required():
+            required.append(name)
+    return genai_types.Schema(
+        type=genai_types.Type.OBJECT,
+        properties=properties,
+        required=required,
+        property_ordering=list(properties),
+    )
+
+
+def schema_hash(schema: genai_types.Schema) -> str:
+    encoded = json.dumps(schema.model_dump(mode="json", exclude_none=True), sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class GeminiSchema:
+    name: str
+    model: Type[BaseModel]
+    schema: genai_types.Schema
+    hash: str
+
+
+class SchemaRegistry:
+    """Gemini response schemas built once from their Pydantic models, each with a stable hash."""
+
+    def __init__(self) -> None:
+        self._by_name: Dict[str, GeminiSchema] = {}
+        self._hash_by_id: Dict[int, str] = {}
+
+    def register(
+        self, name: str, model: Type[BaseModel], exclude: FrozenSet[str] = SERVER_FIELDS
+    ) -> GeminiSchema:
+        if name in self._by_name:
+            raise ValueError(f"Schema {name} is already registered")
+        schema = schema_from_model(model, exclude)
+        entry = GeminiSchema(name=name, model=model, schema=schema, hash=schema_hash(schema))
+        self._by_name[name] = entry
+        self._hash_by_id[id(schema)] = entry.hash
+        return entry
+
+    def get(self, name: str) -> GeminiSchema:
+        return self._by_name[name]
+
+    def hash_of(self, schema: Optional[genai_types.Schema]) -> Optional[str]:
+        """Registered schemas hash by lookup; anything else is hashed on the spot."""
+        if schema is None:
+            return None
+        return self._hash_by_id.get(id(schema)) or schema_hash(schema)
+
+
+schema_registry = SchemaRegistry()
+
+ITINERARY_SCHEMA = schema_registry.register("itinerary", ItineraryResponse)
+PLACES_SCHEMA = schema_registry.register("places", ItineraryPlacesResponse)
+ITINERARY_SKELETON_SCHEMA = schema_registry.register("itinerary_skeleton", ItinerarySkeleton)
+ITINERARY_DAYS_SCHEMA = schema_registry.register("itinerary_days", ItineraryDaysResponse)
+# Legacy destination batch, keyed by the list each prompt asks for
+DESTINATION_LIST_SCHEMAS = {
+    "activities": schema_registry.register("destination_activities", DestinationActivities),
+    "food": schema_registry.register("destination_food", DestinationFood),
+    "accommodations": schema_registry.register("destination_accommodations", DestinationAccommodations),
+}
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 
 
@@ -14,12 +14,26 @@ class ItineraryPlace(BaseModel):
     description: str
 
 
+class ImageVariant(BaseModel):
+    url: str
+    format: str  # webp, avif
+    width: int
+    height: int
+
+
+class GeneratedImage(BaseModel):
+    url: str  # original as generated
+    variants: List[ImageVariant] = Field(default_factory=list)
+
+
 class ItineraryEntity(BaseModel):
     name: str
     speciality: str
     places_to_visit: List[ItineraryPlace]
     photo_prompts: List[str] = Field(default_factory=list)
     image_urls: List[str] = Field(default_factory=list)
+    images: List[GeneratedImage] = Field(default_factory=list)
+    image_slot: Optional[str] = None  # filled in by the image job named on the response
 
 
 class ItineraryDay(BaseModel):
@@ -35,6 +49,23 @@ class ItineraryResponse(BaseModel):
     num_days: int
     days: List[ItineraryDay]
     overall_tips: List[str] = Field(default_factory=list)
+    image_job_id: Optional[str] = None
+
+
+# Long itineraries: a skeleton call first, then groups of days generated concurrently
+class SkeletonDay(BaseModel):
+    day: int
+    theme: str
+    areas: List[str]
+
+
+class ItinerarySkeleton(BaseModel):
+    days: List[SkeletonDay]
+    overall_tips: List[str] = Field(default_factory=list)
+
+
+class ItineraryDaysResponse(BaseModel):
+    days: List[ItineraryDay]
 
 
 class TravelOptionsRequest(BaseModel):
@@ -86,11 +117,39 @@ class ItineraryPlaceCard(BaseModel):
     tips: List[str] = Field(default_factory=list)
     photo_prompts: List[str] = Field(default_factory=list)
     image_urls: List[str] = Field(default_factory=list)
+    images: List[GeneratedImage] = Field(default_factory=list)
+    image_slot: Optional[str] = None
 
 
 class ItineraryPlacesResponse(BaseModel):
     destination_city: str
     places: List[ItineraryPlaceCard]
+    image_job_id: Optional[str] = None
+
+
+# Legacy destination batch (/places/process): one list per prompt in defs/prompts.py
+class DestinationActivities(BaseModel):
+    activities: List[str]
+
+
+class DestinationFood(BaseModel):
+    food: List[str]
+
+
+class DestinationAccommodations(BaseModel):
+    accommodations: List[str]
+
+
+# Background image generation
+class ImageJobStatus(BaseModel):
+    job_id: str
+    status: str  # pending, running, completed, failed
+    created_at: float
+    updated_at: float
+    total: int
+    completed: int
+    images: Dict[str, List[str]] = Field(default_factory=dict)  # slot -> static URLs
+    slot_images: Dict[str, List[GeneratedImage]] = Field(default_factory=dict)  # slot -> URLs with variants
 
 
 # Food outlets via Perplexity
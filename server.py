@@ -1,16 +1,47 @@
-from fastapi import FastAPI
-from endpoints import system, planner, accounts, places
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, ORJSONResponse
+from endpoints import system, planner, accounts, places, images
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 load_dotenv()
 from fastapi.staticfiles import StaticFiles
 import os
+from lib.async_ops import AsyncRequests
+from lib.token_usage import TokenBudgetExceeded
+from engine.usage import TokenBudgetMiddleware
 from lib.file_ops import static_dir, ensure_dir
+from settings import HTTP_CLIENT
+
+
+async def prewarm_connections() -> None:
+    results = await AsyncRequests.prewarm(HTTP_CLIENT["prewarm_urls"], timeout=HTTP_CLIENT["prewarm_timeout"])
+    for url, version in results.items():
+        print(f"SERVER_LOG: Pre-warmed {url}: {version}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pool_options = {k: v for k, v in HTTP_CLIENT.items() if not k.startswith("prewarm_")}
+    AsyncRequests.configure(**pool_options)
+    if HTTP_CLIENT["http2"] and not AsyncRequests.http2_available():
+        print("SERVER_LOG: HTTP/2 is enabled but h2 is not installed; outbound calls will use HTTP/1.1")
+    # In the background: startup and health checks never wait on an external host
+    prewarm = asyncio.create_task(prewarm_connections())
+    try:
+        yield
+    finally:
+        prewarm.cancel()
+        await AsyncRequests.close()
+
 
 app = FastAPI(
     title="Itinera AI",
     description="Advanced AI-driven itinerary generation engine",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Configure CORS
@@ -22,11 +53,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request token budget (X-Token-Budget header)
+app.add_middleware(TokenBudgetMiddleware)
+
+
+@app.exception_handler(TokenBudgetExceeded)
+async def token_budget_exceeded_handler(request: Request, exc: TokenBudgetExceeded):
+    return JSONResponse(status_code=429, content={"detail": str(exc)})
+
+
 # Include routers
 app.include_router(system.router, prefix="/api/v1/itinera/system")
 app.include_router(planner.router, prefix="/api/v1/itinera/planner")
 app.include_router(accounts.router, prefix="/api/v1/itinera/accounts")
 app.include_router(places.router, prefix="/api/v1/itinera/places")
+app.include_router(images.router, prefix="/api/v1/itinera/images")
 
 # Mount static directory for generated images
 ensure_dir(static_dir())
@@ -7,6 +7,8 @@ MODELS = {
     "gemini": {
         "text": "gemini-2.5-flash",
         "image": "gemini-2.5-flash-image",  # For image generation
+        "pro": "gemini-2.5-pro",  # Legacy destination batch (/places/process)
+        "skeleton": "gemini-2.5-flash-lite",  # Day outline for long itineraries
     },
     "perplexity": {
         "text": "sonar",
@@ -40,9 +42,235 @@ PERPLEXITY_SETTINGS = {
     "web_search_options": {"search_context_size": "high"},
 }
 
+# Outbound HTTP connection pools (lib/async_ops.AsyncRequests). Hosts listed
+# under "hosts" get a dedicated pool with these limit overrides.
+HTTP_CLIENT = {
+    "timeout": 30.0,
+    "connect_timeout": 10.0,
+    "http2": True,  # needs the h2 package; checked at startup
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 60.0,
+    "hosts": {
+        "api.perplexity.ai": {
+            "max_connections": 32,
+            "max_keepalive_connections": 16,
+            "keepalive_expiry": 120.0,
+        },
+    },
+    # Connections opened at startup so the first user request skips TLS setup
+    "prewarm_urls": ["https://api.perplexity.ai"],
+    "prewarm_timeout": 3.0,  # pre-warming runs in the background and gives up after this
+}
+
+# Token accounting from Gemini usage_metadata / Perplexity usage (engine/usage.py)
+TOKEN_USAGE = {
+    "bucket_seconds": 60,
+    "max_window_seconds": 24 * 60 * 60,
+    "default_window_seconds": 60 * 60,  # for GET /system/token-usage
+}
+
+# Optional per-request token budget, set with the X-Token-Budget header.
+# "reject" answers 429 before a call that would not fit; "downgrade" first
+# retries the call on a cheaper model with a smaller max_output_tokens.
+TOKEN_BUDGET = {
+    "header": "X-Token-Budget",
+    "mode_header": "X-Token-Budget-Mode",
+    "default_limit": None,  # tokens per request when no header is sent; None = unlimited
+    "default_mode": "reject",
+    "min_output_tokens": 512,  # never downgrade below this
+    "downgrades": {
+        "gemini-2.5-pro": "gemini-2.5-flash",
+        "sonar-pro": "sonar",
+    },
+}
+
+# Per-call output/thinking limits sized from the request (lib/output_budget.py).
+# A "unit" is a day for "itinerary" and a place card for "places". Once
+# min_samples responses have been seen, per-unit rates come from the observed
+# p95 tokens per unit times headroom. Thinking tokens count against
+# max_output_tokens, which is clamped to [min_output, max_output].
+OUTPUT_BUDGETS = {
+    "headroom": 1.3,
+    "history_size": 200,
+    "min_samples": 20,
+    "itinerary": {
+        "base_output": 1024,
+        "output_per_unit": 1800,
+        "base_thinking": 1024,
+        "thinking_per_unit": 256,
+        "max_thinking": 8192,
+        "min_output": 4096,
+        "max_output": 40960,
+    },
+    "itinerary_skeleton": {  # no thinking budget: left to the skeleton model's default
+        "base_output": 256,
+        "output_per_unit": 120,
+        "min_output": 1024,
+        "max_output": 8192,
+    },
+    "itinerary_days": {
+        "base_output": 256,
+        "output_per_unit": 1800,
+        "base_thinking": 512,
+        "thinking_per_unit": 256,
+        "max_thinking": 4096,
+        "min_output": 2048,
+        "max_output": 16384,
+    },
+    "places": {
+        "base_output": 512,
+        "output_per_unit": 350,
+        "base_thinking": 512,
+        "thinking_per_unit": 64,
+        "max_thinking": 4096,
+        "min_output": 2048,
+        "max_output": 16384,
+    },
+}
+
+# Long itineraries: one cheap skeleton call (day themes/areas), then one call
+# per group of days, all groups concurrently under the rate limiter. Shorter
+# trips, or a failed skeleton, use a single call.
+ITINERARY_PARALLEL = {
+    "enabled": True,
+    "min_days": 5,
+    "days_per_group": 2,
+}
+
+# Retries and circuit breaking for outbound HTTP (Perplexity), see lib/resilience.py
+HTTP_RESILIENCE = {
+    "max_attempts": 3,
+    "backoff_base_seconds": 0.5,  # full-jitter exponential backoff
+    "backoff_max_seconds": 8,
+    "retry_statuses": [429, 500, 502, 503, 504],
+    "breaker_failure_threshold": 5,  # consecutive failed requests (all attempts failed) before failing fast
+    "breaker_reset_seconds": 30,
+    "max_retry_after_seconds": 10,  # a longer Retry-After returns the response instead of waiting
+}
+
 # Image Generation Settings
 IMAGE_GENERATION = {
     "max_images_per_entity": 1,
+    "max_images_per_itinerary": 3,
     "image_quality": "standard",
     "image_size": "1024x1024",
 }
+
+# Batch destination processing (/places/process)
+PLACES_BATCH = {
+    "max_concurrent_destinations": 4,  # across all batches; each runs 3 calls at once
+}
+
+# Background batch tasks (see lib/task_store.py). The SQLite file is shared by
+# every worker process, so task status can be polled on any of them.
+TASK_STORE = {
+    "path": ".cache/tasks.sqlite3",  # relative to the project root
+    "finished_ttl_seconds": 24 * 60 * 60,
+    "unfinished_ttl_seconds": 6 * 60 * 60,  # tasks whose worker died mid-batch
+    # Waiters wake instantly on local writes and re-check the version this often
+    # to pick up writes made by other workers
+    "poll_interval_seconds": 0.5,
+    "max_wait_seconds": 60,  # cap for the long-poll ?wait= parameter
+}
+
+# Process-wide limits per Gemini model, enforced in engine/ai_core.py.
+# Any dimension can be disabled with None.
+GEMINI_RATE_LIMITS = {
+    "gemini-2.5-flash": {
+        "requests_per_minute": 1000,
+        "tokens_per_minute": 1_000_000,
+        "max_concurrency": 32,
+    },
+    "gemini-2.5-pro": {
+        "requests_per_minute": 150,
+        "tokens_per_minute": 2_000_000,
+        "max_concurrency": 16,
+    },
+    "gemini-2.5-flash-lite": {
+        "requests_per_minute": 4000,
+        "tokens_per_minute": 4_000_000,
+        "max_concurrency": 32,
+    },
+    "gemini-2.5-flash-image": {
+        "requests_per_minute": 10,
+        "tokens_per_minute": None,
+        "max_concurrency": 3,
+    },
+    "default": {
+        "requests_per_minute": 60,
+        "tokens_per_minute": 250_000,
+        "max_concurrency": 8,
+    },
+}
+
+# Content-addressed store for generated images, relative to the static dir
+IMAGE_STORE = {
+    "dir": "images",
+    "backend": "local",  # "local" or "local_s3" (S3-compatible bucket layout on disk)
+    "bucket": "itinera-images",  # used by "local_s3"
+}
+
+# Post-processing of generated images into compressed, responsive variants
+IMAGE_VARIANTS = {
+    "enabled": True,
+    "widths": [320, 640, 1024],  # plus the original width
+    "formats": ["webp"],  # add "avif" when Pillow is built with libavif
+    "quality": 80,
+    "workers": 2,  # ProcessPoolExecutor size
+}
+
+# Background image jobs (see engine/services/image_jobs.py)
+IMAGE_JOBS = {
+    "workers": 3,  # pacing comes from GEMINI_RATE_LIMITS for the image model
+    "max_jobs": 1000,
+    "job_ttl_seconds": 60 * 60,
+}
+
+# LLM response cache (in-memory LRU/TTL tier in front of a local SQLite tier)
+LLM_CACHE = {
+    "enabled": True,
+    "path": ".cache/llm_cache.sqlite3",  # relative to the project root
+    "memory_max_bytes": 32 * 1024 * 1024,
+    "disk_max_bytes": 512 * 1024 * 1024,
+    # Per-endpoint TTLs in seconds
+    "ttl_seconds": {
+        "default": 60 * 60,
+        "itinerary": 7 * 24 * 60 * 60,
+        "places": 7 * 24 * 60 * 60,
+        "travel_options": 30 * 60,
+        "food": 6 * 60 * 60,
+        "destinations": 24 * 60 * 60,
+    },
+}
+
+# Static system prompts uploaded once as Gemini cached contexts and referenced
+# by name. A context is refreshed when used within refresh_before_seconds of
+# expiry. Prompts under the provider's minimum cacheable size (min_tokens per
+# model) are always sent inline, as is everything while create/update fails.
+CONTEXT_CACHE = {
+    "enabled": True,
+    "ttl_seconds": 60 * 60,
+    "refresh_before_seconds": 5 * 60,
+    "retry_after_seconds": 5 * 60,
+    "min_tokens": {
+        "default": 1024,
+        "gemini-2.5-pro": 4096,
+    },
+}
+
+# Parsed Perplexity results (travel options, food), served stale-while-revalidate.
+# Freshness follows the request's recency_filter: the narrower the window the
+# user asked for, the sooner we re-search. "none" covers requests without one.
+SEARCH_RESULT_CACHE = {
+    "enabled": True,
+    "fresh_ttl_seconds": {
+        "hour": 5 * 60,
+        "day": 60 * 60,
+        "week": 6 * 60 * 60,
+        "month": 12 * 60 * 60,
+        "year": 24 * 60 * 60,
+        "none": 24 * 60 * 60,
+    },
+    "max_stale_seconds": 24 * 60 * 60,  # how long past freshness an answer may still be served
+}
@@ -0,0 +1,211 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors, types
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from engine import ai_core  # noqa: E402
+from lib.context_cache import ContextCache  # noqa: E402
+
+
+SYSTEM_PROMPT = "You are a travel planner. " * 10
+CONFIG = {
+    "ttl_seconds": 600,
+    "refresh_before_seconds": 60,
+    "retry_after_seconds": 100,
+    "min_tokens": {"default": 10},
+}
+
+
+class StubCaches:
+    """Local stand-in for client.aio.caches: async create/update, recorded."""
+
+    def __init__(self) -> None:
+        self.calls = []
+        self.fail_create = False
+        self.fail_update = False
+
+    async def create(self, model, config):
+        self.calls.append(("create", model, config.ttl))
+        await asyncio.sleep(0.01)  # lets concurrent callers pile up on the create
+        if self.fail_create:
+            raise RuntimeError("create failed")
+        return types.CachedContent(name=f"cachedContents/{len(self.calls)}", model=model)
+
+    async def update(self, name, config):
+        self.calls.append(("update", name, config.ttl))
+        if self.fail_update:
+            raise RuntimeError("update failed")
+        return types.CachedContent(name=name)
+
+
+class StubModels:
+    """Records the cached_content/system_instruction of each call; can reject cached contexts."""
+
+    def __init__(self) -> None:
+        self.configs = []
+        self.reject_cached = 0
+
+    def _check(self, config) -> None:
+        self.configs.append((config.cached_content, config.system_instruction is not None))
+        if config.cached_content and self.reject_cached:
+            self.reject_cached -= 1
+            raise errors.ClientError(404, {"error": {"message": "cached content not found"}})
+
+    async def generate_content(self, model, contents, config):
+        self._check(config)
+        return SimpleNamespace(text="ok", usage_metadata=None)
+
+    async def generate_content_stream(self, model, contents, config):
+        self._check(config)
+
+        async def chunks():
+            yield SimpleNamespace(text="o", usage_metadata=None)
+            yield SimpleNamespace(text="k", usage_metadata=None)
+
+        return chunks()
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def caches():
+    return StubCaches()
+
+
+@pytest.fixture
+def models(monkeypatch, caches, clock):
+    models = StubModels()
+    monkeypatch.setattr(ai_core, "context_cache", ContextCache(caches, CONFIG, clock=clock))
+    monkeypatch.setattr(ai_core, "async_client", SimpleNamespace(aio=SimpleNamespace(models=models)))
+    return models
+
+
+def generate(system_prompt: str = SYSTEM_PROMPT):
+    return ai_core.async_gemini_generate_content(system_prompt=system_prompt, use_cache=False)
+
+
+async def stream(system_prompt: str = SYSTEM_PROMPT) -> str:
+    chunks = ai_core.async_gemini_generate_content_stream(system_prompt=system_prompt, use_cache=False)
+    return "".join([chunk async for chunk in chunks])
+
+
+def test_concurrent_calls_share_one_create(caches, clock):
+    cache = ContextCache(caches, CONFIG, clock=clock)
+
+    async def run():
+        return await asyncio.gather(*[cache.name_for("gemini-2.5-flash", SYSTEM_PROMPT) for _ in range(5)])
+
+    names = asyncio.run(run())
+
+    assert names == ["cachedContents/1"] * 5
+    assert caches.calls == [("create", "gemini-2.5-flash", "600s")]
+
+
+def test_refreshes_only_near_expiry(caches, clock):
+    cache = ContextCache(caches, CONFIG, clock=clock)
+
+    async def run():
+        await cache.name_for("gemini-2.5-flash", SYSTEM_PROMPT)
+        clock.now += 500  # 100s left, outside the 60s refresh window
+        await cache.name_for("gemini-2.5-flash", SYSTEM_PROMPT)
+        clock.now += 50  # 50s left
+        return await cache.name_for("gemini-2.5-flash", SYSTEM_PROMPT)
+
+    assert asyncio.run(run()) == "cachedContents/1"
+    assert [call[0] for call in caches.calls] == ["create", "update"]
+    assert cache.snapshot()["contexts"][0]["expires_in_seconds"] == 600
+
+
+def test_failed_update_recreates(caches, clock):
+    cache = ContextCache(caches, CONFIG, clock=clock)
+    caches.fail_update = True
+
+    async def run():
+        await cache.name_for("gemini-2.5-flash", SYSTEM_PROMPT)
+        clock.now += 580
+        return await cache.name_for("gemini-2.5-flash", SYSTEM_PROMPT)
+
+    assert asyncio.run(run()) == "cachedContents/3"
+    assert [call[0] for call in caches.calls] == ["create", "update", "create"]
+
+
+def test_failed_create_backs_off(caches, clock):
+    cache = ContextCache(caches, CONFIG, clock=clock)
+    caches.fail_create = True
+
+    async def run():
+        first = await cache.name_for("gemini-2.5-flash", SYSTEM_PROMPT)
+        clock.now += 50
+        during_backoff = await cache.name_for("gemini-2.5-flash", SYSTEM_PROMPT)
+        clock.now += 60
+        caches.fail_create = False
+        after_backoff = await cache.name_for("gemini-2.5-flash", SYSTEM_PROMPT)
+        return first, during_backoff, after_backoff
+
+    assert asyncio.run(run()) == (None, None, "cachedContents/2")
+    assert [call[0] for call in caches.calls] == ["create", "create"]
+
+
+def test_small_prompts_are_never_uploaded(caches, clock):
+    cache = ContextCache(caches, {**CONFIG, "min_tokens": {"default": 1024}}, clock=clock)
+
+    assert asyncio.run(cache.name_for("gemini-2.5-flash", SYSTEM_PROMPT)) is None
+    assert caches.calls == []
+
+
+def test_generate_references_cached_context(models, caches):
+    assert asyncio.run(generate()) == "ok"
+    assert models.configs == [("cachedContents/1", False)]
+
+
+def test_generate_sends_small_prompt_inline(models, caches):
+    assert asyncio.run(generate("short")) == "ok"
+    assert models.configs == [(None, True)]
+    assert caches.calls == []
+
+
+def test_rejected_context_falls_back_inline(models, caches):
+    models.reject_cached = 1
+
+    async def run():
+        first = await generate()
+        second = await generate()
+        return first, second
+
+    assert asyncio.run(run()) == ("ok", "ok")
+    # Rejected with 404, retried inline; the next call uploads the prompt again
+    assert models.configs == [("cachedContents/1", False), (None, True), ("cachedContents/2", False)]
+
+
+def test_failed_create_sends_inline(models, caches):
+    caches.fail_create = True
+
+    assert asyncio.run(generate()) == "ok"
+    assert models.configs == [(None, True)]
+
+
+def test_stream_passes_cached_content(models, caches):
+    assert asyncio.run(stream()) == "ok"
+    assert models.configs == [("cachedContents/1", False)]
+
+
+def test_stream_rejected_context_falls_back_inline(models, caches):
+    models.reject_cached = 1
+
+    assert asyncio.run(stream()) == "ok"
+    assert models.configs == [("cachedContents/1", False), (None, True)]
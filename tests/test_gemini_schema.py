@@ -0,0 +1,24 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from schemas.gemini import schema_from_model
+from schemas.models import ItineraryResponse
+
+
+class Sample(BaseModel):
+    name: str
+    note: Optional[str]
+    rating: Optional[float] = None
+    tags: List[str] = Field(default_factory=list)
+
+
+def test_only_fields_without_defaults_are_required():
+    schema = schema_from_model(Sample)
+
+    assert schema.required == ["name", "note"]
+    assert [name for name, prop in schema.properties.items() if prop.nullable] == ["note", "rating"]
+
+
+def test_defaulted_tips_are_optional():
+    assert "overall_tips" not in schema_from_model(ItineraryResponse).required
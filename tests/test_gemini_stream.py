@@ -0,0 +1,81 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from engine import ai_core  # noqa: E402
+from lib.rate_limit import ModelRateLimiter  # noqa: E402
+
+
+class StubModels:
+    """Streams `parts` with a short pause between them; records whether each stream ran to the end."""
+
+    def __init__(self, parts) -> None:
+        self.parts = parts
+        self.finished = []
+
+    async def generate_content_stream(self, model, contents, config):
+        async def chunks():
+            for part in self.parts:
+                await asyncio.sleep(0.01)
+                yield SimpleNamespace(text=part, usage_metadata=None)
+            self.finished.append(True)
+
+        return chunks()
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = ModelRateLimiter({"default": {"max_concurrency": 1}})
+    monkeypatch.setattr(ai_core, "rate_limiter", limiter)
+    return limiter
+
+
+def use_models(monkeypatch, models: StubModels) -> None:
+    monkeypatch.setattr(ai_core, "async_client", SimpleNamespace(aio=SimpleNamespace(models=models)))
+
+
+def stream():
+    return ai_core.async_gemini_generate_content_stream(system_prompt="short", use_cache=False)
+
+
+def free_slots(limiter: ModelRateLimiter) -> int:
+    return limiter.snapshot()[ai_core.MODELS["gemini"]["text"]]["free_slots"]
+
+
+def test_slow_reader_does_not_hold_the_slot(monkeypatch, limiter):
+    models = StubModels(["a", "b", "c"])
+    use_models(monkeypatch, models)
+
+    async def run():
+        chunks = stream()
+        first = await chunks.__anext__()
+        # The reader stalls; the upstream stream still completes and frees its slot
+        await asyncio.sleep(0.1)
+        slots_while_stalled = free_slots(limiter)
+        rest = [chunk async for chunk in chunks]
+        return [first] + rest, slots_while_stalled
+
+    text, slots_while_stalled = asyncio.run(run())
+
+    assert text == ["a", "b", "c"]
+    assert slots_while_stalled == 1
+    assert models.finished == [True]
+
+
+def test_closed_reader_stops_the_upstream_stream(monkeypatch, limiter):
+    models = StubModels(["a"] + ["b"] * 20)
+    use_models(monkeypatch, models)
+
+    async def run():
+        chunks = stream()
+        await chunks.__anext__()
+        await chunks.aclose()
+        await asyncio.sleep(0.05)
+        return free_slots(limiter)
+
+    assert asyncio.run(run()) == 1
+    assert models.finished == []
@@ -0,0 +1,87 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+os.environ.setdefault("PERPLEXITY_API_KEY", "test-key")
+
+from engine import search_core  # noqa: E402
+from lib.cache import StaleWhileRevalidateCache, TwoTierCache, Uncached  # noqa: E402
+from lib.token_usage import TokenBudget, token_budget  # noqa: E402
+
+
+def reply(model: str) -> httpx.Response:
+    request = httpx.Request("POST", "https://api.perplexity.ai/chat/completions")
+    return httpx.Response(200, request=request, json={"choices": [{"message": {"content": model}}]})
+
+
+class StubHTTP:
+    """Stands in for perplexity_http; answers with the model it was asked for."""
+
+    def __init__(self) -> None:
+        self.bodies = []
+
+    async def request(self, method, url, headers, json):
+        self.bodies.append(json)
+        return reply(json["model"])
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = TwoTierCache(path=None, memory_max_bytes=1 << 20, disk_max_bytes=0)
+    monkeypatch.setattr(search_core, "llm_cache", cache)
+    monkeypatch.setattr(search_core, "cache_enabled", lambda: True)
+    return cache
+
+
+@pytest.fixture
+def http(monkeypatch):
+    http = StubHTTP()
+    monkeypatch.setattr(search_core, "perplexity_http", http)
+    return http
+
+
+def search(budget=None):
+    async def run():
+        with token_budget(budget):
+            return await search_core.PerplexityService().chat_completion(
+                system_prompt="system", user_prompt="user", model="sonar-pro", max_tokens=1200
+            )
+
+    return asyncio.run(run())
+
+
+def test_downgraded_reply_is_not_cached(cache, http):
+    downgraded = search(TokenBudget(1000, mode=TokenBudget.DOWNGRADE))
+    full = search()
+
+    assert downgraded["budget_downgraded"] is True
+    assert "budget_downgraded" not in full
+    # The unbudgeted caller was not served the cheaper model's answer
+    assert [body["model"] for body in http.bodies] == ["sonar", "sonar-pro"]
+
+
+def test_full_reply_is_cached(cache, http):
+    search()
+    again = search(TokenBudget(1000, mode=TokenBudget.DOWNGRADE))
+
+    assert again["choices"][0]["message"]["content"] == "sonar-pro"
+    assert len(http.bodies) == 1
+
+
+def test_uncached_value_is_returned_but_not_stored():
+    swr = StaleWhileRevalidateCache(TwoTierCache(path=None, memory_max_bytes=1 << 20, disk_max_bytes=0))
+    computed = []
+
+    async def compute():
+        computed.append(True)
+        return Uncached({"partial": True})
+
+    async def run():
+        first = await swr.get_or_compute("key", compute, fresh_ttl=60, max_stale=60)
+        second = await swr.get_or_compute("key", compute, fresh_ttl=60, max_stale=60)
+        return first, second
+
+    assert asyncio.run(run()) == ({"partial": True}, {"partial": True})
+    assert len(computed) == 2
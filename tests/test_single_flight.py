@@ -0,0 +1,57 @@
+import asyncio
+
+from lib.async_ops import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def run():
+        return await asyncio.gather(*[flight.do("k", work) for _ in range(3)])
+
+    assert asyncio.run(run()) == ["done"] * 3
+    assert calls == [1]
+    assert flight.in_flight() == 0
+
+
+def test_work_survives_while_a_caller_remains():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        leaving = asyncio.ensure_future(flight.do("k", work))
+        staying = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        return await staying
+
+    assert asyncio.run(run()) == "done"
+
+
+def test_work_is_cancelled_when_every_caller_leaves():
+    flight = SingleFlight()
+    finished = []
+
+    async def work():
+        await asyncio.sleep(0.05)
+        finished.append(True)
+
+    async def run():
+        callers = [asyncio.ensure_future(flight.do("k", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.sleep(0.1)
+        return flight.in_flight()
+
+    assert asyncio.run(run()) == 0
+    assert finished == []
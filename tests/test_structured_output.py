@@ -0,0 +1,146 @@
+from typing import List
+
+import pytest
+from pydantic import BaseModel
+
+from lib.structured_output import parse_structured, recover_json
+
+
+DAYS = '{"trip": "Rome", "days": [{"day": 1, "stops": ["Forum", "Colosseum"]}, {"day": 2, "stops": ["Vatican", "Trevi"]}]}'
+
+
+class Day(BaseModel):
+    day: int
+    stops: List[str]
+
+
+class Trip(BaseModel):
+    trip: str
+    days: List[Day]
+
+
+@pytest.mark.parametrize(
+    "cut_after, expected",
+    [
+        # Cut inside the top-level object: only complete members survive
+        ('{"trip": "Ro', None),
+        ('{"trip": "Rome", "days": [', {"trip": "Rome"}),
+        # Inside a day, on a number that may be cut off: the complete first day
+        (
+            '{"trip": "Rome", "days": [{"day": 1, "stops": ["Forum", "Colosseum"]}, {"day": 2',
+            {"trip": "Rome", "days": [{"day": 1, "stops": ["Forum", "Colosseum"]}]},
+        ),
+        # Inside a day's stops
+        (
+            '{"trip": "Rome", "days": [{"day": 1, "stops": ["Forum", "Colo',
+            {"trip": "Rome", "days": [{"day": 1, "stops": ["Forum"]}]},
+        ),
+    ],
+)
+def test_truncation_keeps_complete_elements(cut_after, expected):
+    parsed = recover_json(cut_after)
+
+    if expected is None:
+        assert parsed is None
+    else:
+        assert parsed.value == expected
+        assert parsed.truncated
+
+
+@pytest.mark.parametrize(
+    "max_depth, days",
+    [
+        (None, [{"day": 1, "stops": ["Forum", "Colosseum"]}, {"day": 2, "stops": ["Vatican"]}]),
+        (2, [{"day": 1, "stops": ["Forum", "Colosseum"]}]),
+        (1, None),
+    ],
+)
+def test_max_depth_limits_the_cut(max_depth, days):
+    text = DAYS[: DAYS.index('"Trevi"')]
+
+    parsed = recover_json(text, max_depth=max_depth)
+
+    if days is None:
+        # No complete member of the top-level object: the cut would land inside "days"
+        assert parsed.value == {"trip": "Rome"}
+    else:
+        assert parsed.value == {"trip": "Rome", "days": days}
+
+
+def test_complete_value_is_not_truncated():
+    parsed = recover_json(DAYS)
+
+    assert parsed.value["days"][1]["stops"] == ["Vatican", "Trevi"]
+    assert not parsed.truncated
+
+
+def test_cut_off_number_is_dropped():
+    assert recover_json('{"a": 1, "b": 12').value == {"a": 1}
+
+
+def test_escaped_quotes_stay_inside_strings():
+    parsed = recover_json(r'{"tip": "say \"ciao\"", "note": "a \\ b", "cut": "half \"wa')
+
+    assert parsed.value == {"tip": 'say "ciao"', "note": "a \\ b"}
+
+
+def test_string_cut_after_backslash():
+    assert recover_json('{"a": "x", "b": "y\\').value == {"a": "x"}
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("[1, 2,]", [1, 2]),
+        ('{"a": [1, 2,], "b": {"c": 3,},}', {"a": [1, 2], "b": {"c": 3}}),
+    ],
+)
+def test_trailing_commas_are_dropped(text, expected):
+    parsed = recover_json(text)
+
+    assert parsed.value == expected
+    assert not parsed.truncated
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("[1 2]", [1]),
+        ('["a" "b"]', ["a"]),
+        ('{"a": 1 "b": 2}', {"a": 1}),
+        ('[{"a": 1} {"b": 2}]', [{"a": 1}]),
+        ('{"a": "b" : 3}', {"a": "b"}),
+        ("[1,, 2]", [1]),
+        ('{"a": 1, [2]}', {"a": 1}),
+    ],
+)
+def test_missing_separator_cuts_back(text, expected):
+    parsed = recover_json(text)
+
+    assert parsed.value == expected
+    assert parsed.truncated
+
+
+@pytest.mark.parametrize("text", ['{"a"}', '{"a": }', '{1: 2}', '{[1]: 2}'])
+def test_malformed_object_without_complete_member(text):
+    assert recover_json(text) is None
+
+
+def test_fences_and_prose_are_ignored():
+    parsed = recover_json('Here you go:\n```json\n{"a": [1]}\n```\nEnjoy {"b": 2}')
+
+    assert parsed.value == {"a": [1]}
+    assert not parsed.truncated
+
+
+def test_parse_structured_recovers_only_when_asked():
+    text = DAYS[: DAYS.index(', {"day": 2')]
+
+    assert parse_structured(text) is None
+    parsed = parse_structured(text, response_model=Trip, recover=True)
+    assert parsed.value == {"trip": "Rome", "days": [{"day": 1, "stops": ["Forum", "Colosseum"]}]}
+    assert parsed.truncated
+
+
+def test_parse_structured_rejects_recovered_value_that_fails_validation():
+    assert parse_structured('{"trip": "Rome", "days": [{"day": 1', response_model=Trip, recover=True) is None